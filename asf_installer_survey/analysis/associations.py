@@ -0,0 +1,362 @@
+"""Pairwise association between every pair of single select questions.
+
+Every question is integer coded once and expanded into indicator columns, so
+the crosstabs of all pairs of questions are blocks of a single sparse product
+XᵀX. Each pair's association is then computed from its crosstab alone:
+
+- Cramér's V for pairs involving a nominal question.
+- For pairs of ordinal (e.g. Likert) questions, Spearman's rank correlation
+  (from midranks of the crosstab's margins), or optionally the polychoric
+  correlation (the correlation of bivariate normal variables thresholded into
+  the observed categories, fit by maximum likelihood).
+
+Ordinal questions are those given an explicit scale (its answers in order,
+e.g. for the items of a grid) and ordered categoricals. Ranks only mean
+something in scale order, so a question's categories are never assumed to be
+one: answers off the scale (e.g. "Don't know", or any answer not in a given
+scale) are treated as missing. Associations are computed over respondents
+answering both questions, and left missing for pairs with too few.
+
+Pairs are split into chunks computed in a pool of processes, and results are
+cached by a fingerprint of the data.
+"""
+import functools
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy
+import pandas
+from scipy import optimize, sparse, stats
+
+from asf_installer_survey.analysis.independence import chi2_statistic
+from asf_installer_survey.utils.cache import (
+    dataset_fingerprint,
+    hash_key,
+    load_cached,
+    save_cached,
+)
+from asf_installer_survey.utils.encoding import category_codes
+from asf_installer_survey.utils.instrumentation import instrumented
+from asf_installer_survey.utils.parallel import process_map
+from asf_installer_survey.utils.questions import (
+    all_answer_columns,
+    column_kind,
+    SINGLE_SELECT,
+)
+
+CRAMERS_V = "cramers_v"
+SPEARMAN = "spearman"
+POLYCHORIC = "polychoric"
+
+MIN_RESPONDENTS = 30
+CHUNK_SIZE = 500
+
+# Answers outside an ordinal scale.
+OFF_SCALE = re.compile(
+    r"^(don.t know|not applicable|n/a|prefer not|other\b)", re.IGNORECASE
+)
+
+# Bump to invalidate cached results after changing how they're computed.
+_ASSOCIATIONS_VERSION = 2
+
+# Stands in for infinite thresholds in bivariate normal probabilities.
+_BOUND = 8.0
+
+
+class Associations(NamedTuple):
+    """Pairwise associations between questions.
+
+    Attributes:
+        matrix: Symmetric question by question matrix of associations.
+        ranked: Each pair's association, measure and number of respondents,
+            strongest first.
+    """
+
+    matrix: pandas.DataFrame
+    ranked: pandas.DataFrame
+
+
+def ordinal_columns(
+    data: pandas.DataFrame,
+    columns: List[str],
+    scales: Optional[Dict[str, List]] = None,
+) -> List[str]:
+    """Return the columns with an ordinal scale.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        columns (List[str]): Single select columns.
+        scales (Optional[Dict[str, List]]): Answers of ordinal columns in
+            scale order, by column.
+
+    Returns:
+        List[str]: Columns with a scale in `scales`, and ordered categorical
+            columns.
+    """
+    scales = scales or {}
+    return [
+        column
+        for column in columns
+        if column in scales
+        or (
+            isinstance(data[column].dtype, pandas.CategoricalDtype)
+            and data[column].cat.ordered
+        )
+    ]
+
+
+def scale_codes(
+    series: pandas.Series, scale: Optional[List] = None
+) -> Tuple[numpy.ndarray, List]:
+    """Encode an ordinal question in scale order.
+
+    Args:
+        series (pandas.Series): Single select question column.
+        scale (Optional[List]): Answers in scale order. Defaults to the
+            categories of an ordered categorical, less any off the scale (see
+            `OFF_SCALE`).
+
+    Raises:
+        ValueError: If there's no scale and the column isn't ordered.
+
+    Returns:
+        Tuple[numpy.ndarray, List]: Integer codes (-1 for missing or off the
+            scale) and the scale they index.
+    """
+    if scale is None:
+        if not (
+            isinstance(series.dtype, pandas.CategoricalDtype) and series.cat.ordered
+        ):
+            raise ValueError(
+                f"{series.name!r} has no scale order; give its scale or make it "
+                "an ordered categorical."
+            )
+        scale = [c for c in series.cat.categories if not OFF_SCALE.match(str(c))]
+    return category_codes(series, categories=scale)
+
+
+def cramers_v(table: numpy.ndarray) -> float:
+    """Compute Cramér's V of a crosstab, ignoring empty rows and columns."""
+    table = _nonempty(table)
+    if min(table.shape) < 2:
+        return numpy.nan
+    expected = numpy.outer(table.sum(axis=1), table.sum(axis=0)) / table.sum()
+    statistic = chi2_statistic(table, expected)
+    return float(numpy.sqrt(statistic / (table.sum() * (min(table.shape) - 1))))
+
+
+def spearman(table: numpy.ndarray) -> float:
+    """Compute Spearman's rank correlation of two ordinal variables' crosstab.
+
+    Rows and columns are in scale order, and respondents in the same row (or
+    column) share its midrank.
+
+    Args:
+        table (numpy.ndarray): Counts, rows by columns.
+
+    Returns:
+        float: The correlation, or NaN if either variable is constant.
+    """
+    table = _nonempty(table)
+    if min(table.shape) < 2:
+        return numpy.nan
+    n = table.sum()
+    rows, columns = _midranks(table.sum(axis=1)), _midranks(table.sum(axis=0))
+    rows, columns = rows - (n + 1) / 2, columns - (n + 1) / 2
+    covariance = rows @ table @ columns
+    variances = (table.sum(axis=1) @ rows**2) * (table.sum(axis=0) @ columns**2)
+    return float(covariance / numpy.sqrt(variances))
+
+
+def polychoric(table: numpy.ndarray) -> float:
+    """Estimate the polychoric correlation of two ordinal variables' crosstab.
+
+    Thresholds are fixed at the normal quantiles of each variable's
+    cumulative proportions, and the correlation fit by maximum likelihood.
+
+    Args:
+        table (numpy.ndarray): Counts, rows by columns, in scale order.
+
+    Returns:
+        float: The correlation, or NaN if either variable is constant.
+    """
+    table = _nonempty(table)
+    if min(table.shape) < 2:
+        return numpy.nan
+    rows, columns = _thresholds(table.sum(axis=1)), _thresholds(table.sum(axis=0))
+    points = numpy.stack(numpy.meshgrid(rows, columns, indexing="ij"), axis=-1)
+
+    def negative_log_likelihood(rho: float) -> float:
+        cdf = stats.multivariate_normal(mean=[0, 0], cov=[[1, rho], [rho, 1]]).cdf(
+            points
+        )
+        probabilities = cdf[1:, 1:] - cdf[:-1, 1:] - cdf[1:, :-1] + cdf[:-1, :-1]
+        return -(table * numpy.log(numpy.clip(probabilities, 1e-12, None))).sum()
+
+    result = optimize.minimize_scalar(
+        negative_log_likelihood, bounds=(-0.999, 0.999), method="bounded"
+    )
+    return float(result.x)
+
+
+@instrumented
+def association_matrix(
+    data: pandas.DataFrame,
+    columns: Optional[List[str]] = None,
+    ordinal: Optional[List[str]] = None,
+    scales: Optional[Dict[str, List]] = None,
+    ordinal_measure: str = SPEARMAN,
+    min_respondents: int = MIN_RESPONDENTS,
+    n_jobs: Optional[int] = None,
+    cache: bool = True,
+) -> Associations:
+    """Measure the association between every pair of single select questions.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        columns (Optional[List[str]]): Single select columns. Defaults to
+            every single select answer column in `data`.
+        ordinal (Optional[List[str]]): Which of `columns` are ordinal, each
+            with a scale in `scales` or ordered categories. Defaults to
+            `ordinal_columns(data, columns, scales)`.
+        scales (Optional[Dict[str, List]]): Answers of ordinal columns in
+            scale order, by column, for columns that aren't ordered
+            categoricals (or to override their categories' order).
+        ordinal_measure (str): `SPEARMAN` or `POLYCHORIC`, for pairs of
+            ordinal questions.
+        min_respondents (int): Fewest respondents answering both questions
+            for a pair's association to be computed.
+        n_jobs (Optional[int]): Number of worker processes.
+        cache (bool): Load and save results in the cache.
+
+    Raises:
+        ValueError: If `ordinal_measure` isn't `SPEARMAN` or `POLYCHORIC`, or
+            an ordinal column has no scale order.
+
+    Returns:
+        Associations: The association matrix and ranked pairs.
+    """
+    if ordinal_measure not in (SPEARMAN, POLYCHORIC):
+        raise ValueError(f"Unknown ordinal measure {ordinal_measure!r}.")
+    if columns is None:
+        columns = [
+            column
+            for column in all_answer_columns()
+            if column in data and column_kind(data[column]) == SINGLE_SELECT
+        ]
+    scales = {column: list(scale) for column, scale in (scales or {}).items()}
+    if ordinal is None:
+        ordinal = ordinal_columns(data, columns, scales)
+    ordinal = set(ordinal)
+
+    key = hash_key(
+        _ASSOCIATIONS_VERSION,
+        columns,
+        sorted(ordinal),
+        sorted((column, [str(a) for a in scale]) for column, scale in scales.items()),
+        ordinal_measure,
+        min_respondents,
+        dataset_fingerprint(data[columns]),
+    )
+    if cache:
+        cached = load_cached("associations", key)
+        if cached is not None:
+            return cached
+
+    # Every pair's crosstab is a block of one indicator product.
+    blocks, starts = [], [0]
+    for column in columns:
+        codes, categories = (
+            scale_codes(data[column], scales.get(column))
+            if column in ordinal
+            else category_codes(data[column])
+        )
+        blocks.append(codes.astype(numpy.int64))
+        starts.append(starts[-1] + len(categories))
+    rows, answers = [], []
+    for i, codes in enumerate(blocks):
+        answered = numpy.flatnonzero(codes >= 0)
+        rows.append(answered)
+        answers.append(starts[i] + codes[answered])
+    rows, answers = numpy.concatenate(rows), numpy.concatenate(answers)
+    indicators = sparse.csr_matrix(
+        (numpy.ones(len(rows), dtype=numpy.int64), (rows, answers)),
+        shape=(len(data), starts[-1]),
+    )
+    crosstabs = (indicators.T @ indicators).toarray()
+
+    pairs = [(i, j) for i in range(len(columns)) for j in range(i + 1, len(columns))]
+    tasks = [
+        [
+            (
+                crosstabs[starts[i] : starts[i + 1], starts[j] : starts[j + 1]],
+                (
+                    ordinal_measure
+                    if columns[i] in ordinal and columns[j] in ordinal
+                    else CRAMERS_V
+                ),
+            )
+            for i, j in pairs[start : start + CHUNK_SIZE]
+        ]
+        for start in range(0, len(pairs), CHUNK_SIZE)
+    ]
+    results = process_map(
+        functools.partial(_association_task, min_respondents=min_respondents),
+        tasks,
+        n_jobs,
+    )
+    values = [value for chunk in results for value in chunk]
+
+    first, second = numpy.array(pairs, dtype=numpy.int64).reshape(-1, 2).T
+    ranked = pandas.DataFrame(
+        {
+            "row": numpy.array(columns, dtype=object)[first],
+            "column": numpy.array(columns, dtype=object)[second],
+            "measure": [measure for chunk in tasks for _, measure in chunk],
+            "association": [value for value, _ in values],
+            "respondents": [n for _, n in values],
+        }
+    )
+    ranked = (
+        ranked.assign(strength=ranked["association"].abs())
+        .sort_values("strength", ascending=False, na_position="last")
+        .reset_index(drop=True)
+    )
+
+    matrix = numpy.full((len(columns), len(columns)), numpy.nan)
+    matrix[first, second] = matrix[second, first] = [value for value, _ in values]
+    numpy.fill_diagonal(matrix, 1.0)
+    associations = Associations(
+        pandas.DataFrame(matrix, index=columns, columns=columns), ranked
+    )
+    if cache:
+        save_cached("associations", key, associations)
+    return associations
+
+
+def _association_task(chunk, min_respondents: int):
+    # Each crosstab's association and number of respondents.
+    measures = {CRAMERS_V: cramers_v, SPEARMAN: spearman, POLYCHORIC: polychoric}
+    results = []
+    for table, measure in chunk:
+        n = int(table.sum())
+        value = measures[measure](table) if n >= min_respondents else numpy.nan
+        results.append((value, n))
+    return results
+
+
+def _nonempty(table: numpy.ndarray) -> numpy.ndarray:
+    table = numpy.asarray(table, dtype=numpy.float64)
+    return table[table.sum(axis=1) > 0][:, table.sum(axis=0) > 0]
+
+
+def _midranks(counts: numpy.ndarray) -> numpy.ndarray:
+    # Average rank of the respondents in each category.
+    ends = numpy.cumsum(counts)
+    return ends - (counts - 1) / 2
+
+
+def _thresholds(counts: numpy.ndarray) -> numpy.ndarray:
+    # Normal quantiles of cumulative proportions, bounded at both ends.
+    inner = stats.norm.ppf(numpy.cumsum(counts)[:-1] / counts.sum())
+    return numpy.concatenate([[-_BOUND], numpy.clip(inner, -_BOUND, _BOUND), [_BOUND]])
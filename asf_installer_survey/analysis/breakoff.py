@@ -0,0 +1,293 @@
+"""Break-off point detection and page-level dropout for partial responses.
+
+For each respondent, the questions on their subpopulation's route are turned
+into a boolean answered matrix and the last answered position is found with
+a single argmax over the column-reversed matrix. Break-off positions are then
+aggregated into page-level funnels and Kaplan-Meier style survival curves.
+
+Complete responses are treated as censored at the end of their route, so the
+survival curves describe how long partial respondents stay in the survey.
+"""
+from typing import List, Optional, Union
+
+import numpy
+import pandas
+from matplotlib import pyplot
+
+from asf_installer_survey.utils.answers import answered_matrix
+from asf_installer_survey.utils.instrumentation import instrumented
+from asf_installer_survey.utils.lookups import QuestionNumbers as col
+from asf_installer_survey.utils.routing import (
+    identify_subpopulation,
+    route_pages,
+    route_questions,
+    SUBPOPULATIONS,
+)
+
+
+def last_answered_position(answered: numpy.ndarray) -> numpy.ndarray:
+    """Find the position of the last answered question in each row.
+
+    Args:
+        answered (numpy.ndarray): Boolean respondent by question matrix.
+
+    Returns:
+        numpy.ndarray: Column index of the last True value in each row, or -1
+            where a row has no answered questions.
+    """
+    n_questions = answered.shape[1]
+    if n_questions == 0:
+        return numpy.full(answered.shape[0], -1, dtype=numpy.int64)
+    last = n_questions - 1 - numpy.argmax(answered[:, ::-1], axis=1)
+    return numpy.where(answered.any(axis=1), last, -1)
+
+
+@instrumented
+def identify_break_off(
+    data: pandas.DataFrame, by: Optional[Union[str, List[str]]] = None
+) -> pandas.DataFrame:
+    """Identify where each respondent stopped answering on their route.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        by (Optional[Union[str, List[str]]]): Additional columns of `data` to
+            carry through for grouping, e.g. a survey wave.
+
+    Returns:
+        pandas.DataFrame: One row per respondent (indexed as `data`) with their
+            subpopulation, completion status, route length, last answered
+            position, question and page. Respondents whose subpopulation
+            can't be identified are dropped.
+    """
+    by = _as_list(by)
+    subpopulation = identify_subpopulation(data)
+
+    frames = []
+    for name in SUBPOPULATIONS:
+        subset = data.loc[subpopulation == name]
+        if subset.empty:
+            continue
+        questions = route_questions(name)
+        pages = numpy.array(route_pages(name), dtype=object)
+        position = last_answered_position(answered_matrix(subset, questions))
+        reached = position >= 0
+        frames.append(
+            pandas.DataFrame(
+                {
+                    "subpopulation": name,
+                    "complete": (subset[col.q0d] == "Complete").to_numpy(),
+                    "route_length": len(questions),
+                    "position": position,
+                    "question": numpy.where(
+                        reached, numpy.array(questions, dtype=object)[position], None
+                    ),
+                    "page": numpy.where(reached, pages[position], None),
+                },
+                index=subset.index,
+            ).join(subset[by])
+        )
+
+    if not frames:
+        return pandas.DataFrame(columns=_BREAK_OFF_COLUMNS + by, index=data.index[:0])
+    return pandas.concat(frames)
+
+
+def page_dropout_funnel(
+    break_off: pandas.DataFrame, by: Optional[Union[str, List[str]]] = None
+) -> pandas.DataFrame:
+    """Aggregate break-off points into a page-level dropout funnel.
+
+    A respondent reaches a page if they answered any question on it or any
+    later page, or if they completed the survey.
+
+    Args:
+        break_off (pandas.DataFrame): Output of `identify_break_off`.
+        by (Optional[Union[str, List[str]]]): Additional grouping columns.
+
+    Returns:
+        pandas.DataFrame: For each subpopulation and page, the number of
+            respondents reaching the page, the proportion of the subpopulation
+            that represents, and the number and rate of partial respondents
+            whose last answered question was on that page.
+    """
+    keys = ["subpopulation"] + _as_list(by)
+    frames = []
+    for group, subset in break_off.groupby(keys, sort=False):
+        name = group[0] if isinstance(group, tuple) else group
+        page_labels = list(dict.fromkeys(route_pages(name)))
+        page_starts = _page_starts(name)
+
+        # Index of the last page reached by each respondent; -1 if none.
+        page_index = (
+            numpy.searchsorted(page_starts, subset["position"].to_numpy(), side="right")
+            - 1
+        )
+        complete = subset["complete"].to_numpy()
+        page_index = numpy.where(complete, len(page_labels) - 1, page_index)
+        last_page = numpy.bincount(page_index + 1, minlength=len(page_labels) + 1)[1:]
+        dropped = numpy.bincount(
+            page_index[~complete] + 1, minlength=len(page_labels) + 1
+        )[1:]
+        reached = last_page[::-1].cumsum()[::-1]
+
+        frame = pandas.DataFrame(
+            {
+                "page": page_labels,
+                "reached": reached,
+                "proportion_reached": reached / len(subset),
+                "dropped": dropped,
+                "dropout_rate": numpy.divide(
+                    dropped,
+                    reached,
+                    out=numpy.zeros(len(page_labels)),
+                    where=reached > 0,
+                ),
+            }
+        )
+        frames.append(_label(frame, keys, group))
+
+    if not frames:
+        return pandas.DataFrame(columns=keys + _FUNNEL_COLUMNS)
+    return pandas.concat(frames, ignore_index=True)
+
+
+def survival_curves(
+    break_off: pandas.DataFrame, by: Optional[Union[str, List[str]]] = None
+) -> pandas.DataFrame:
+    """Estimate Kaplan-Meier style survival curves over route positions.
+
+    Survival at a position is the estimated probability that a respondent
+    reaches (answers at least up to) that question. Partial respondents have
+    an event immediately after their last answered question; complete
+    respondents are censored at the end of the route.
+
+    Args:
+        break_off (pandas.DataFrame): Output of `identify_break_off`.
+        by (Optional[Union[str, List[str]]]): Additional grouping columns.
+
+    Returns:
+        pandas.DataFrame: For each subpopulation and route position, the
+            question, page, number at risk, number of break-offs, survival
+            estimate and its Greenwood standard error.
+    """
+    keys = ["subpopulation"] + _as_list(by)
+    frames = []
+    for group, subset in break_off.groupby(keys, sort=False):
+        name = group[0] if isinstance(group, tuple) else group
+        n_questions = len(route_questions(name))
+
+        # Time of event: the first position a respondent didn't reach.
+        complete = subset["complete"].to_numpy()
+        time = numpy.where(complete, n_questions, subset["position"].to_numpy() + 1)
+        events = numpy.bincount(time[~complete], minlength=n_questions + 1)
+        at_risk = numpy.bincount(time, minlength=n_questions + 1)[::-1].cumsum()[::-1]
+        events, at_risk = events[:n_questions], at_risk[:n_questions]
+
+        hazard = numpy.divide(
+            events, at_risk, out=numpy.zeros(n_questions), where=at_risk > 0
+        )
+        survival = numpy.cumprod(1 - hazard)
+        greenwood = numpy.cumsum(
+            numpy.divide(
+                events,
+                at_risk * (at_risk - events),
+                out=numpy.zeros(n_questions),
+                where=at_risk > events,
+            )
+        )
+
+        frame = pandas.DataFrame(
+            {
+                "position": numpy.arange(n_questions),
+                "question": route_questions(name),
+                "page": route_pages(name),
+                "at_risk": at_risk,
+                "break_offs": events,
+                "survival": survival,
+                "standard_error": survival * numpy.sqrt(greenwood),
+            }
+        )
+        frames.append(_label(frame, keys, group))
+
+    if not frames:
+        return pandas.DataFrame(columns=keys + _CURVE_COLUMNS[1:])
+    return pandas.concat(frames, ignore_index=True)
+
+
+def plot_survival_curve(
+    survival: pandas.DataFrame, subpopulation: str, ax: Optional[pyplot.Axes] = None
+) -> pyplot.Axes:
+    """Plot a subpopulation's survival curve with page boundaries marked.
+
+    Args:
+        survival (pandas.DataFrame): Output of `survival_curves`.
+        subpopulation (str): Subpopulation to plot.
+        ax (Optional[pyplot.Axes]): Axes to draw on. Defaults to a new figure.
+
+    Returns:
+        pyplot.Axes: The axes drawn on.
+    """
+    if ax is None:
+        _, ax = pyplot.subplots(figsize=(11, 6))
+
+    subset = survival.loc[lambda df: df["subpopulation"] == subpopulation]
+    keys = [column for column in subset.columns if column not in _CURVE_COLUMNS]
+    if keys:
+        for group, curve in subset.groupby(keys, sort=False):
+            ax.step(curve["position"], curve["survival"], where="post", label=group)
+        ax.legend()
+    else:
+        ax.step(subset["position"], subset["survival"], where="post")
+
+    for start, label in zip(
+        _page_starts(subpopulation), dict.fromkeys(route_pages(subpopulation))
+    ):
+        ax.axvline(x=start - 0.5, linestyle="dashed", alpha=0.5)
+        ax.text(x=start - 0.5, y=0.02, s=label, ha="right", rotation="vertical")
+
+    ax.set_ylim(0, 1.05)
+    ax.set_ylabel("Proportion Remaining")
+    ax.set_xlabel("Question Position")
+    ax.grid(axis="y")
+    ax.set_title(f"Survey Survival for {subpopulation}")
+
+    return ax
+
+
+_BREAK_OFF_COLUMNS = [
+    "subpopulation",
+    "complete",
+    "route_length",
+    "position",
+    "question",
+    "page",
+]
+_FUNNEL_COLUMNS = ["page", "reached", "proportion_reached", "dropped", "dropout_rate"]
+_CURVE_COLUMNS = [
+    "subpopulation",
+    "position",
+    "question",
+    "page",
+    "at_risk",
+    "break_offs",
+    "survival",
+    "standard_error",
+]
+
+
+def _page_starts(subpopulation: str) -> numpy.ndarray:
+    pages = route_pages(subpopulation)
+    return numpy.array(
+        [i for i, page in enumerate(pages) if i == 0 or page != pages[i - 1]]
+    )
+
+
+def _label(frame: pandas.DataFrame, keys: List[str], group) -> pandas.DataFrame:
+    values = group if isinstance(group, tuple) else (group,)
+    for i, (key, value) in enumerate(zip(keys, values)):
+        frame.insert(i, key, value)
+    return frame
+
+
+def _as_list(by: Optional[Union[str, List[str]]]) -> List[str]:
+    return [] if by is None else [by] if isinstance(by, str) else list(by)
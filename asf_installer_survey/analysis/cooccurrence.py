@@ -0,0 +1,188 @@
+"""Co-occurrence of the options of multi-select questions.
+
+For two multi-select questions with indicator matrices X and Y (respondents
+by options), the number of respondents selecting each pair of options is the
+product XᵀY. Splits by group are done in the same product by spreading X's
+columns into one block per group, and weights by scaling X's entries, so a
+whole split, weighted table is one sparse matrix product.
+
+Counts are of respondents who answered both questions. Alongside each count
+are two measures of association between the options:
+
+- lift: how many times more often the pair is selected than if the options
+  were selected independently, count × base / (row total × column total).
+- Jaccard: the share of respondents selecting either option who selected
+  both, count / (row total + column total - count).
+
+`all_cooccurrences` counts every pair of a list of questions with a single
+product, with each question's answered indicator appended so every pair's
+base comes out of the same product.
+"""
+from itertools import combinations
+from typing import List, Optional, Union
+
+import numpy
+import pandas
+from scipy import sparse
+
+from asf_installer_survey.analysis.summaries import group_codes
+from asf_installer_survey.utils.encoding import multi_select_indicators
+from asf_installer_survey.utils.instrumentation import instrumented
+
+COLUMNS = [
+    "group",
+    "row_option",
+    "column_option",
+    "count",
+    "row_total",
+    "column_total",
+    "base",
+    "lift",
+    "jaccard",
+]
+
+
+def cooccurrence(
+    data: pandas.DataFrame,
+    row: str,
+    column: str,
+    by: Optional[Union[str, List[str]]] = None,
+    weights: Optional[Union[str, pandas.Series]] = None,
+) -> pandas.DataFrame:
+    """Count respondents selecting each pair of two multi-selects' options.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        row (str): Multi-select question column, e.g. `q8`.
+        column (str): Another (or the same) multi-select question column.
+        by (Optional[Union[str, List[str]]]): Column(s) to split counts by.
+        weights (Optional[Union[str, pandas.Series]]): Respondent weights, or
+            the name of a column of them. Defaults to 1.
+
+    Returns:
+        pandas.DataFrame: For each group and pair of options, the (weighted)
+            count of respondents selecting both, each option's total and the
+            base of respondents answering both questions, with lift and
+            Jaccard similarity.
+    """
+    return all_cooccurrences(data, [row, column], by, weights, pairs=[(row, column)])
+
+
+@instrumented
+def all_cooccurrences(
+    data: pandas.DataFrame,
+    columns: List[str],
+    by: Optional[Union[str, List[str]]] = None,
+    weights: Optional[Union[str, pandas.Series]] = None,
+    pairs: Optional[List[tuple]] = None,
+) -> pandas.DataFrame:
+    """Count option co-occurrence for every pair of a list of multi-selects.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        columns (List[str]): Multi-select question columns.
+        by (Optional[Union[str, List[str]]]): Column(s) to split counts by.
+        weights (Optional[Union[str, pandas.Series]]): Respondent weights, or
+            the name of a column of them. Defaults to 1.
+        pairs (Optional[List[tuple]]): Pairs of `columns` to count. Defaults
+            to every pair of different questions.
+
+    Returns:
+        pandas.DataFrame: The co-occurrence table of each pair (see
+            `cooccurrence`), with "row_question" and "column_question"
+            columns.
+    """
+    pairs = list(combinations(columns, 2)) if pairs is None else pairs
+    columns = list(dict.fromkeys(columns))
+
+    # Each question's options followed by an "answered" indicator.
+    blocks, options, starts = [], {}, {}
+    start = 0
+    for question in columns:
+        indicators, options[question] = multi_select_indicators(data[question])
+        blocks += [indicators, indicators.any(axis=1, keepdims=True)]
+        starts[question] = start
+        start += indicators.shape[1] + 1
+    selected = sparse.csr_matrix(numpy.hstack(blocks), dtype=numpy.float64)
+    width = selected.shape[1]
+
+    groups, labels = group_codes(data, by)
+    unweighted = weights is None
+    if unweighted:
+        weights = numpy.ones(len(data))
+    elif isinstance(weights, str):
+        weights = data[weights].to_numpy(dtype=float)
+    else:
+        weights = weights.reindex(data.index).to_numpy(dtype=float)
+
+    # Spread the weighted indicators into one block of columns per group.
+    coo = selected.tocoo()
+    spread = sparse.csr_matrix(
+        (
+            coo.data * weights[coo.row],
+            (coo.row, groups[coo.row] * width + coo.col),
+        ),
+        shape=(len(data), len(labels) * width),
+    )
+    counts = (spread.T @ selected).toarray().reshape(len(labels), width, width)
+    if unweighted:
+        counts = counts.astype(numpy.int64)
+
+    frames = []
+    for row, column in pairs:
+        frame = _pair_frame(
+            counts,
+            labels,
+            (starts[row], options[row]),
+            (starts[column], options[column]),
+        )
+        frame.insert(0, "column_question", column)
+        frame.insert(0, "row_question", row)
+        frames.append(frame)
+    if not frames:
+        return pandas.DataFrame(columns=["row_question", "column_question"] + COLUMNS)
+    return pandas.concat(frames, ignore_index=True)
+
+
+def _pair_frame(counts: numpy.ndarray, labels: List, row, column) -> pandas.DataFrame:
+    # Long format table of one pair's block of the co-occurrence counts.
+    (row_start, row_options), (column_start, column_options) = row, column
+    rows = slice(row_start, row_start + len(row_options))
+    columns = slice(column_start, column_start + len(column_options))
+    row_answered, column_answered = (
+        row_start + len(row_options),
+        column_start + len(column_options),
+    )
+
+    pair = counts[:, rows, columns]
+    # Option totals among respondents who answered the other question.
+    row_totals = counts[:, rows, column_answered]
+    column_totals = counts[:, row_answered, columns]
+    base = counts[:, row_answered, column_answered]
+
+    row_totals = numpy.broadcast_to(row_totals[:, :, None], pair.shape)
+    column_totals = numpy.broadcast_to(column_totals[:, None, :], pair.shape)
+    base = numpy.broadcast_to(base[:, None, None], pair.shape)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        lift = pair * base / (row_totals * column_totals)
+        jaccard = pair / (row_totals + column_totals - pair)
+
+    n_groups, n_rows, n_columns = pair.shape
+    return pandas.DataFrame(
+        {
+            "group": numpy.repeat(labels, n_rows * n_columns),
+            "row_option": numpy.tile(
+                numpy.repeat(numpy.array(row_options, dtype=object), n_columns),
+                n_groups,
+            ),
+            "column_option": numpy.tile(
+                numpy.array(column_options, dtype=object), n_groups * n_rows
+            ),
+            "count": pair.ravel(),
+            "row_total": row_totals.ravel(),
+            "column_total": column_totals.ravel(),
+            "base": base.ravel(),
+            "lift": lift.ravel(),
+            "jaccard": jaccard.ravel(),
+        }
+    )
@@ -0,0 +1,361 @@
+"""A precomputed count cube over the core respondent dimensions.
+
+`CountCube` holds the number of respondents in every combination of status
+(`q0d`), subpopulation, nation (`q8`), sector experience (`q3`), heat pump
+experience (`q4`), MCS certification (`q21a`-`c`) and age (`q1`). It's built
+with a single `bincount` over the respondents' combined dimension codes, and
+answers marginals, slices and ratios without going back to respondent level
+data.
+
+Nation is multi-select, so its dimension holds each observed combination of
+nations. Selecting a single nation (e.g. `nation="Scotland"`) selects every
+combination including it, and `option_counts` counts respondents by nation.
+
+MCS certification is asked as `q21a`, `q21b` or `q21c` depending on the
+subpopulation, so the three are combined into one dimension. Missing answers
+are counted under "Missing".
+"""
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy
+import pandas
+
+from asf_installer_survey.getters.survey_data import SNAPSHOT_PATH
+from asf_installer_survey.utils.encoding import (
+    category_codes,
+    multi_select_indicators,
+    pack_bitsets,
+)
+from asf_installer_survey.utils.lookups import QuestionNumbers as col
+from asf_installer_survey.utils.routing import identify_subpopulation, SUBPOPULATIONS
+
+CUBE_PATH = SNAPSHOT_PATH.with_suffix(".cube")
+
+SUBPOPULATION = "subpopulation"
+MISSING = "Missing"
+
+# Dimension names mapped to their column, or columns to combine.
+DIMENSIONS: Dict[str, Union[str, List[str]]] = {
+    "status": col.q0d,
+    "subpopulation": SUBPOPULATION,
+    "nation": col.q8,
+    "sector_experience": col.q3,
+    "heat_pump_experience": col.q4,
+    "mcs_certified": [col.q21a, col.q21b, col.q21c],
+    "age": col.q1,
+}
+
+Selection = Union[str, List[str]]
+
+
+class CountCube:
+    """Respondent counts over every combination of a set of dimensions.
+
+    Args:
+        dimensions (Dict[str, List[str]]): Dimension names mapped to their
+            labels, in axis order.
+        counts (numpy.ndarray): Counts, with one axis per dimension.
+        patterns (Optional[Dict[str, pandas.DataFrame]]): For multi-select
+            dimensions, a boolean label by option frame of the options
+            selected in each label's combination.
+    """
+
+    def __init__(
+        self,
+        dimensions: Dict[str, List[str]],
+        counts: numpy.ndarray,
+        patterns: Optional[Dict[str, pandas.DataFrame]] = None,
+    ):
+        self.dimensions = {name: list(labels) for name, labels in dimensions.items()}
+        self.counts = numpy.asarray(counts, dtype=numpy.int64)
+        self.patterns = patterns or {}
+        self._positions = {
+            name: {label: i for i, label in enumerate(labels)}
+            for name, labels in self.dimensions.items()
+        }
+        self._marginals = {}
+
+    @classmethod
+    def from_data(
+        cls,
+        data: pandas.DataFrame,
+        dimensions: Dict[str, Union[str, List[str]]] = DIMENSIONS,
+    ) -> "CountCube":
+        """Count respondents over every combination of dimensions.
+
+        Args:
+            data (pandas.DataFrame): Survey data.
+            dimensions (Dict[str, Union[str, List[str]]]): Dimension names
+                mapped to their column (or columns to combine, taking the
+                first answered). Use `SUBPOPULATION` for respondents'
+                subpopulation.
+
+        Returns:
+            CountCube: The cube.
+        """
+        if SUBPOPULATION in dimensions.values() and SUBPOPULATION not in data:
+            subpopulation = pandas.Categorical(
+                identify_subpopulation(data), categories=SUBPOPULATIONS
+            )
+            data = data.assign(**{SUBPOPULATION: subpopulation})
+
+        labels, codes, patterns = {}, [], {}
+        for name, columns in dimensions.items():
+            if isinstance(columns, str) and data[columns].dtype == "object":
+                dimension_codes, labels[name], patterns[name] = _encode_combinations(
+                    data[columns]
+                )
+            else:
+                dimension_codes, labels[name] = _encode_categories(data, columns)
+            codes.append(dimension_codes)
+
+        shape = tuple(len(dimension_labels) for dimension_labels in labels.values())
+        combined = numpy.ravel_multi_index(codes, shape)
+        counts = numpy.bincount(combined, minlength=int(numpy.prod(shape)))
+        return cls(labels, counts.reshape(shape), patterns)
+
+    @property
+    def total(self) -> int:
+        """Number of respondents counted."""
+        return int(self.counts.sum())
+
+    def count(self, **selection: Selection) -> int:
+        """Count the respondents in a slice of the cube.
+
+        Args:
+            **selection: Dimension names mapped to a label, or list of
+                labels, to keep. For multi-select dimensions an option
+                selects every combination including it (rather than only
+                the combination of that option alone).
+
+        Returns:
+            int: Number of respondents.
+        """
+        return int(self._slice(selection)[0].sum())
+
+    def marginal(self, *dimensions: str, **selection: Selection) -> pandas.Series:
+        """Count respondents by some dimensions, within a slice of the cube.
+
+        Args:
+            *dimensions (str): Dimensions to count by.
+            **selection: Slice to count within (see `count`).
+
+        Returns:
+            pandas.Series: Counts indexed by the dimensions' labels.
+        """
+        sliced, names = self._slice(selection, dimensions)
+        others = tuple(i for i, name in enumerate(names) if name not in dimensions)
+        remaining = [name for name in names if name in dimensions]
+        counts = sliced.sum(axis=others).transpose(
+            [remaining.index(name) for name in dimensions]
+        )
+        index = pandas.MultiIndex.from_product(
+            [self._labels(name, selection) for name in dimensions], names=dimensions
+        )
+        if len(dimensions) == 1:
+            index = index.get_level_values(0)
+        return pandas.Series(counts.ravel(), index=index, name="count")
+
+    def proportions(
+        self,
+        *dimensions: str,
+        within: Optional[List[str]] = None,
+        **selection: Selection,
+    ) -> pandas.Series:
+        """Share of respondents by some dimensions, within a slice of the cube.
+
+        Args:
+            *dimensions (str): Dimensions to count by.
+            within (Optional[List[str]]): Dimensions, among `dimensions`, whose
+                groups the shares sum to one within. Defaults to the whole
+                slice.
+            **selection: Slice to count within (see `count`).
+
+        Returns:
+            pandas.Series: Proportions indexed by the dimensions' labels.
+        """
+        counts = self.marginal(*dimensions, **selection)
+        if within:
+            totals = counts.groupby(level=within, sort=False).transform("sum")
+        else:
+            totals = counts.sum()
+        return (counts / totals).rename("proportion")
+
+    def ratio(
+        self, numerator: Dict[str, Selection], denominator: Dict[str, Selection]
+    ) -> float:
+        """Ratio of the respondent counts in two slices of the cube.
+
+        Args:
+            numerator (Dict[str, Selection]): Slice to count (see `count`).
+            denominator (Dict[str, Selection]): Slice to divide by.
+
+        Returns:
+            float: The ratio, NaN if the denominator slice is empty.
+        """
+        denominator_count = self.count(**denominator)
+        if denominator_count == 0:
+            return numpy.nan
+        return self.count(**numerator) / denominator_count
+
+    def option_counts(self, dimension: str, **selection: Selection) -> pandas.Series:
+        """Count respondents selecting each option of a multi-select dimension.
+
+        Args:
+            dimension (str): Multi-select dimension, e.g. "nation".
+            **selection: Slice to count within (see `count`).
+
+        Returns:
+            pandas.Series: Counts indexed by option.
+        """
+        counts = self.marginal(dimension, **selection)
+        patterns = self.patterns[dimension].loc[counts.index]
+        return (
+            pandas.Series(
+                counts.to_numpy() @ patterns.to_numpy(), index=patterns.columns
+            )
+            .rename_axis(dimension)
+            .rename("count")
+        )
+
+    def save(self, path: Path = CUBE_PATH) -> None:
+        """Save the cube to a directory."""
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        with open(path / "cube.json", "w") as f:
+            json.dump(
+                {
+                    "dimensions": self.dimensions,
+                    "patterns": {
+                        name: list(patterns.columns)
+                        for name, patterns in self.patterns.items()
+                    },
+                },
+                f,
+            )
+        # Most combinations are empty, so the counts compress well.
+        numpy.savez_compressed(
+            path / "counts.npz",
+            counts=self.counts.astype(
+                numpy.min_scalar_type(self.counts.max(initial=0))
+            ),
+            **{
+                f"patterns_{name}": patterns.to_numpy()
+                for name, patterns in self.patterns.items()
+            },
+        )
+
+    @classmethod
+    def load(cls, path: Path = CUBE_PATH) -> "CountCube":
+        """Load a cube saved with `save`."""
+        path = Path(path)
+        with open(path / "cube.json") as f:
+            metadata = json.load(f)
+        with numpy.load(path / "counts.npz") as arrays:
+            counts = arrays["counts"]
+            patterns = {
+                name: pandas.DataFrame(
+                    arrays[f"patterns_{name}"],
+                    index=metadata["dimensions"][name],
+                    columns=options,
+                )
+                for name, options in metadata["patterns"].items()
+            }
+        return cls(metadata["dimensions"], counts, patterns)
+
+    def _positions_of(self, name: str, selected: Selection) -> numpy.ndarray:
+        selected = [selected] if isinstance(selected, str) else list(selected)
+        positions = self._positions[name]
+        keep = numpy.zeros(len(positions), dtype=bool)
+        for value in selected:
+            if name in self.patterns and value in self.patterns[name].columns:
+                keep |= self.patterns[name][value].to_numpy()
+            elif value in positions:
+                keep[positions[value]] = True
+            else:
+                raise KeyError(f"{value!r} is not a label of dimension {name!r}.")
+        return numpy.flatnonzero(keep)
+
+    def _slice(
+        self, selection: Dict[str, Selection], dimensions: Tuple[str, ...] = ()
+    ) -> Tuple[numpy.ndarray, List[str]]:
+        # Sum out the dimensions the query doesn't use before slicing.
+        names = tuple(
+            name for name in self.dimensions if name in selection or name in dimensions
+        )
+        sliced = self._marginal_counts(names)
+        for name, selected in selection.items():
+            sliced = sliced.take(
+                self._positions_of(name, selected), axis=names.index(name)
+            )
+        return sliced, list(names)
+
+    def _marginal_counts(self, names: Tuple[str, ...]) -> numpy.ndarray:
+        # Cached, so repeated queries over the same dimensions (e.g. from a
+        # dashboard) only slice a small array.
+        if names not in self._marginals:
+            axes = tuple(
+                i for i, name in enumerate(self.dimensions) if name not in names
+            )
+            self._marginals[names] = self.counts.sum(axis=axes)
+        return self._marginals[names]
+
+    def _labels(self, name: str, selection: Dict[str, Selection]) -> List[str]:
+        if name not in selection:
+            return self.dimensions[name]
+        return [
+            self.dimensions[name][i] for i in self._positions_of(name, selection[name])
+        ]
+
+
+def _encode_categories(data: pandas.DataFrame, columns: Union[str, List[str]]):
+    columns = [columns] if isinstance(columns, str) else columns
+    categories = []
+    for column in columns:
+        answers = data[column]
+        column_categories = (
+            answers.cat.categories
+            if isinstance(answers.dtype, pandas.CategoricalDtype)
+            else sorted(answers.dropna().unique())
+        )
+        categories += [c for c in column_categories if c not in categories]
+
+    codes = numpy.full(len(data), -1, dtype=numpy.int64)
+    for column in columns:
+        column_codes = category_codes(data[column], categories)[0]
+        codes = numpy.where(codes < 0, column_codes, codes)
+    return _with_missing(codes, [str(c) for c in categories])
+
+
+def _encode_combinations(series: pandas.Series):
+    indicators, options = multi_select_indicators(series)
+    # Bitsets packed last option first, so their byte order is the numeric
+    # order of the options' bits, for any number of options.
+    bitsets = numpy.ascontiguousarray(pack_bitsets(indicators[:, ::-1]))
+    if bitsets.shape[1] == 0:
+        bitsets = numpy.zeros((len(bitsets), 1), dtype=numpy.uint8)
+    keys = bitsets.view(numpy.dtype((numpy.void, bitsets.shape[1]))).ravel()
+    # Unanswered (no options selected) sorts first.
+    _, first, codes = numpy.unique(keys, return_index=True, return_inverse=True)
+    codes = codes.ravel()
+    selected = indicators[first].astype(bool)
+    labels = [" & ".join(numpy.array(options)[row]) for row in selected]
+    if len(selected) and not selected[0].any():
+        codes, labels, selected = codes - 1, labels[1:], selected[1:]
+    codes, labels = _with_missing(codes, labels)
+    if len(labels) > len(selected):
+        selected = numpy.vstack([selected, numpy.zeros((1, len(options)), dtype=bool)])
+    patterns = pandas.DataFrame(
+        selected, index=labels, columns=[str(o) for o in options]
+    )
+    return codes, labels, patterns
+
+
+def _with_missing(codes: numpy.ndarray, labels: List[str]):
+    codes = numpy.asarray(codes, dtype=numpy.int64)
+    if (codes < 0).any():
+        codes = numpy.where(codes < 0, len(labels), codes)
+        labels = labels + [MISSING]
+    return codes, labels
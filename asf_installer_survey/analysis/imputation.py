@@ -0,0 +1,429 @@
+"""Multiple imputation of partial responses by chained equations.
+
+Rather than dropping partial respondents or analysing them with missing
+answers, `multiply_impute` creates several completed copies of the survey
+data, imputing each respondent's missing answers to the chosen questions.
+Single select (including ordinal and grid item) questions are imputed as
+categorical variables, and multi-select questions as one binary variable per
+option.
+
+Imputation respects routing: only questions a respondent was shown (those on
+their subpopulation's route, and whose conditions they meet, e.g. `q9a` only
+for firms in England) are imputed. Questions they weren't shown stay missing,
+and are a level of their own when predicting other questions.
+
+Each variable is imputed in turn from all the others with a categorical naive
+Bayes model, fit to a bootstrap sample of the respondents who answered it,
+drawing from its predictive distribution. Cycling through the variables
+several times gives one imputation; the imputations run in a pool of
+processes with independent random streams.
+
+Estimates are computed on each completed dataset and pooled with Rubin's
+rules, by `pooled_frequencies` (for `analysis.summaries` frequencies) and
+`pooled_logit` (for statsmodels logit models).
+"""
+import functools
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import numpy
+import pandas
+import statsmodels.formula.api as smf
+from scipy import stats
+
+from asf_installer_survey.analysis.missingness import MissingnessIndex, shown
+from asf_installer_survey.analysis.summaries import (
+    multi_select_frequencies,
+    single_select_frequencies,
+)
+from asf_installer_survey.pipeline.validation import selection_limit
+from asf_installer_survey.utils.encoding import (
+    category_codes,
+    multi_select_indicators,
+)
+from asf_installer_survey.utils.instrumentation import instrumented
+from asf_installer_survey.utils.lookups import QuestionNumbers as col
+from asf_installer_survey.utils.parallel import process_map
+from asf_installer_survey.utils.questions import column_kind, MULTI_SELECT
+from asf_installer_survey.utils.routing import (
+    identify_subpopulation,
+    SUBPOPULATIONS,
+)
+
+SUBPOPULATION = "subpopulation"
+
+# Columns used to predict every imputed question, without being imputed.
+AUXILIARY = [SUBPOPULATION, col.q1, col.q3, col.q4]
+
+# Additive smoothing of the naive Bayes counts.
+_SMOOTHING = 1.0
+
+
+class _Variable(NamedTuple):
+    # A question column, or an option of a multi-select column.
+    column: str
+    option: Optional[str]
+    levels: List
+
+
+class _Encoded(NamedTuple):
+    # Predictor codes (not shown and missing auxiliary answers as an extra
+    # level per variable), which variables are to be imputed for each
+    # respondent, and which were answered.
+    variables: List[_Variable]
+    codes: numpy.ndarray
+    n_levels: numpy.ndarray
+    missing: numpy.ndarray
+    observed: numpy.ndarray
+
+
+@instrumented
+def multiply_impute(
+    data: pandas.DataFrame,
+    columns: List[str],
+    n_imputations: int = 20,
+    n_cycles: int = 10,
+    auxiliary: List[str] = AUXILIARY,
+    seed: int = 0,
+    n_jobs: Optional[int] = None,
+    missingness: Optional[MissingnessIndex] = None,
+) -> List[pandas.DataFrame]:
+    """Impute missing answers to some questions several times over.
+
+    The cost of each cycle grows with the square of the number of imputed
+    variables (multi-select questions contribute one per option), so impute
+    the questions an analysis needs rather than the whole questionnaire.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        columns (List[str]): Single select and multi-select columns to impute.
+        n_imputations (int): Number of completed datasets to create.
+        n_cycles (int): Number of passes over the variables per imputation.
+        auxiliary (List[str]): Further columns to predict with. Use
+            `SUBPOPULATION` for respondents' subpopulation.
+        seed (int): Seed the imputations' random streams are spawned from.
+        n_jobs (Optional[int]): Number of worker processes.
+        missingness (Optional[MissingnessIndex]): Index of `data` from
+            `analysis.missingness`, to read which questions respondents were
+            shown from rather than working it out again.
+
+    Returns:
+        List[pandas.DataFrame]: Completed copies of `data`.
+    """
+    encoded = _encode(data, columns, auxiliary, missingness)
+    impute = functools.partial(_impute_once, encoded, n_cycles)
+    seeds = numpy.random.SeedSequence(seed).spawn(n_imputations)
+    imputed = process_map(impute, seeds, n_jobs)
+    return [_complete(data, encoded, codes) for codes in imputed]
+
+
+def pool_estimates(
+    estimates: numpy.ndarray, variances: numpy.ndarray
+) -> pandas.DataFrame:
+    """Pool estimates from multiply imputed datasets with Rubin's rules.
+
+    Args:
+        estimates (numpy.ndarray): Array of shape (n_imputations, n_estimates).
+        variances (numpy.ndarray): Their sampling variances, of the same shape.
+
+    Returns:
+        pandas.DataFrame: For each estimate, the pooled `estimate`,
+            `std_error`, degrees of freedom `df`, 95% confidence interval and
+            fraction of missing information `fmi`.
+    """
+    estimates = numpy.asarray(estimates, dtype=float)
+    variances = numpy.asarray(variances, dtype=float)
+    m = len(estimates)
+    estimate = estimates.mean(axis=0)
+    within = variances.mean(axis=0)
+    between = estimates.var(axis=0, ddof=1) if m > 1 else numpy.zeros_like(estimate)
+    total = within + (1 + 1 / m) * between
+
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        # Relative increase in variance due to missing data.
+        r = (1 + 1 / m) * between / within
+        df = numpy.where(between > 0, (m - 1) * (1 + 1 / r) ** 2, numpy.inf)
+        fmi = numpy.where(between > 0, (r + 2 / (df + 3)) / (r + 1), 0.0)
+    std_error = numpy.sqrt(total)
+    margin = stats.t.ppf(0.975, df) * std_error
+    return pandas.DataFrame(
+        {
+            "estimate": estimate,
+            "std_error": std_error,
+            "df": df,
+            "ci_lower": estimate - margin,
+            "ci_upper": estimate + margin,
+            "fmi": fmi,
+        }
+    )
+
+
+def pooled_frequencies(
+    imputations: List[pandas.DataFrame], column: str, by: Optional[str] = None
+) -> pandas.DataFrame:
+    """Pool the answer frequencies of a question across imputations.
+
+    Args:
+        imputations (List[pandas.DataFrame]): Completed datasets from
+            `multiply_impute`.
+        column (str): Single select or multi-select question column.
+        by (Optional[str]): Column to split frequencies by.
+
+    Returns:
+        pandas.DataFrame: Mean count and pooled proportion of each answer (or
+            option) by group, with the proportion's standard error,
+            confidence interval and fraction of missing information.
+    """
+    frequencies = (
+        multi_select_frequencies
+        if column_kind(imputations[0][column]) == MULTI_SELECT
+        else single_select_frequencies
+    )
+    tables = [frequencies(data, column, by) for data in imputations]
+    counts = numpy.stack([table["count"].to_numpy() for table in tables])
+    proportions = numpy.stack([table["proportion"].to_numpy() for table in tables])
+    # Binomial variance p(1 - p) / n, with n = count / p.
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        variances = numpy.where(
+            counts > 0, proportions**2 * (1 - proportions) / counts, 0.0
+        )
+
+    pooled = pool_estimates(numpy.nan_to_num(proportions), variances)
+    table = tables[0].drop(columns=["count", "proportion", "respondents"])
+    return table.assign(
+        count=counts.mean(axis=0),
+        respondents=numpy.mean([t["respondents"] for t in tables], axis=0),
+        proportion=pooled["estimate"].to_numpy(),
+        std_error=pooled["std_error"].to_numpy(),
+        ci_lower=pooled["ci_lower"].to_numpy(),
+        ci_upper=pooled["ci_upper"].to_numpy(),
+        fmi=pooled["fmi"].to_numpy(),
+    )
+
+
+def pooled_logit(
+    imputations: List[pandas.DataFrame],
+    formula: str,
+    prepare: Optional[Callable[[pandas.DataFrame], pandas.DataFrame]] = None,
+) -> pandas.DataFrame:
+    """Fit a logit model to each imputation and pool its coefficients.
+
+    Args:
+        imputations (List[pandas.DataFrame]): Completed datasets from
+            `multiply_impute`.
+        formula (str): statsmodels formula, e.g. "complete ~ var - 1".
+        prepare (Optional[Callable[[pandas.DataFrame], pandas.DataFrame]]):
+            Function adding the model's variables to each dataset.
+
+    Returns:
+        pandas.DataFrame: Pooled coefficients indexed by term, with standard
+            errors, confidence intervals, p values and fractions of missing
+            information.
+    """
+    params, variances = [], []
+    for data in imputations:
+        if prepare is not None:
+            data = prepare(data)
+        result = smf.logit(formula, data=data).fit(disp=False)
+        params.append(result.params)
+        variances.append(result.bse**2)
+
+    terms = params[0].index
+    pooled = pool_estimates(
+        numpy.stack([p.reindex(terms).to_numpy() for p in params]),
+        numpy.stack([v.reindex(terms).to_numpy() for v in variances]),
+    ).set_index(terms)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        statistic = pooled["estimate"] / pooled["std_error"]
+    return pooled.assign(p_value=2 * stats.t.sf(numpy.abs(statistic), pooled["df"]))
+
+
+def _encode(
+    data: pandas.DataFrame,
+    columns: List[str],
+    auxiliary: List[str],
+    missingness: Optional[MissingnessIndex] = None,
+) -> _Encoded:
+    eligible = (
+        missingness.shown_matrix(columns)
+        if missingness is not None and missingness.covers(columns)
+        else shown(data, columns)
+    )
+    if SUBPOPULATION in auxiliary and SUBPOPULATION not in data:
+        data = data.assign(
+            **{
+                SUBPOPULATION: pandas.Categorical(
+                    identify_subpopulation(data), categories=SUBPOPULATIONS
+                )
+            }
+        )
+
+    variables, codes, missing, observed = [], [], [], []
+    for i, column in enumerate(columns):
+        if column_kind(data[column]) == MULTI_SELECT:
+            indicators, options = multi_select_indicators(data[column])
+            answered = indicators.any(axis=1)
+            for j, option in enumerate(options):
+                variables.append(_Variable(column, option, [False, True]))
+                codes.append(numpy.where(answered, indicators[:, j], -1))
+                missing.append(eligible[:, i] & ~answered)
+                observed.append(answered)
+        else:
+            column_codes, categories = category_codes(data[column])
+            column_codes = column_codes.astype(numpy.int64)
+            variables.append(_Variable(column, None, categories))
+            codes.append(column_codes)
+            missing.append(eligible[:, i] & (column_codes < 0))
+            observed.append(column_codes >= 0)
+
+    for column in auxiliary:
+        column_codes, categories = category_codes(data[column])
+        variables.append(_Variable(column, None, categories))
+        codes.append(column_codes.astype(numpy.int64))
+        missing.append(numpy.zeros(len(data), dtype=bool))
+        observed.append(column_codes >= 0)
+
+    n_levels = numpy.array([len(v.levels) for v in variables], dtype=numpy.int64)
+    codes = numpy.column_stack(codes).astype(numpy.int64)
+    missing = numpy.column_stack(missing)
+    # Unanswered questions that won't be imputed (not shown, or auxiliary)
+    # predict as an extra level.
+    codes = numpy.where(codes < 0, n_levels, codes)
+    return _Encoded(
+        variables, codes, n_levels + 1, missing, numpy.column_stack(observed)
+    )
+
+
+def _impute_once(
+    encoded: _Encoded, n_cycles: int, seed: numpy.random.SeedSequence
+) -> numpy.ndarray:
+    rng = numpy.random.default_rng(seed)
+    codes = encoded.codes.copy()
+    targets = numpy.flatnonzero(encoded.missing.any(axis=0))
+    offsets = numpy.concatenate([[0], numpy.cumsum(encoded.n_levels)])
+
+    # Start from draws from each variable's observed answers.
+    for v in targets:
+        rows = numpy.flatnonzero(encoded.missing[:, v])
+        donors = codes[encoded.observed[:, v], v]
+        if len(donors):
+            codes[rows, v] = rng.choice(donors, len(rows))
+
+    for _ in range(n_cycles):
+        for v in targets:
+            rows = numpy.flatnonzero(encoded.missing[:, v])
+            answered = numpy.flatnonzero(encoded.observed[:, v])
+            if len(answered) == 0:
+                continue
+            sample = rng.choice(answered, len(answered))
+            probabilities = _naive_bayes(
+                codes[sample, v],
+                codes[sample] + offsets[:-1],
+                codes[rows] + offsets[:-1],
+                encoded.n_levels[v] - 1,
+                offsets,
+                exclude=v,
+            )
+            draws = rng.random(len(rows))[:, None]
+            codes[rows, v] = (probabilities.cumsum(axis=1) < draws).sum(axis=1)
+        _constrain_selections(codes, encoded, rng)
+    return codes
+
+
+def _naive_bayes(
+    target: numpy.ndarray,
+    train: numpy.ndarray,
+    predict: numpy.ndarray,
+    n_levels: int,
+    offsets: numpy.ndarray,
+    exclude: int,
+) -> numpy.ndarray:
+    # Predictive probabilities of each level of the target for the `predict`
+    # rows. Predictor codes are offset into one combined level space, so the
+    # conditional counts of every predictor are a single bincount.
+    n_combined = offsets[-1]
+    table = (
+        numpy.bincount(
+            (target[:, None] * n_combined + train).ravel(),
+            minlength=n_levels * n_combined,
+        ).reshape(n_levels, n_combined)
+        + _SMOOTHING
+    )
+    totals = numpy.add.reduceat(table, offsets[:-1], axis=1)
+    log_conditional = numpy.log(table) - numpy.log(
+        numpy.repeat(totals, numpy.diff(offsets), axis=1)
+    )
+    log_conditional[:, offsets[exclude] : offsets[exclude + 1]] = 0
+
+    log_prior = numpy.log(numpy.bincount(target, minlength=n_levels) + _SMOOTHING)
+    log_posterior = log_prior + log_conditional[:, predict].sum(axis=2).T
+    log_posterior -= log_posterior.max(axis=1, keepdims=True)
+    probabilities = numpy.exp(log_posterior)
+    return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+
+def _constrain_selections(
+    codes: numpy.ndarray, encoded: _Encoded, rng: numpy.random.Generator
+) -> None:
+    # An imputed multi-select answer needs at least one option selected, so
+    # where none were drawn select one in proportion to how often each is.
+    # Where more were drawn than the question allows, keep a random subset.
+    by_column: Dict[str, List[int]] = {}
+    for v, variable in enumerate(encoded.variables):
+        if variable.option is not None:
+            by_column.setdefault(variable.column, []).append(v)
+    for column, options in by_column.items():
+        missing = encoded.missing[:, options[0]]
+        selected = codes[:, options] == 1
+
+        rows = numpy.flatnonzero(missing & ~selected.any(axis=1))
+        if len(rows):
+            answered = encoded.observed[:, options[0]]
+            popularity = selected[answered].sum(axis=0) + _SMOOTHING
+            chosen = rng.choice(options, len(rows), p=popularity / popularity.sum())
+            codes[rows, chosen] = 1
+
+        limit = selection_limit(column)
+        rows = numpy.flatnonzero(
+            missing & (selected.sum(axis=1) > (limit or numpy.inf))
+        )
+        if len(rows):
+            # Rank the selected options in a random order and drop the last.
+            keys = numpy.where(selected[rows], rng.random(selected[rows].shape), -1)
+            rank = numpy.argsort(numpy.argsort(-keys, axis=1), axis=1)
+            codes[rows[:, None], numpy.array(options)] = (
+                selected[rows] & (rank < limit)
+            ).astype(codes.dtype)
+
+
+def _complete(
+    data: pandas.DataFrame, encoded: _Encoded, codes: numpy.ndarray
+) -> pandas.DataFrame:
+    completed = data.copy()
+    multi_selects: Dict[str, List[int]] = {}
+    for v, variable in enumerate(encoded.variables):
+        if not encoded.missing[:, v].any():
+            continue
+        if variable.option is not None:
+            multi_selects.setdefault(variable.column, []).append(v)
+            continue
+        answers = data[variable.column]
+        values = numpy.where(
+            encoded.missing[:, v], codes[:, v], category_codes(answers)[0]
+        )
+        if isinstance(answers.dtype, pandas.CategoricalDtype):
+            imputed = pandas.Categorical.from_codes(values, dtype=answers.dtype)
+        else:
+            imputed = pandas.Categorical.from_codes(values, variable.levels)
+        completed[variable.column] = imputed
+
+    for column, options in multi_selects.items():
+        rows = numpy.flatnonzero(encoded.missing[:, options[0]])
+        labels = numpy.array(
+            [encoded.variables[v].option for v in options], dtype=object
+        )
+        selected = codes[rows][:, options] == 1
+        values = completed[column].to_numpy(dtype=object).copy()
+        for row, row_selected in zip(rows, selected):
+            values[row] = labels[row_selected]
+        completed[column] = values
+    return completed
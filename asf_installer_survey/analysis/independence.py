@@ -0,0 +1,259 @@
+"""Tests of independence for crosstabs, exact by Monte Carlo when cells are small.
+
+The asymptotic chi-squared test is unreliable when expected cell counts are
+small, as they often are here (e.g. respondents in Northern Ireland, or new
+heat pump installers). `independence_test` uses it only when every expected
+count reaches `MIN_EXPECTED`, and otherwise estimates the exact p value of the
+chi-squared statistic by Monte Carlo: the column codes of the table's
+respondents are shuffled to give tables with the same margins under
+independence.
+
+Shuffles are generated a batch at a time as one array, and all of a batch's
+tables are counted with a single `bincount` over offset cell codes. Batches
+are capped at `MAX_BATCH_VALUES` respondent codes, so tables with many
+respondents take smaller batches rather than more memory.
+`independence_tests` tests many questions against a grouping in a pool of
+processes, with each question's random stream spawned from one seed so results
+don't depend on scheduling. Split summaries are tested with
+`analysis.summaries.split_independence`.
+"""
+import functools
+from typing import List, NamedTuple, Optional
+
+import numpy
+import pandas
+from scipy.stats import chi2_contingency
+
+from asf_installer_survey.utils.encoding import category_codes
+from asf_installer_survey.utils.instrumentation import instrumented
+from asf_installer_survey.utils.lookups import QuestionNumbers as col
+from asf_installer_survey.utils.parallel import process_map
+
+# Smallest expected cell count for which the asymptotic test is used.
+MIN_EXPECTED = 5
+
+N_PERMUTATIONS = 9999
+BATCH_SIZE = 1000
+# Most shuffled respondent codes held at once (each batch holds two int64
+# arrays of them).
+MAX_BATCH_VALUES = 10_000_000
+
+ASYMPTOTIC = "asymptotic"
+MONTE_CARLO = "monte carlo"
+
+
+class CrosstabTest(NamedTuple):
+    """A crosstab with its test of independence.
+
+    Attributes:
+        table: Counts, rows by columns.
+        statistic: Pearson chi-squared statistic.
+        dof: Degrees of freedom.
+        p_value: P value of the statistic.
+        method: `ASYMPTOTIC` or `MONTE_CARLO`.
+        min_expected: Smallest expected count under independence.
+    """
+
+    table: pandas.DataFrame
+    statistic: float
+    dof: int
+    p_value: float
+    method: str
+    min_expected: float
+
+
+def chi2_statistic(tables: numpy.ndarray, expected: numpy.ndarray) -> numpy.ndarray:
+    """Pearson chi-squared statistic of each of a stack of tables.
+
+    Args:
+        tables (numpy.ndarray): Array of shape (..., n_rows, n_columns).
+        expected (numpy.ndarray): Expected counts, of shape
+            (n_rows, n_columns).
+
+    Returns:
+        numpy.ndarray: The statistic of each table.
+    """
+    return (((tables - expected) ** 2) / expected).sum(axis=(-2, -1))
+
+
+def monte_carlo_p_value(
+    table: numpy.ndarray,
+    n_permutations: int = N_PERMUTATIONS,
+    seed=None,
+    batch_size: int = BATCH_SIZE,
+) -> float:
+    """Estimate the exact p value of a table's chi-squared statistic.
+
+    Args:
+        table (numpy.ndarray): Counts, rows by columns, without empty rows or
+            columns.
+        n_permutations (int): Number of shuffled tables to compare with.
+        seed: Seed (or `numpy.random.SeedSequence`) for the shuffles.
+        batch_size (int): Most shuffled tables generated at once. Fewer are
+            if the table has more than `MAX_BATCH_VALUES / batch_size`
+            respondents.
+
+    Returns:
+        float: Proportion of shuffled tables (counting the observed table) with
+            a statistic at least as large as the observed one.
+    """
+    table = numpy.asarray(table, dtype=numpy.int64)
+    n_rows, n_columns = table.shape
+    expected = _expected(table)
+    observed = chi2_statistic(table, expected)
+
+    # One respondent per count, as row and column codes.
+    rows = numpy.repeat(numpy.arange(n_rows), table.sum(axis=1))
+    columns = numpy.repeat(numpy.tile(numpy.arange(n_columns), n_rows), table.ravel())
+
+    batch_size = max(1, min(batch_size, MAX_BATCH_VALUES // max(len(columns), 1)))
+    rng = numpy.random.default_rng(seed)
+    exceed, done = 0, 0
+    while done < n_permutations:
+        size = min(batch_size, n_permutations - done)
+        shuffled = rng.permuted(
+            numpy.broadcast_to(columns, (size, len(columns))), axis=1
+        )
+        offsets = numpy.arange(size)[:, None] * (n_rows * n_columns)
+        cells = rows * n_columns + shuffled + offsets
+        tables = numpy.bincount(
+            cells.ravel(), minlength=size * n_rows * n_columns
+        ).reshape(size, n_rows, n_columns)
+        # Allow for floating point error in statistics equal to the observed.
+        exceed += (chi2_statistic(tables, expected) >= observed - 1e-9).sum()
+        done += size
+    return (exceed + 1) / (n_permutations + 1)
+
+
+def independence_test(
+    table: pandas.DataFrame,
+    min_expected: float = MIN_EXPECTED,
+    n_permutations: int = N_PERMUTATIONS,
+    seed=None,
+) -> CrosstabTest:
+    """Test a crosstab for independence, by Monte Carlo if cells are small.
+
+    Empty rows and columns are dropped before testing.
+
+    Args:
+        table (pandas.DataFrame): Counts, rows by columns.
+        min_expected (float): Use the asymptotic test only if every expected
+            count is at least this.
+        n_permutations (int): Number of shuffled tables for Monte Carlo tests.
+        seed: Seed (or `numpy.random.SeedSequence`) for Monte Carlo tests.
+
+    Returns:
+        CrosstabTest: The table and its test.
+    """
+    tested = table.loc[table.sum(axis=1) > 0, table.sum(axis=0) > 0]
+    counts = tested.to_numpy(dtype=numpy.int64)
+    if min(counts.shape) < 2:
+        return CrosstabTest(table, 0.0, 0, 1.0, ASYMPTOTIC, numpy.nan)
+
+    expected = _expected(counts)
+    dof = (counts.shape[0] - 1) * (counts.shape[1] - 1)
+    if expected.min() >= min_expected:
+        statistic, p_value, _, _ = chi2_contingency(counts, correction=False)
+        method = ASYMPTOTIC
+    else:
+        statistic = chi2_statistic(counts, expected)
+        p_value = monte_carlo_p_value(counts, n_permutations, seed)
+        method = MONTE_CARLO
+    return CrosstabTest(
+        table, float(statistic), dof, float(p_value), method, float(expected.min())
+    )
+
+
+def crosstab_test(
+    data: pandas.DataFrame,
+    row: str,
+    column: str,
+    min_expected: float = MIN_EXPECTED,
+    n_permutations: int = N_PERMUTATIONS,
+    seed=None,
+) -> CrosstabTest:
+    """Crosstab two single select columns and test them for independence.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        row (str): Column whose answers form the rows, e.g. `q0d`.
+        column (str): Column whose answers form the columns.
+        min_expected (float): Use the asymptotic test only if every expected
+            count is at least this.
+        n_permutations (int): Number of shuffled tables for Monte Carlo tests.
+        seed: Seed (or `numpy.random.SeedSequence`) for Monte Carlo tests.
+
+    Returns:
+        CrosstabTest: The crosstab of respondents answering both, and its test.
+    """
+    row_codes, row_labels = category_codes(data[row])
+    column_codes, column_labels = category_codes(data[column])
+    row_codes = row_codes.astype(numpy.int64)
+    column_codes = column_codes.astype(numpy.int64)
+    answered = (row_codes >= 0) & (column_codes >= 0)
+    counts = numpy.bincount(
+        row_codes[answered] * len(column_labels) + column_codes[answered],
+        minlength=len(row_labels) * len(column_labels),
+    ).reshape(len(row_labels), len(column_labels))
+    table = pandas.DataFrame(
+        counts,
+        index=pandas.Index(row_labels, name=row),
+        columns=pandas.Index(column_labels, name=column),
+    )
+    return independence_test(table, min_expected, n_permutations, seed)
+
+
+@instrumented
+def independence_tests(
+    data: pandas.DataFrame,
+    columns: List[str],
+    by: str = col.q0d,
+    min_expected: float = MIN_EXPECTED,
+    n_permutations: int = N_PERMUTATIONS,
+    seed: int = 0,
+    n_jobs: Optional[int] = None,
+) -> pandas.DataFrame:
+    """Test many single select questions for independence from a grouping.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        columns (List[str]): Question columns to test.
+        by (str): Column to test them against. Defaults to status.
+        min_expected (float): Use the asymptotic test only if every expected
+            count is at least this.
+        n_permutations (int): Number of shuffled tables for Monte Carlo tests.
+        seed (int): Seed each question's random stream is spawned from.
+        n_jobs (Optional[int]): Number of worker processes.
+
+    Returns:
+        pandas.DataFrame: Statistic, degrees of freedom, p value, method and
+            smallest expected count for each question.
+    """
+    seeds = numpy.random.SeedSequence(seed).spawn(len(columns))
+    test = functools.partial(
+        _test_task, by=by, min_expected=min_expected, n_permutations=n_permutations
+    )
+    results = process_map(
+        test,
+        [(data[[by, column]], column, s) for column, s in zip(columns, seeds)],
+        n_jobs,
+    )
+    return pandas.DataFrame(
+        {
+            "question": columns,
+            "statistic": [result.statistic for result in results],
+            "dof": [result.dof for result in results],
+            "p_value": [result.p_value for result in results],
+            "method": [result.method for result in results],
+            "min_expected": [result.min_expected for result in results],
+        }
+    )
+
+
+def _test_task(task, by: str, min_expected: float, n_permutations: int) -> CrosstabTest:
+    data, column, seed = task
+    return crosstab_test(data, by, column, min_expected, n_permutations, seed)
+
+
+def _expected(table: numpy.ndarray) -> numpy.ndarray:
+    return numpy.outer(table.sum(axis=1), table.sum(axis=0)) / table.sum()
@@ -0,0 +1,351 @@
+"""Index of respondents' missing data patterns across the questionnaire.
+
+Each respondent is reduced to two bit vectors over the answer columns, in
+questionnaire order: the questions they were shown (on their subpopulation's
+route and meeting the question's conditions, see `shown`), and those of them
+they answered. Vectors are packed eight questions to a byte, and respondents
+sharing both vectors share a missing data pattern. The unique patterns and
+their counts come from one `numpy.unique` over the packed rows, each viewed
+as a single opaque value.
+
+Queries are evaluated once per pattern with byte-wise masks, then broadcast
+to respondents through their pattern. For example, the respondents who
+answered everything they were shown from q30a to q60b, but nothing after:
+
+    index.matches(answered=index.span("q30a", "q60b"), unanswered=index.after("q60b"))
+
+Imputation (`analysis.imputation`) and sample definition
+(`pipeline.analytical_sample`) can take their answered and shown matrices
+from an index rather than recomputing them. An index is built once per
+dataset (keyed by a fingerprint of the columns it reads) and cached.
+
+Usage:
+    python -m asf_installer_survey.analysis.missingness <data.parquet> [--top N]
+"""
+import argparse
+from pathlib import Path
+from typing import List, Optional, Sequence
+
+import numpy
+import pandas
+
+from asf_installer_survey.pipeline.validation import CONDITIONS
+from asf_installer_survey.utils.answers import answered_matrix
+from asf_installer_survey.utils.cache import (
+    dataset_fingerprint,
+    hash_key,
+    load_cached,
+    save_cached,
+)
+from asf_installer_survey.utils.encoding import multi_select_indicators
+from asf_installer_survey.utils.instrumentation import instrumented
+from asf_installer_survey.utils.lookups import QuestionNumbers as col
+from asf_installer_survey.utils.questions import (
+    all_answer_columns,
+    column_kind,
+    MULTI_SELECT,
+    question_columns,
+    question_numbers,
+)
+from asf_installer_survey.utils.routing import (
+    identify_subpopulation,
+    route_questions,
+    SUBPOPULATIONS,
+)
+
+# Bump to invalidate cached indexes after changing how they're built.
+_INDEX_VERSION = 1
+
+
+def shown(data: pandas.DataFrame, columns: List[str]) -> numpy.ndarray:
+    """Flag the questions each respondent was shown.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        columns (List[str]): Question columns.
+
+    Returns:
+        numpy.ndarray: Boolean array of shape (len(data), len(columns)), True
+            where the question is on the respondent's route (or on no route)
+            and they meet its conditions.
+    """
+    subpopulation = pandas.Categorical(
+        identify_subpopulation(data), categories=SUBPOPULATIONS
+    ).codes.astype(numpy.int64)
+    routes = [set(route_questions(s)) for s in SUBPOPULATIONS]
+    conditions = {column: (condition, o) for column, condition, o in CONDITIONS}
+
+    matrix = numpy.zeros((len(data), len(columns)), dtype=bool)
+    for i, column in enumerate(columns):
+        on_route = numpy.array([column in route for route in routes] + [False])
+        if not on_route.any():
+            # Not in the routes (e.g. `q9a`, routed only by its condition).
+            on_route[:-1] = True
+        matrix[:, i] = on_route[subpopulation]
+        if column in conditions:
+            condition, options = conditions[column]
+            answers = data[condition]
+            if column_kind(answers) == MULTI_SELECT:
+                indicators, _ = multi_select_indicators(answers, options)
+                matrix[:, i] &= indicators.any(axis=1)
+            else:
+                matrix[:, i] &= answers.isin(options).to_numpy()
+    return matrix
+
+
+class MissingnessIndex:
+    """Respondents' bit-packed shown and answered questions, by pattern.
+
+    Args:
+        columns (List[str]): Answer columns, in questionnaire order.
+        respondents (pandas.Index): Index of the survey data.
+        shown (numpy.ndarray): Respondent by column matrix of questions shown,
+            packed along columns with `numpy.packbits`.
+        answered (numpy.ndarray): Packed matrix of questions answered.
+    """
+
+    def __init__(
+        self,
+        columns: List[str],
+        respondents: pandas.Index,
+        shown: numpy.ndarray,
+        answered: numpy.ndarray,
+    ):
+        self.columns = list(columns)
+        self.respondents = respondents
+        self.shown = shown
+        self.answered = answered
+        self._positions = {column: i for i, column in enumerate(self.columns)}
+
+        # Answers off a respondent's route don't distinguish their pattern.
+        rows = numpy.ascontiguousarray(numpy.hstack([shown, answered & shown]))
+        keys = rows.view(numpy.dtype((numpy.void, max(rows.shape[1], 1)))).ravel()
+        _, first, inverse, counts = numpy.unique(
+            keys, return_index=True, return_inverse=True, return_counts=True
+        )
+        self.pattern = inverse.ravel()
+        self.counts = counts
+        self._pattern_shown = shown[first]
+        self._pattern_answered = answered[first] & shown[first]
+
+    @classmethod
+    def from_data(
+        cls, data: pandas.DataFrame, columns: Optional[List[str]] = None
+    ) -> "MissingnessIndex":
+        """Index respondents' missing data patterns.
+
+        Args:
+            data (pandas.DataFrame): Survey data.
+            columns (Optional[List[str]]): Answer columns, in questionnaire
+                order. Defaults to every answer column in `data`.
+
+        Returns:
+            MissingnessIndex: The index.
+        """
+        columns = columns or [c for c in all_answer_columns() if c in data]
+        return cls(
+            columns,
+            data.index,
+            numpy.packbits(shown(data, columns), axis=1),
+            numpy.packbits(answered_matrix(data, columns), axis=1),
+        )
+
+    @classmethod
+    def for_data(
+        cls,
+        data: pandas.DataFrame,
+        columns: Optional[List[str]] = None,
+        cache: bool = True,
+    ) -> "MissingnessIndex":
+        """Load the index of a dataset, building and caching it if needed.
+
+        Args:
+            data (pandas.DataFrame): Survey data.
+            columns (Optional[List[str]]): Answer columns, in questionnaire
+                order. Defaults to every answer column in `data`.
+            cache (bool): Load and save the index in the cache.
+
+        Returns:
+            MissingnessIndex: The index.
+        """
+        columns = columns or [c for c in all_answer_columns() if c in data]
+        used = set(columns) | {col.q5, col.q6a} | {c for _, c, _ in CONDITIONS}
+        key = hash_key(
+            _INDEX_VERSION,
+            columns,
+            dataset_fingerprint(data[[c for c in data.columns if c in used]]),
+        )
+        if cache:
+            cached = load_cached("missingness", key)
+            if cached is not None:
+                return cached
+        index = cls.from_data(data, columns)
+        if cache:
+            save_cached("missingness", key, index)
+        return index
+
+    def answered_matrix(self, columns: List[str]) -> numpy.ndarray:
+        """Unpack the respondent by column matrix of answered questions."""
+        return self._unpack(self.answered, columns)
+
+    def shown_matrix(self, columns: List[str]) -> numpy.ndarray:
+        """Unpack the respondent by column matrix of questions shown."""
+        return self._unpack(self.shown, columns)
+
+    def is_answered(self, column: str) -> numpy.ndarray:
+        """Flag the respondents who answered a column, as `utils.answers`."""
+        return self.answered_matrix([column])[:, 0]
+
+    def covers(self, columns: Sequence[str]) -> bool:
+        """Check whether the index holds every one of some columns."""
+        return all(column in self._positions for column in columns)
+
+    def span(self, first: str, last: str) -> List[str]:
+        """Return the indexed columns of questions `first` to `last` inclusive.
+
+        Args:
+            first (str): Question number (e.g. "q30a") or indexed column.
+            last (str): Question number (e.g. "q60b") or indexed column.
+
+        Raises:
+            ValueError: If either question is unknown or has no indexed
+                columns.
+
+        Returns:
+            List[str]: Columns in questionnaire order.
+        """
+        start = min(self._question_positions(first))
+        end = max(self._question_positions(last))
+        return self.columns[start : end + 1]
+
+    def after(self, number: str) -> List[str]:
+        """Return the indexed columns after a question, e.g. "q60b"."""
+        return self.columns[max(self._question_positions(number)) + 1 :]
+
+    def matches(
+        self,
+        answered: Sequence[str] = (),
+        unanswered: Sequence[str] = (),
+        any_answered: Sequence[str] = (),
+    ) -> pandas.Series:
+        """Find the respondents whose missing data pattern matches a query.
+
+        Conditions only consider the questions each respondent was shown, so
+        a respondent can answer "all" of some questions without being shown
+        every one.
+
+        Args:
+            answered (Sequence[str]): Columns the respondent answered all of.
+            unanswered (Sequence[str]): Columns they answered none of.
+            any_answered (Sequence[str]): Columns they answered at least one
+                of, if any are given.
+
+        Raises:
+            ValueError: If a column isn't indexed.
+
+        Returns:
+            pandas.Series: True for matching respondents, indexed as the data.
+        """
+        shown, answered_bits = self._pattern_shown, self._pattern_answered
+        found = numpy.ones(len(self.counts), dtype=bool)
+        if len(answered):
+            mask = self._mask(answered)
+            found &= ((answered_bits & mask) == (shown & mask)).all(axis=1)
+        if len(unanswered):
+            found &= ~(answered_bits & self._mask(unanswered)).any(axis=1)
+        if len(any_answered):
+            found &= (answered_bits & self._mask(any_answered)).any(axis=1)
+        return pandas.Series(found[self.pattern], index=self.respondents)
+
+    def patterns(self) -> pandas.DataFrame:
+        """Summarise the missing data patterns, most common first.
+
+        Returns:
+            pandas.DataFrame: A row per pattern (indexed by the pattern IDs in
+                `pattern`) with its number and share of respondents, how
+                many questions it was shown and answered, and the last
+                question answered.
+        """
+        n_columns = len(self.columns)
+        answered = numpy.unpackbits(self._pattern_answered, axis=1, count=n_columns)
+        last = n_columns - 1 - numpy.argmax(answered[:, ::-1], axis=1)
+        columns = numpy.array(self.columns + [None], dtype=object)
+        return (
+            pandas.DataFrame(
+                {
+                    "respondents": self.counts,
+                    "share": self.counts / self.counts.sum(),
+                    "shown": numpy.unpackbits(
+                        self._pattern_shown, axis=1, count=n_columns
+                    ).sum(axis=1),
+                    "answered": answered.sum(axis=1),
+                    "last_answered": columns[
+                        numpy.where(answered.any(axis=1), last, n_columns)
+                    ],
+                }
+            )
+            .rename_axis("pattern")
+            .sort_values("respondents", ascending=False, kind="stable")
+        )
+
+    def _mask(self, columns: Sequence[str]) -> numpy.ndarray:
+        # Packed bits set at the columns' positions.
+        bits = numpy.zeros(len(self.columns), dtype=bool)
+        bits[self._column_positions(columns)] = True
+        return numpy.packbits(bits)
+
+    def _unpack(self, packed: numpy.ndarray, columns: List[str]) -> numpy.ndarray:
+        # Only the bytes holding the columns are read.
+        positions = self._column_positions(columns)
+        return ((packed[:, positions >> 3] >> (7 - (positions & 7))) & 1).astype(bool)
+
+    def _column_positions(self, columns: Sequence[str]) -> numpy.ndarray:
+        unknown = [column for column in columns if column not in self._positions]
+        if unknown:
+            raise ValueError(f"Columns not indexed: {', '.join(unknown)}.")
+        return numpy.array(
+            [self._positions[column] for column in columns], dtype=numpy.int64
+        )
+
+    def _question_positions(self, number: str) -> List[int]:
+        # A question's indexed columns, or a column itself.
+        if number in self._positions:
+            return [self._positions[number]]
+        if number not in question_numbers():
+            raise ValueError(f"Unknown question {number!r}.")
+        positions = [
+            self._positions[column]
+            for column in question_columns(number)
+            if column in self._positions
+        ]
+        if not positions:
+            raise ValueError(f"Question {number} has no indexed columns.")
+        return positions
+
+
+@instrumented
+def missingness_index(
+    data: pandas.DataFrame, columns: Optional[List[str]] = None, cache: bool = True
+) -> MissingnessIndex:
+    """Build (or load from the cache) the missing data pattern index of a dataset.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        columns (Optional[List[str]]): Answer columns, in questionnaire order.
+            Defaults to every answer column in `data`.
+        cache (bool): Load and save the index in the cache.
+
+    Returns:
+        MissingnessIndex: The index.
+    """
+    return MissingnessIndex.for_data(data, columns, cache)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("data", type=Path, help="Survey data parquet file.")
+    parser.add_argument("--top", type=int, default=20, help="Patterns to show.")
+    args = parser.parse_args()
+
+    index = missingness_index(pandas.read_parquet(args.data))
+    print(index.patterns().head(args.top).to_string())
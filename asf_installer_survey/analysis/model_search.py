@@ -0,0 +1,383 @@
+"""Search over logit models of completion (or another binary outcome).
+
+Candidate predictors come in blocks, each a set of design matrix columns that
+enter or leave a model together: the dummy-coded levels of a single select
+question, or the option indicators of a multi-select question. The default
+blocks are subpopulation, sector experience (`q3`), heat pump experience
+(`q4`), nation (`q8`) and MCS certification (`q21a`-`c`).
+
+`search_models` runs a forward, backward or exhaustive search over the blocks.
+Each model is fit once per predictor set: fits are memoised in memory during
+a search and cached on disk by the design's fingerprint, so repeated and
+overlapping searches reuse earlier fits. Each fit is warm-started from the
+coefficients of the model it extends (or reduces), and the candidates at each
+step are fit in a pool of processes.
+"""
+import functools
+import itertools
+import warnings
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple, Union
+
+import numpy
+import pandas
+import statsmodels.api as sm
+from scipy import stats
+from statsmodels.tools.sm_exceptions import (
+    ConvergenceWarning,
+    HessianInversionWarning,
+)
+
+from asf_installer_survey import logger
+from asf_installer_survey.utils.cache import (
+    dataset_fingerprint,
+    hash_key,
+    load_cached,
+    save_cached,
+)
+from asf_installer_survey.utils.instrumentation import instrumented
+from asf_installer_survey.utils.lookups import QuestionNumbers as col
+from asf_installer_survey.utils.parallel import process_map
+from asf_installer_survey.utils.questions import column_kind, MULTI_SELECT
+from asf_installer_survey.utils.routing import identify_subpopulation
+
+SUBPOPULATION = "subpopulation"
+INTERCEPT = "Intercept"
+MISSING = "Missing"
+
+# Block names mapped to their column, or columns to combine (taking the
+# first answered).
+BLOCKS: Dict[str, Union[str, List[str]]] = {
+    "subpopulation": SUBPOPULATION,
+    "sector_experience": col.q3,
+    "heat_pump_experience": col.q4,
+    "nation": col.q8,
+    "mcs_certified": [col.q21a, col.q21b, col.q21c],
+}
+
+METHODS = ["forward", "backward", "exhaustive"]
+CRITERIA = ["aic", "bic"]
+
+# Bump to invalidate cached fits after changing how models are fit.
+_FIT_VERSION = 1
+
+
+def design_matrix(
+    data: pandas.DataFrame, blocks: Dict[str, Union[str, List[str]]] = BLOCKS
+) -> Tuple[pandas.DataFrame, Dict[str, List[str]]]:
+    """Encode candidate predictor blocks as a design matrix.
+
+    Single select blocks are dummy coded against their first level, with
+    missing answers as a level of their own (so every model is fit to the
+    same respondents). Multi-select blocks have one indicator per option.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        blocks (Dict[str, Union[str, List[str]]]): Block names mapped to their
+            column (or columns to combine). Use `SUBPOPULATION` for
+            respondents' subpopulation.
+
+    Returns:
+        Tuple[pandas.DataFrame, Dict[str, List[str]]]: Design matrix with an
+            intercept column, and each block's columns in it.
+    """
+    frames = [pandas.DataFrame({INTERCEPT: 1.0}, index=data.index)]
+    block_columns = {}
+    for name, columns in blocks.items():
+        answers = _block_answers(data, columns)
+        if column_kind(answers) == MULTI_SELECT:
+            exploded = answers.explode().dropna()
+            dummies = pandas.crosstab(exploded.index, exploded).reindex(
+                data.index, fill_value=0
+            )
+            dummies = (dummies > 0).astype(float)
+        else:
+            levels = answers.astype(object).where(answers.notna(), MISSING)
+            dummies = pandas.get_dummies(levels, dtype=float).iloc[:, 1:]
+        dummies.columns = [f"{name}[{level}]" for level in dummies.columns]
+        frames.append(dummies)
+        block_columns[name] = list(dummies.columns)
+    return pandas.concat(frames, axis=1), block_columns
+
+
+def fit_logit(
+    design: pandas.DataFrame,
+    outcome: numpy.ndarray,
+    columns: List[str],
+    start: Optional[pandas.Series] = None,
+) -> dict:
+    """Fit a logit model on some columns of a design matrix.
+
+    Args:
+        design (pandas.DataFrame): Design matrix from `design_matrix`.
+        outcome (numpy.ndarray): Binary outcome for each row.
+        columns (List[str]): Design columns to include.
+        start (Optional[pandas.Series]): Starting coefficients, by column.
+            Columns without one start from zero.
+
+    Returns:
+        dict: The fit's `params`, `bse`, `log_likelihood`, number of
+            parameters and observations, and whether it `converged`.
+    """
+    start_params = (
+        None if start is None else start.reindex(columns, fill_value=0.0).to_numpy()
+    )
+    model = sm.Logit(outcome, design[columns].to_numpy())
+    with warnings.catch_warnings():
+        # Non-convergence (e.g. from separation) is reported in the result.
+        warnings.simplefilter("ignore", ConvergenceWarning)
+        warnings.simplefilter("ignore", HessianInversionWarning)
+        try:
+            result = model.fit(
+                start_params=start_params, method="newton", maxiter=100, disp=False
+            )
+        except numpy.linalg.LinAlgError:
+            # Singular Hessian, e.g. from collinear blocks.
+            result = model.fit(
+                start_params=start_params, method="bfgs", maxiter=500, disp=False
+            )
+    return {
+        "params": pandas.Series(result.params, index=columns),
+        "bse": pandas.Series(result.bse, index=columns),
+        "log_likelihood": float(result.llf),
+        "n_parameters": len(columns),
+        "n_observations": int(result.nobs),
+        "converged": bool(result.mle_retvals["converged"]),
+    }
+
+
+@instrumented
+def search_models(
+    data: pandas.DataFrame,
+    outcome: Optional[numpy.ndarray] = None,
+    blocks: Dict[str, Union[str, List[str]]] = BLOCKS,
+    method: str = "forward",
+    criterion: str = "aic",
+    include: List[str] = (),
+    n_jobs: Optional[int] = None,
+    use_cache: bool = True,
+) -> pandas.DataFrame:
+    """Search for the best logit model over blocks of predictors.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        outcome (Optional[numpy.ndarray]): Binary outcome. Defaults to
+            whether the response is complete (`q0d`).
+        blocks (Dict[str, Union[str, List[str]]]): Candidate predictor blocks
+            (see `design_matrix`).
+        method (str): "forward" (add the best block while the criterion
+            improves), "backward" (remove the worst block while it improves)
+            or "exhaustive" (fit every combination of blocks).
+        criterion (str): "aic" or "bic", to choose between models.
+        include (List[str]): Blocks to include in every model.
+        n_jobs (Optional[int]): Worker processes for fitting candidates.
+        use_cache (bool): Whether to reuse and save fits in the disk cache.
+
+    Returns:
+        pandas.DataFrame: Every model fit, best first, with its blocks, number
+            of parameters, log likelihood, AIC, BIC, difference in the
+            criterion from the best model, likelihood ratio test against the
+            intercept only model and against the model it was reached from
+            (`parent`), and the search step it was fit at.
+    """
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}, not {method!r}.")
+    if criterion not in CRITERIA:
+        raise ValueError(f"criterion must be one of {CRITERIA}, not {criterion!r}.")
+    if outcome is None:
+        outcome = (data[col.q0d] == "Complete").to_numpy()
+    if SUBPOPULATION in blocks.values() and SUBPOPULATION not in data:
+        data = data.assign(**{SUBPOPULATION: identify_subpopulation(data)})
+
+    design, block_columns = design_matrix(data, blocks)
+    outcome = numpy.asarray(outcome, dtype=float)
+    search = _Search(design, outcome, block_columns, criterion, n_jobs, use_cache)
+
+    required = frozenset(include)
+    candidates = frozenset(blocks) - required
+    if method == "forward":
+        search.stepwise(
+            required, lambda model: [model | {b} for b in candidates - model]
+        )
+    elif method == "backward":
+        search.stepwise(
+            required | candidates, lambda model: [model - {b} for b in model - required]
+        )
+    else:
+        search.exhaustive(required, candidates)
+    return search.ranking()
+
+
+class _Search:
+    # Fits models over a shared design, memoised by predictor set.
+
+    def __init__(
+        self,
+        design: pandas.DataFrame,
+        outcome: numpy.ndarray,
+        block_columns: Dict[str, List[str]],
+        criterion: str,
+        n_jobs: Optional[int],
+        use_cache: bool,
+    ):
+        self.design = design
+        self.outcome = outcome
+        self.block_columns = block_columns
+        self.criterion = criterion
+        self.n_jobs = n_jobs
+        self.use_cache = use_cache
+        self.fits: Dict[FrozenSet[str], dict] = {}
+        self.parents: Dict[FrozenSet[str], Optional[FrozenSet[str]]] = {}
+        self.steps: Dict[FrozenSet[str], int] = {}
+        self.design_key = dataset_fingerprint(design.assign(_outcome=outcome))
+
+    def stepwise(
+        self,
+        start: FrozenSet[str],
+        neighbours: Callable[[FrozenSet[str]], List[FrozenSet[str]]],
+    ) -> None:
+        # Move to the best neighbouring model while it improves the criterion.
+        self.fit([(start, None)], step=0)
+        current, step = start, 0
+        while True:
+            step += 1
+            models = neighbours(current)
+            if not models:
+                break
+            self.fit([(model, current) for model in models], step)
+            best = min(models, key=self.score)
+            if self.score(best) >= self.score(current):
+                break
+            current = best
+
+    def exhaustive(self, required: FrozenSet[str], candidates: FrozenSet[str]) -> None:
+        # Fit by size, warm-starting each model from one a block smaller.
+        self.fit([(required, None)], step=0)
+        for size in range(1, len(candidates) + 1):
+            models = [
+                required | set(blocks)
+                for blocks in itertools.combinations(sorted(candidates), size)
+            ]
+            self.fit(
+                [
+                    (model, required | set(sorted(model - required)[1:]))
+                    for model in models
+                ],
+                step=size,
+            )
+
+    def fit(
+        self, models: List[Tuple[FrozenSet[str], Optional[FrozenSet[str]]]], step: int
+    ) -> None:
+        # Fit models not yet fit, each warm-started from its parent's fit.
+        keys = {model: self._key(model) for model, _ in models}
+        n_memoised = sum(model in self.fits for model, _ in models)
+        stale = []
+        for model, parent in models:
+            if model in self.fits:
+                continue
+            self.parents[model] = parent
+            self.steps[model] = step
+            cached = load_cached("logit_fits", keys[model]) if self.use_cache else None
+            if cached is not None:
+                self.fits[model] = cached
+            else:
+                stale.append((model, parent))
+
+        tasks = [
+            (
+                self._columns(model),
+                None if parent is None else self.fits[parent]["params"],
+            )
+            for model, parent in stale
+        ]
+        fit = functools.partial(_fit_task, self.design, self.outcome)
+        for (model, _), result in zip(stale, process_map(fit, tasks, self.n_jobs)):
+            self.fits[model] = result
+            if self.use_cache:
+                save_cached("logit_fits", keys[model], result)
+        logger.info(
+            f"Model search step {step}: fit {len(stale)} of {len(models)} models "
+            f"({n_memoised} memoised, {len(models) - len(stale) - n_memoised} cached)."
+        )
+
+    def score(self, model: FrozenSet[str]) -> float:
+        fit = self.fits[model]
+        penalty = 2 if self.criterion == "aic" else numpy.log(fit["n_observations"])
+        return -2 * fit["log_likelihood"] + penalty * fit["n_parameters"]
+
+    def ranking(self) -> pandas.DataFrame:
+        null = self.fits.get(frozenset()) or _fit_task(
+            self.design, self.outcome, ([INTERCEPT], None)
+        )
+        rows = []
+        for model, fit in self.fits.items():
+            parent = self.parents.get(model)
+            n, k, llf = (
+                fit["n_observations"],
+                fit["n_parameters"],
+                fit["log_likelihood"],
+            )
+            row = {
+                "blocks": " + ".join(sorted(model)) or INTERCEPT,
+                "n_blocks": len(model),
+                "n_parameters": k,
+                "log_likelihood": llf,
+                "aic": -2 * llf + 2 * k,
+                "bic": -2 * llf + numpy.log(n) * k,
+                "converged": fit["converged"],
+                "step": self.steps[model],
+                "parent": (
+                    None if parent is None else " + ".join(sorted(parent)) or INTERCEPT
+                ),
+            }
+            row["lr_statistic"], row["lr_p_value"] = _likelihood_ratio(fit, null)
+            if parent is not None:
+                _, row["parent_lr_p_value"] = _likelihood_ratio(fit, self.fits[parent])
+            rows.append(row)
+
+        ranking = pandas.DataFrame(rows).sort_values(self.criterion, ignore_index=True)
+        ranking.insert(
+            6,
+            f"delta_{self.criterion}",
+            ranking[self.criterion] - ranking[self.criterion].min(),
+        )
+        return ranking
+
+    def _columns(self, model: FrozenSet[str]) -> List[str]:
+        return [INTERCEPT] + [
+            column
+            for block in self.block_columns
+            if block in model
+            for column in self.block_columns[block]
+        ]
+
+    def _key(self, model: FrozenSet[str]) -> str:
+        return hash_key(_FIT_VERSION, self.design_key, self._columns(model))
+
+
+def _fit_task(
+    design: pandas.DataFrame,
+    outcome: numpy.ndarray,
+    task: Tuple[List[str], Optional[pandas.Series]],
+) -> dict:
+    return fit_logit(design, outcome, *task)
+
+
+def _likelihood_ratio(fit: dict, other: dict) -> Tuple[float, float]:
+    # Test of the larger of two nested models against the smaller.
+    statistic = 2 * abs(fit["log_likelihood"] - other["log_likelihood"])
+    df = abs(fit["n_parameters"] - other["n_parameters"])
+    if df == 0:
+        return 0.0, numpy.nan
+    return statistic, float(stats.chi2.sf(statistic, df))
+
+
+def _block_answers(
+    data: pandas.DataFrame, columns: Union[str, List[str]]
+) -> pandas.Series:
+    if isinstance(columns, str):
+        return data[columns]
+    answers = data[columns[0]].astype(object)
+    for column in columns[1:]:
+        answers = answers.combine_first(data[column].astype(object))
+    return answers
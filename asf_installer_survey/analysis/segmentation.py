@@ -0,0 +1,485 @@
+"""Segment installers by business profile with mini-batch k-modes.
+
+Each respondent's profile is their answers to a set of single select
+questions (encoded as category codes, with missing answers as a category of
+their own) and multi-select questions (encoded as packed bitsets of the
+options selected). The distance between two profiles is the Hamming distance:
+the number of single select questions answered differently plus the number of
+options selected by one and not the other, which is the popcount of the XOR of
+their bitsets.
+
+k-modes clusters profiles around k modes, each the most common category of
+every single select question and the majority choice of every option among
+its members. Mini-batch k-modes updates the modes from small random batches
+of respondents, accumulating each cluster's category and option counts across
+batches, so each step costs the same however many respondents there are. Only
+the final assignment touches every respondent, a chunk at a time, so memory
+is bounded by the chunk size rather than the number of respondents.
+
+k-modes finds a local optimum, so it's fit from several random starts (run in
+a pool of processes) and the lowest cost fit kept. `segment_installers` does
+this for a range of k, choosing the k whose fit has the highest silhouette on
+a sample of respondents. The profiles are handed to each worker once, when
+it starts, and fits are compared by their cost on a common sample of
+respondents rather than on all of them. A k with more clusters than there
+are distinct profiles is skipped.
+"""
+import functools
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy
+import pandas
+
+from asf_installer_survey import logger
+from asf_installer_survey.utils.encoding import (
+    category_codes,
+    multi_select_indicators,
+    pack_bitsets,
+    unpack_bitsets,
+)
+from asf_installer_survey.utils.instrumentation import instrumented
+from asf_installer_survey.utils.lookups import QuestionNumbers as col
+from asf_installer_survey.utils.parallel import process_map
+from asf_installer_survey.utils.questions import (
+    answer_columns,
+    column_kind,
+    MULTI_SELECT,
+)
+
+SEGMENT = "segment"
+
+PROFILE_COLUMNS = [
+    col.q3,
+    col.q4,
+    col.q6a,
+    col.q14a,
+    col.q14b,
+    col.q11a,
+    col.q11b,
+    col.q11c,
+    *answer_columns("q16a"),
+    *answer_columns("q16b"),
+    col.q22a,
+    col.q22b,
+    col.q22c,
+    *answer_columns("q107"),
+    *answer_columns("q112"),
+]
+
+BATCH_SIZE = 1024
+CHUNK_SIZE = 65_536
+COST_SAMPLE = 20_000
+SILHOUETTE_SAMPLE = 2000
+
+# Number of set bits in each byte value.
+_POPCOUNT = numpy.array(
+    [bin(byte).count("1") for byte in range(256)], dtype=numpy.uint8
+)
+
+
+class Profiles(NamedTuple):
+    """Encoded respondent profiles.
+
+    Attributes:
+        codes: Single select codes, one column per question, with missing
+            answers coded as 0 and categories from 1.
+        bitsets: Packed option bitsets, concatenated across multi-select
+            questions.
+        single_selects: The single select columns and their categories.
+        multi_selects: The multi-select columns and their options.
+    """
+
+    codes: numpy.ndarray
+    bitsets: numpy.ndarray
+    single_selects: Dict[str, List]
+    multi_selects: Dict[str, List]
+
+
+class KModes(NamedTuple):
+    """A k-modes clustering.
+
+    Attributes:
+        codes: Each cluster's modal single select codes.
+        bitsets: Each cluster's modal option bitsets.
+        cost: Total distance of respondents (or of the sample the fit was
+            scored on) to their nearest mode.
+        seed: Seed of the fit's random start.
+    """
+
+    codes: numpy.ndarray
+    bitsets: numpy.ndarray
+    cost: float
+    seed: int
+
+
+class Segmentation(NamedTuple):
+    """Installer segments.
+
+    Attributes:
+        segments: Each respondent's segment, as a categorical.
+        model: The chosen clustering.
+        selection: Cost and silhouette of the best fit for each k tried.
+        profiles: Each segment's size and modal answers.
+    """
+
+    segments: pandas.Series
+    model: KModes
+    selection: pandas.DataFrame
+    profiles: pandas.DataFrame
+
+
+def encode_profiles(
+    data: pandas.DataFrame, columns: List[str] = PROFILE_COLUMNS
+) -> Profiles:
+    """Encode respondents' answers to profile questions.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        columns (List[str]): Single select and multi-select columns.
+
+    Returns:
+        Profiles: The encoded profiles.
+    """
+    codes, bitsets, single_selects, multi_selects = [], [], {}, {}
+    for column in columns:
+        if column_kind(data[column]) == MULTI_SELECT:
+            indicators, multi_selects[column] = multi_select_indicators(data[column])
+            bitsets.append(indicators)
+        else:
+            values, single_selects[column] = category_codes(data[column])
+            codes.append(values + 1)
+    return Profiles(
+        codes=(
+            numpy.column_stack(codes).astype(numpy.int16)
+            if codes
+            else numpy.zeros((len(data), 0), dtype=numpy.int16)
+        ),
+        bitsets=pack_bitsets(
+            numpy.hstack(bitsets) if bitsets else numpy.zeros((len(data), 0), bool)
+        ),
+        single_selects=single_selects,
+        multi_selects=multi_selects,
+    )
+
+
+def hamming_distances(
+    codes: numpy.ndarray,
+    bitsets: numpy.ndarray,
+    mode_codes: numpy.ndarray,
+    mode_bitsets: numpy.ndarray,
+) -> numpy.ndarray:
+    """Compute the Hamming distance of each profile to each mode.
+
+    Args:
+        codes (numpy.ndarray): Profiles' single select codes.
+        bitsets (numpy.ndarray): Profiles' packed option bitsets.
+        mode_codes (numpy.ndarray): Modes' single select codes.
+        mode_bitsets (numpy.ndarray): Modes' packed option bitsets.
+
+    Returns:
+        numpy.ndarray: Array of shape (len(codes), len(mode_codes)).
+    """
+    distances = (codes[:, None, :] != mode_codes[None, :, :]).sum(
+        axis=2, dtype=numpy.int32
+    )
+    distances += _POPCOUNT[bitsets[:, None, :] ^ mode_bitsets[None, :, :]].sum(
+        axis=2, dtype=numpy.int32
+    )
+    return distances
+
+
+def assign_clusters(
+    profiles: Profiles, model: KModes, chunk_size: int = CHUNK_SIZE
+) -> numpy.ndarray:
+    """Assign each profile to its nearest mode, a chunk at a time."""
+    return _assign(profiles.codes, profiles.bitsets, model, chunk_size)[0]
+
+
+def fit_kmodes(
+    profiles: Profiles,
+    k: int,
+    batch_size: int = BATCH_SIZE,
+    max_batches: int = 100,
+    patience: int = 10,
+    seed: int = 0,
+    chunk_size: int = CHUNK_SIZE,
+    scored: Optional[Profiles] = None,
+) -> KModes:
+    """Cluster profiles with mini-batch k-modes from one random start.
+
+    Args:
+        profiles (Profiles): Encoded profiles.
+        k (int): Number of clusters.
+        batch_size (int): Respondents per batch.
+        max_batches (int): Most batches to update the modes from.
+        patience (int): Stop once this many batches in a row leave the modes
+            unchanged.
+        seed (int): Seed for the random start and batches.
+        chunk_size (int): Respondents per chunk in the final assignment.
+        scored (Optional[Profiles]): Profiles to compute the cost on, e.g. a
+            sample of `profiles`. Defaults to `profiles`.
+
+    Raises:
+        ValueError: If there are fewer distinct profiles than clusters.
+
+    Returns:
+        KModes: The clustering.
+    """
+    codes, bitsets = profiles.codes, profiles.bitsets
+    n_bits = sum(len(options) for options in profiles.multi_selects.values())
+    n_categories = [len(c) + 1 for c in profiles.single_selects.values()]
+    rng = numpy.random.default_rng(seed)
+
+    # Start from k distinct profiles drawn at random.
+    sample = rng.choice(
+        len(codes), min(len(codes), max(batch_size, 10 * k)), replace=False
+    )
+    _, first = numpy.unique(
+        _profile_bytes(codes[sample], bitsets[sample]), axis=0, return_index=True
+    )
+    if len(first) < k:
+        # Too few in the sample, so start from any of the profiles.
+        sample = numpy.arange(len(codes))
+        _, first = numpy.unique(
+            _profile_bytes(codes, bitsets), axis=0, return_index=True
+        )
+    if len(first) < k:
+        raise ValueError(f"Fewer than {k} distinct profiles to start from.")
+    start = sample[rng.choice(first, k, replace=False)]
+    mode_codes, mode_bitsets = codes[start].copy(), bitsets[start].copy()
+
+    # Counts of each category and option in each cluster, starting from one
+    # member (its mode) each.
+    code_counts = [numpy.zeros((k, n), dtype=numpy.float64) for n in n_categories]
+    for j, counts in enumerate(code_counts):
+        counts[numpy.arange(k), mode_codes[:, j]] = 1
+    bit_counts = unpack_bitsets(mode_bitsets, n_bits).astype(numpy.float64)
+    sizes = numpy.ones(k)
+
+    unchanged = 0
+    for _ in range(max_batches):
+        batch = rng.choice(len(codes), min(batch_size, len(codes)), replace=False)
+        labels = hamming_distances(
+            codes[batch], bitsets[batch], mode_codes, mode_bitsets
+        ).argmin(axis=1)
+        members = (labels[None, :] == numpy.arange(k)[:, None]).astype(float)
+        for j, counts in enumerate(code_counts):
+            counts += members @ (
+                codes[batch, j][:, None] == numpy.arange(n_categories[j])
+            )
+        bit_counts += members @ unpack_bitsets(bitsets[batch], n_bits)
+        sizes += members.sum(axis=1)
+
+        new_codes = numpy.column_stack(
+            [counts.argmax(axis=1) for counts in code_counts]
+            or [numpy.zeros((k, 0), dtype=numpy.int16)]
+        ).astype(numpy.int16)
+        new_bitsets = pack_bitsets(bit_counts * 2 > sizes[:, None])
+        if numpy.array_equal(new_codes, mode_codes) and numpy.array_equal(
+            new_bitsets, mode_bitsets
+        ):
+            unchanged += 1
+            if unchanged >= patience:
+                break
+        else:
+            unchanged = 0
+        mode_codes, mode_bitsets = new_codes, new_bitsets
+
+    model = KModes(mode_codes, mode_bitsets, 0.0, seed)
+    scored = profiles if scored is None else scored
+    _, distances = _assign(scored.codes, scored.bitsets, model, chunk_size)
+    return model._replace(cost=float(distances.sum()))
+
+
+@instrumented
+def segment_installers(
+    data: pandas.DataFrame,
+    ks: Sequence[int] = range(2, 9),
+    columns: List[str] = PROFILE_COLUMNS,
+    n_restarts: int = 8,
+    batch_size: int = BATCH_SIZE,
+    max_batches: int = 100,
+    seed: int = 0,
+    n_jobs: Optional[int] = None,
+) -> Segmentation:
+    """Segment respondents by business profile, choosing the number of segments.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        ks (Sequence[int]): Numbers of segments to try.
+        columns (List[str]): Single select and multi-select profile columns.
+        n_restarts (int): Random starts per k.
+        batch_size (int): Respondents per mini-batch.
+        max_batches (int): Most mini-batches per fit.
+        seed (int): Seed the fits' random starts are spawned from.
+        n_jobs (Optional[int]): Number of worker processes.
+
+    Raises:
+        ValueError: If there are fewer distinct profiles than every k.
+
+    Returns:
+        Segmentation: Segments from the k with the highest silhouette.
+    """
+    profiles = encode_profiles(data, columns)
+    n_distinct = len(
+        numpy.unique(_profile_bytes(profiles.codes, profiles.bitsets), axis=0)
+    )
+    skipped = [k for k in ks if k > n_distinct]
+    ks = [k for k in ks if k <= n_distinct]
+    if skipped:
+        logger.warning(f"Skipping k = {skipped}: only {n_distinct} distinct profiles.")
+    if not ks:
+        raise ValueError(f"Only {n_distinct} distinct profiles to segment.")
+
+    rng = numpy.random.default_rng(seed)
+    scored = rng.choice(len(data), min(len(data), COST_SAMPLE), replace=False)
+    seeds = numpy.random.SeedSequence(seed).generate_state(len(ks) * n_restarts)
+    fits = [(k, int(s)) for k, s in zip(numpy.repeat(ks, n_restarts), seeds)]
+    try:
+        models = process_map(
+            functools.partial(
+                _fit_task, batch_size=batch_size, max_batches=max_batches
+            ),
+            fits,
+            n_jobs,
+            initializer=_share_profiles,
+            initargs=(profiles, _subset(profiles, numpy.sort(scored))),
+        )
+    finally:
+        _share_profiles(None, None)
+
+    # The lowest cost fit for each k, scored on the same sample.
+    sample = rng.choice(len(data), min(len(data), SILHOUETTE_SAMPLE), replace=False)
+    distances = hamming_distances(
+        profiles.codes[sample],
+        profiles.bitsets[sample],
+        profiles.codes[sample],
+        profiles.bitsets[sample],
+    )
+    best, rows = {}, []
+    for (k, _), model in zip(fits, models):
+        if k not in best or model.cost < best[k].cost:
+            best[k] = model
+    for k, model in best.items():
+        labels, _ = _assign(
+            profiles.codes[sample], profiles.bitsets[sample], model, CHUNK_SIZE
+        )
+        rows.append((k, model.cost, _silhouette(distances, labels), model.seed))
+    selection = pandas.DataFrame(rows, columns=["k", "cost", "silhouette", "seed"])
+
+    chosen = int(selection.loc[selection["silhouette"].idxmax(), "k"])
+    model = best[chosen]
+    labels = assign_clusters(profiles, model)
+    logger.info(f"Chose {chosen} segments from k = {ks}.")
+    segments = pandas.Series(
+        pandas.Categorical(labels, categories=range(chosen)),
+        index=data.index,
+        name=SEGMENT,
+    )
+    return Segmentation(
+        segments=segments,
+        model=model,
+        selection=selection,
+        profiles=describe_segments(profiles, model, labels),
+    )
+
+
+def describe_segments(
+    profiles: Profiles, model: KModes, labels: numpy.ndarray
+) -> pandas.DataFrame:
+    """Describe each segment by its size and modal answers.
+
+    Args:
+        profiles (Profiles): Encoded profiles.
+        model (KModes): The clustering.
+        labels (numpy.ndarray): Each respondent's cluster.
+
+    Returns:
+        pandas.DataFrame: A row per segment with its size, and a column per
+            profile question of its modal answer (None for missing) or
+            options selected by most of its members.
+    """
+    n_bits = sum(len(options) for options in profiles.multi_selects.values())
+    bits = unpack_bitsets(model.bitsets, n_bits)
+    frame = {SEGMENT: numpy.arange(len(model.codes))}
+    frame["size"] = numpy.bincount(labels, minlength=len(model.codes))
+    for j, (column, categories) in enumerate(profiles.single_selects.items()):
+        answers = [None] + list(categories)
+        frame[column] = [answers[code] for code in model.codes[:, j]]
+    start = 0
+    for column, options in profiles.multi_selects.items():
+        frame[column] = [
+            [options[i] for i in numpy.flatnonzero(row)]
+            for row in bits[:, start : start + len(options)]
+        ]
+        start += len(options)
+    return pandas.DataFrame(frame)
+
+
+# Profiles shared with the fits run in a worker, and the sample they're
+# scored on, set once per worker by `_share_profiles`.
+_shared: Dict[str, Optional[Profiles]] = {"profiles": None, "scored": None}
+
+
+def _share_profiles(profiles: Optional[Profiles], scored: Optional[Profiles]) -> None:
+    _shared.update(profiles=profiles, scored=scored)
+
+
+def _fit_task(fit, batch_size: int, max_batches: int) -> KModes:
+    k, seed = fit
+    return fit_kmodes(
+        _shared["profiles"],
+        k,
+        batch_size=batch_size,
+        max_batches=max_batches,
+        seed=seed,
+        scored=_shared["scored"],
+    )
+
+
+def _subset(profiles: Profiles, rows: numpy.ndarray) -> Profiles:
+    return profiles._replace(codes=profiles.codes[rows], bitsets=profiles.bitsets[rows])
+
+
+def _profile_bytes(codes: numpy.ndarray, bitsets: numpy.ndarray) -> numpy.ndarray:
+    # Each profile's codes and bitsets as one row of bytes, to find distinct
+    # profiles with `numpy.unique(..., axis=0)`.
+    return numpy.hstack([codes.view(numpy.uint8), bitsets])
+
+
+def _assign(codes, bitsets, model: KModes, chunk_size: int):
+    # Nearest mode and distance to it, for a chunk of profiles at a time.
+    labels = numpy.empty(len(codes), dtype=numpy.int64)
+    distances = numpy.empty(len(codes), dtype=numpy.int64)
+    for start in range(0, len(codes), chunk_size):
+        chunk = slice(start, start + chunk_size)
+        distance = hamming_distances(
+            codes[chunk], bitsets[chunk], model.codes, model.bitsets
+        )
+        labels[chunk] = distance.argmin(axis=1)
+        distances[chunk] = distance.min(axis=1)
+    return labels, distances
+
+
+def _silhouette(distances: numpy.ndarray, labels: numpy.ndarray) -> float:
+    # Mean silhouette of a sample, from its pairwise distances.
+    k = labels.max() + 1
+    members = labels[None, :] == numpy.arange(k)[:, None]
+    sizes = members.sum(axis=1)
+    # Mean distance from each profile to each cluster, excluding itself.
+    totals = distances @ members.T.astype(float)
+    own = sizes[labels] - 1
+    within = numpy.divide(
+        totals[numpy.arange(len(labels)), labels],
+        own,
+        out=numpy.zeros(len(labels)),
+        where=own > 0,
+    )
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        means = numpy.where(sizes > 0, totals / sizes, numpy.inf)
+    means[numpy.arange(len(labels)), labels] = numpy.inf
+    nearest = means.min(axis=1)
+    scores = numpy.where(
+        own > 0, (nearest - within) / numpy.maximum(nearest, within), 0.0
+    )
+    return float(scores.mean())
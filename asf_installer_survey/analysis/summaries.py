@@ -0,0 +1,307 @@
+"""Frequency summaries for each type of survey question.
+
+Every summary returns a long format table of counts and proportions, with an
+optional split by a grouping column such as subpopulation. Proportions are of
+respondents in the group who answered the question, given as each row's
+`respondents`. `split_independence` tests whether a split single select
+summary's answers are independent of its groups.
+"""
+from typing import List, Optional, Tuple, Union
+
+import numpy
+import pandas
+from scipy import sparse
+
+from asf_installer_survey.analysis.independence import (
+    CrosstabTest,
+    independence_test,
+    MIN_EXPECTED,
+    N_PERMUTATIONS,
+)
+from asf_installer_survey.getters.survey_data import get_waves, WAVE
+from asf_installer_survey.utils.answers import is_answered
+from asf_installer_survey.utils.encoding import (
+    category_codes,
+    grid_codes,
+    multi_select_indicators,
+)
+from asf_installer_survey.utils.questions import (
+    answer_columns,
+    FREE_TEXT,
+    GRID,
+    MULTI_SELECT,
+    question_columns,
+    question_kind,
+    stable_question_ids,
+)
+
+ALL = "All"
+
+
+def single_select_frequencies(
+    data: pandas.DataFrame,
+    column: str,
+    by: Optional[Union[str, List[str]]] = None,
+) -> pandas.DataFrame:
+    """Count the answers to a single select question.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        column (str): Question column.
+        by (Optional[Union[str, List[str]]]): Column(s) to split counts by.
+
+    Returns:
+        pandas.DataFrame: Count and proportion of each answer, and the
+            respondents answering, by group.
+    """
+    codes, categories = category_codes(data[column])
+    groups, labels = group_codes(data, by)
+    answered = codes >= 0
+    counts = numpy.bincount(
+        groups[answered] * len(categories) + codes[answered],
+        minlength=len(labels) * len(categories),
+    ).reshape(len(labels), len(categories))
+    return _long_format(counts, labels, categories, "answer", counts.sum(axis=1))
+
+
+def multi_select_frequencies(
+    data: pandas.DataFrame,
+    column: str,
+    by: Optional[Union[str, List[str]]] = None,
+) -> pandas.DataFrame:
+    """Count the options selected in a multi-select question.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        column (str): Question column.
+        by (Optional[Union[str, List[str]]]): Column(s) to split counts by.
+
+    Returns:
+        pandas.DataFrame: Count of respondents selecting each option and as a
+            proportion of respondents who selected any option (and their
+            number), by group.
+    """
+    indicators, options = multi_select_indicators(data[column])
+    groups, labels = group_codes(data, by)
+    membership = _membership(groups, len(labels))
+    counts = membership @ indicators.astype(numpy.int64)
+    respondents = membership @ indicators.any(axis=1).astype(numpy.int64)
+    return _long_format(counts, labels, options, "option", respondents)
+
+
+def grid_frequencies(
+    data: pandas.DataFrame,
+    columns: List[str],
+    by: Optional[Union[str, List[str]]] = None,
+) -> pandas.DataFrame:
+    """Count the answers to each item of a grid question.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        columns (List[str]): Grid item columns.
+        by (Optional[Union[str, List[str]]]): Column(s) to split counts by.
+
+    Returns:
+        pandas.DataFrame: Count and proportion of each answer to each item,
+            and the respondents answering it, by group.
+    """
+    codes, categories = grid_codes(data, columns)
+    groups, labels = group_codes(data, by)
+    frames = []
+    for i, column in enumerate(columns):
+        answered = codes[:, i] >= 0
+        counts = numpy.bincount(
+            groups[answered] * len(categories) + codes[answered, i],
+            minlength=len(labels) * len(categories),
+        ).reshape(len(labels), len(categories))
+        frame = _long_format(counts, labels, categories, "answer", counts.sum(axis=1))
+        frame.insert(1, "item", column)
+        frames.append(frame)
+    return pandas.concat(frames, ignore_index=True)
+
+
+def free_text_summary(
+    data: pandas.DataFrame,
+    column: str,
+    by: Optional[Union[str, List[str]]] = None,
+) -> pandas.DataFrame:
+    """Count the free text responses to a question.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        column (str): Free text column.
+        by (Optional[Union[str, List[str]]]): Column(s) to split counts by.
+
+    Returns:
+        pandas.DataFrame: Number of responses and of distinct responses, by
+            group.
+    """
+    groups, labels = group_codes(data, by)
+    answered = is_answered(data[column])
+    text = data[column].to_numpy()[answered]
+    distinct = pandas.Series(text).groupby(groups[answered]).nunique()
+    return pandas.DataFrame(
+        {
+            "group": labels,
+            "responses": numpy.bincount(groups[answered], minlength=len(labels)),
+            "distinct_responses": distinct.reindex(range(len(labels)), fill_value=0),
+        }
+    )
+
+
+def summarise_question(
+    data: pandas.DataFrame,
+    number: str,
+    by: Optional[Union[str, List[str]]] = None,
+) -> pandas.DataFrame:
+    """Summarise a question with the summary appropriate to its type.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        number (str): Question number, e.g. "q16a".
+        by (Optional[Union[str, List[str]]]): Column(s) to split counts by.
+
+    Returns:
+        pandas.DataFrame: The question summary.
+    """
+    kind = question_kind(data, number)
+    columns = answer_columns(number)
+    if kind == GRID:
+        return grid_frequencies(data, columns, by)
+    if kind == MULTI_SELECT:
+        return multi_select_frequencies(data, columns[0], by)
+    if kind == FREE_TEXT:
+        return free_text_summary(data, columns[0], by)
+    return single_select_frequencies(data, columns[0], by)
+
+
+def summarise_across_waves(
+    number: str,
+    waves: Optional[List[str]] = None,
+    by: Optional[Union[str, List[str]]] = None,
+) -> pandas.DataFrame:
+    """Summarise a question across survey waves in one grouped pass.
+
+    Only the question's columns (and any grouping columns) are loaded.
+
+    Args:
+        number (str): Question number, e.g. "q16a".
+        waves (Optional[List[str]]): Waves to include. Defaults to all.
+        by (Optional[Union[str, List[str]]]): Stable IDs of columns to split
+            by within each wave, e.g. "q5".
+
+    Returns:
+        pandas.DataFrame: The question summary, grouped by wave.
+    """
+    columns = question_columns(number)
+    by = [] if by is None else [by] if isinstance(by, str) else list(by)
+    stable_ids = stable_question_ids()
+    questions = [
+        stable_id for stable_id, column in stable_ids.items() if column in columns
+    ]
+    data = get_waves(questions + by, waves=waves)
+    return summarise_question(data, number, [WAVE] + [stable_ids[i] for i in by])
+
+
+def split_independence(
+    summary: pandas.DataFrame,
+    item: Optional[str] = None,
+    min_expected: float = MIN_EXPECTED,
+    n_permutations: int = N_PERMUTATIONS,
+    seed=None,
+) -> CrosstabTest:
+    """Test a split summary's answers for independence of its groups.
+
+    The chi-squared test is used if every expected count reaches
+    `min_expected`, and otherwise its exact p value is estimated by Monte
+    Carlo (see `analysis.independence`).
+
+    Args:
+        summary (pandas.DataFrame): Single select or grid summary, split by a
+            grouping column.
+        item (Optional[str]): Grid item column to test, for grid summaries.
+        min_expected (float): Use the asymptotic test only if every expected
+            count is at least this.
+        n_permutations (int): Number of shuffled tables for Monte Carlo tests.
+        seed: Seed (or `numpy.random.SeedSequence`) for Monte Carlo tests.
+
+    Raises:
+        ValueError: If the summary isn't of single select answers (e.g. it's
+            of a multi-select question's options, which respondents can
+            select several of), or is of a grid and no item is given.
+
+    Returns:
+        CrosstabTest: The group by answer crosstab and its test.
+    """
+    if "answer" not in summary:
+        raise ValueError("Only summaries of single select answers can be tested.")
+    if "item" in summary:
+        if item is None:
+            raise ValueError("Give the grid item to test.")
+        summary = summary[summary["item"] == item]
+    table = summary.pivot_table(
+        index="group", columns="answer", values="count", aggfunc="sum", sort=False
+    )
+    return independence_test(table, min_expected, n_permutations, seed)
+
+
+def group_codes(
+    data: pandas.DataFrame, by: Optional[Union[str, List[str]]]
+) -> Tuple[numpy.ndarray, List]:
+    """Encode respondents' groups for splitting counts.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        by (Optional[Union[str, List[str]]]): Column(s) to group by. If None,
+            every respondent is in one group, `ALL`.
+
+    Returns:
+        Tuple[numpy.ndarray, List]: Integer group code of each respondent and
+            the group labels, with respondents missing a group placed in a
+            final "Missing" group.
+    """
+    if by is None:
+        return numpy.zeros(len(data), dtype=numpy.int64), [ALL]
+    if not isinstance(by, str):
+        grouped = data.groupby(list(by), observed=True, dropna=False, sort=True)
+        labels = [
+            " / ".join(map(str, key if isinstance(key, tuple) else (key,)))
+            for key in grouped.groups
+        ]
+        return grouped.ngroup().to_numpy(dtype=numpy.int64), labels
+    codes, labels = category_codes(data[by].astype("category"))
+    codes = codes.astype(numpy.int64)
+    if (codes >= 0).all():
+        return codes, labels
+    return numpy.where(codes >= 0, codes, len(labels)), labels + ["Missing"]
+
+
+def _membership(groups: numpy.ndarray, n_groups: int) -> sparse.csr_matrix:
+    # Sparse group by respondent indicator matrix, for counting by product.
+    return sparse.csr_matrix(
+        (
+            numpy.ones(len(groups), dtype=numpy.int64),
+            (groups, numpy.arange(len(groups))),
+        ),
+        shape=(n_groups, len(groups)),
+    )
+
+
+def _long_format(
+    counts: numpy.ndarray,
+    labels: List,
+    values: List,
+    name: str,
+    denominators: numpy.ndarray,
+) -> pandas.DataFrame:
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        proportions = counts / denominators[:, None]
+    return pandas.DataFrame(
+        {
+            "group": numpy.repeat(labels, len(values)),
+            name: numpy.tile(numpy.array(values, dtype=object), len(labels)),
+            "count": counts.ravel(),
+            "proportion": proportions.ravel(),
+            "respondents": numpy.repeat(denominators, len(values)),
+        }
+    )
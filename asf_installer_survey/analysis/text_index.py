@@ -0,0 +1,382 @@
+"""Inverted index search over "Other" free text answers.
+
+Each answer to an "Other" column is a document. Answers are normalised
+(accents stripped, lower cased) and split into alphanumeric tokens, and every
+token maps to the sorted IDs of the documents containing it. Terms are kept
+sorted, so the terms starting with a prefix are a contiguous range found by
+binary search.
+
+Queries combine terms with `AND`, `OR`, `NOT` and parentheses; adjacent terms
+are ANDed, and a trailing `*` makes a term a prefix, e.g.
+`(hybrid OR air*) AND NOT ground`. Documents carry their respondent's
+response ID, subpopulation and status, so results join back to them without
+the survey data. These are held as numpy arrays, so a query only gathers the
+matching documents' rows.
+
+An index is built once per dataset (keyed by a fingerprint of the columns it
+reads) and saved under the cache directory.
+
+Usage:
+    python -m asf_installer_survey.analysis.text_index <data.parquet> "<query>"
+"""
+import argparse
+import bisect
+import contextlib
+import json
+import os
+import re
+import unicodedata
+import uuid
+from pathlib import Path
+from typing import List, Optional
+
+import numpy
+import pandas
+
+from asf_installer_survey.utils.cache import CACHE_DIR, dataset_fingerprint, hash_key
+from asf_installer_survey.utils.lookups import QuestionNumbers as col
+from asf_installer_survey.utils.questions import (
+    free_text_columns,
+    other_column,
+    question_numbers,
+)
+from asf_installer_survey.utils.routing import identify_subpopulation
+
+INDEX_DIR = CACHE_DIR / "text_index"
+
+# Bump to rebuild saved indexes after changing how they're built.
+_INDEX_VERSION = 1
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_QUERY_TOKEN = re.compile(r"\(|\)|[^\s()]+")
+_OPERATORS = {"AND", "OR", "NOT"}
+
+
+def normalise(text: str) -> str:
+    """Strip accents from text and lower case it."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def tokenise(text: str) -> List[str]:
+    """Split text into normalised alphanumeric tokens."""
+    return _TOKEN.findall(normalise(text))
+
+
+class TextIndex:
+    """An inverted index over free text answers.
+
+    Args:
+        terms (List[str]): Sorted index terms.
+        offsets (numpy.ndarray): Start of each term's postings in `postings`,
+            with the end of the last appended.
+        postings (numpy.ndarray): Document IDs containing each term, sorted
+            within each term.
+        documents (pandas.DataFrame): Each document's response ID, question,
+            column, subpopulation, status and text.
+    """
+
+    def __init__(
+        self,
+        terms: List[str],
+        offsets: numpy.ndarray,
+        postings: numpy.ndarray,
+        documents: pandas.DataFrame,
+    ):
+        self.terms = list(terms)
+        self.offsets = numpy.asarray(offsets, dtype=numpy.int64)
+        self.postings = numpy.asarray(postings, dtype=numpy.int64)
+        self.documents = documents.reset_index(drop=True)
+        self._columns = {
+            column: self.documents[column].to_numpy() for column in self.documents
+        }
+        self._groups = {
+            column: pandas.factorize(self._columns[column])
+            for column in ("question", "subpopulation", "status")
+        }
+        self._positions = {term: i for i, term in enumerate(self.terms)}
+        self._all = numpy.arange(len(self.documents))
+
+    @classmethod
+    def from_data(
+        cls, data: pandas.DataFrame, columns: Optional[List[str]] = None
+    ) -> "TextIndex":
+        """Index free text answers.
+
+        Args:
+            data (pandas.DataFrame): Survey data.
+            columns (Optional[List[str]]): Free text columns to index.
+                Defaults to every "Other" column in `data`.
+
+        Returns:
+            TextIndex: The index.
+        """
+        columns = columns or [c for c in free_text_columns() if c in data]
+        numbers = {other_column(number): number for number in question_numbers()}
+        subpopulation = identify_subpopulation(data).to_numpy()
+        status = data[col.q0d].astype(object).to_numpy()
+        response_id = data[col.q0a].to_numpy()
+
+        frames = []
+        for column in columns:
+            texts = data[column]
+            rows = numpy.flatnonzero(
+                texts.notna().to_numpy() & (texts.astype(str).str.strip() != "")
+            )
+            frames.append(
+                pandas.DataFrame(
+                    {
+                        "response_id": response_id[rows],
+                        "question": numbers.get(column, column),
+                        "column": column,
+                        "subpopulation": subpopulation[rows],
+                        "status": status[rows],
+                        "text": texts.iloc[rows].astype(str).to_numpy(dtype=object),
+                    }
+                )
+            )
+        documents = (
+            pandas.concat(frames, ignore_index=True)
+            if frames
+            else pandas.DataFrame(
+                columns=[
+                    "response_id",
+                    "question",
+                    "column",
+                    "subpopulation",
+                    "status",
+                    "text",
+                ]
+            )
+        )
+
+        # Unique (term, document) pairs, sorted by term then document.
+        tokens = documents["text"].map(tokenise).explode().dropna()
+        pairs = pandas.DataFrame(
+            {"term": tokens.to_numpy(), "document": tokens.index.to_numpy()}
+        ).drop_duplicates()
+        codes, terms = pandas.factorize(pairs["term"], sort=True)
+        order = numpy.lexsort((pairs["document"].to_numpy(), codes))
+        postings = pairs["document"].to_numpy(dtype=numpy.int64)[order]
+        offsets = numpy.searchsorted(codes[order], numpy.arange(len(terms) + 1))
+        return cls(list(terms), offsets, postings, documents)
+
+    @classmethod
+    def for_data(
+        cls,
+        data: pandas.DataFrame,
+        columns: Optional[List[str]] = None,
+        index_dir: Path = INDEX_DIR,
+    ) -> "TextIndex":
+        """Load the index of a dataset, building and saving it if needed.
+
+        Args:
+            data (pandas.DataFrame): Survey data.
+            columns (Optional[List[str]]): Free text columns to index.
+                Defaults to every "Other" column in `data`.
+            index_dir (Path): Directory of saved indexes.
+
+        Returns:
+            TextIndex: The index.
+        """
+        columns = columns or [c for c in free_text_columns() if c in data]
+        used = [col.q0a, col.q0d, col.q5, col.q6a] + columns
+        key = hash_key(
+            _INDEX_VERSION,
+            columns,
+            dataset_fingerprint(data[[c for c in used if c in data]]),
+        )
+        path = Path(index_dir) / key
+        if (path / "index.json").exists() and (path / "postings.npz").exists():
+            return cls.load(path)
+        index = cls.from_data(data, columns)
+        index.save(path)
+        return index
+
+    def match(self, query: str) -> numpy.ndarray:
+        """Return the sorted IDs of documents matching a query."""
+        tokens = _QUERY_TOKEN.findall(query)
+        if not tokens:
+            return self._all[:0]
+        documents, position = self._or(tokens, 0)
+        if position != len(tokens):
+            raise ValueError(f"Unexpected {tokens[position]!r} in query {query!r}.")
+        return documents
+
+    def search(
+        self, query: str, questions: Optional[List[str]] = None
+    ) -> pandas.DataFrame:
+        """Find the answers matching a query.
+
+        Args:
+            query (str): Boolean query, e.g. "(hybrid OR air*) AND NOT ground".
+            questions (Optional[List[str]]): Question numbers (e.g. "q113") to
+                restrict results to.
+
+        Raises:
+            ValueError: If the query can't be parsed.
+
+        Returns:
+            pandas.DataFrame: Matching answers, with their response ID,
+                question, column, subpopulation and status.
+        """
+        documents = self._filter(self.match(query), questions)
+        return pandas.DataFrame(
+            {column: values[documents] for column, values in self._columns.items()},
+            index=documents,
+        )
+
+    def counts(self, query: str, by: str = "subpopulation") -> pandas.Series:
+        """Count the answers matching a query by question, subpopulation or status."""
+        codes, labels = self._groups[by]
+        counts = pandas.Series(
+            numpy.bincount(codes[self.match(query)] + 1, minlength=len(labels) + 1)[1:],
+            index=pandas.Index(labels, name=by),
+            name="count",
+        )
+        return counts[counts > 0].sort_values(ascending=False, kind="stable")
+
+    def save(self, path: Path) -> None:
+        """Save the index to a directory.
+
+        Each file is written under a temporary name and renamed into place,
+        postings first, so `index.json` is only present once the index is
+        complete.
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        with _replacing(path / "postings.npz") as f:
+            numpy.savez_compressed(
+                f,
+                offsets=self.offsets,
+                postings=self.postings.astype(
+                    numpy.min_scalar_type(max(len(self.documents) - 1, 0))
+                ),
+            )
+        documents = self.documents.astype(object).where(self.documents.notna(), None)
+        with _replacing(path / "index.json") as f:
+            f.write(
+                json.dumps(
+                    {
+                        "terms": self.terms,
+                        "documents": {
+                            column: documents[column].tolist() for column in documents
+                        },
+                    },
+                    default=str,
+                ).encode("utf8")
+            )
+
+    @classmethod
+    def load(cls, path: Path) -> "TextIndex":
+        """Load an index saved with `save`."""
+        path = Path(path)
+        with open(path / "index.json") as f:
+            saved = json.load(f)
+        with numpy.load(path / "postings.npz") as arrays:
+            offsets, postings = arrays["offsets"], arrays["postings"]
+        return cls(
+            saved["terms"], offsets, postings, pandas.DataFrame(saved["documents"])
+        )
+
+    def _filter(
+        self, documents: numpy.ndarray, questions: Optional[List[str]]
+    ) -> numpy.ndarray:
+        if questions is None:
+            return documents
+        return documents[numpy.isin(self._columns["question"][documents], questions)]
+
+    # Sets of documents are combined through boolean masks over all documents,
+    # which is linear in the number of documents rather than sorting postings.
+
+    def _mask(self, documents: numpy.ndarray) -> numpy.ndarray:
+        mask = numpy.zeros(len(self._all), dtype=bool)
+        mask[documents] = True
+        return mask
+
+    def _documents(self, postings: numpy.ndarray) -> numpy.ndarray:
+        return numpy.flatnonzero(self._mask(postings))
+
+    def _term(self, token: str) -> numpy.ndarray:
+        if token.endswith("*"):
+            prefix = normalise(token[:-1])
+            start = bisect.bisect_left(self.terms, prefix)
+            end = bisect.bisect_left(self.terms, prefix + "\uffff")
+            return self._documents(
+                self.postings[self.offsets[start] : self.offsets[end]]
+            )
+        # Terms are tokenised like answers, so "air-source" matches both words.
+        documents = None
+        for term in tokenise(token):
+            position = self._positions.get(term)
+            found = (
+                self._all[:0]
+                if position is None
+                else self.postings[self.offsets[position] : self.offsets[position + 1]]
+            )
+            documents = (
+                found if documents is None else documents[self._mask(found)[documents]]
+            )
+        return self._all[:0] if documents is None else documents
+
+    # Recursive descent over the query's tokens, returning the matching
+    # documents and the position of the next token. OR binds loosest, then
+    # AND (explicit or implied between adjacent terms), then NOT.
+
+    def _or(self, tokens: List[str], position: int):
+        documents, position = self._and(tokens, position)
+        while position < len(tokens) and tokens[position] == "OR":
+            right, position = self._and(tokens, position + 1)
+            documents = self._documents(numpy.concatenate([documents, right]))
+        return documents, position
+
+    def _and(self, tokens: List[str], position: int):
+        documents, position = self._not(tokens, position)
+        while position < len(tokens) and tokens[position] not in ("OR", ")"):
+            if tokens[position] == "AND":
+                position += 1
+            right, position = self._not(tokens, position)
+            documents = documents[self._mask(right)[documents]]
+        return documents, position
+
+    def _not(self, tokens: List[str], position: int):
+        if position < len(tokens) and tokens[position] == "NOT":
+            documents, position = self._not(tokens, position + 1)
+            return numpy.flatnonzero(~self._mask(documents)), position
+        return self._atom(tokens, position)
+
+    def _atom(self, tokens: List[str], position: int):
+        if position >= len(tokens):
+            raise ValueError("Query ends unexpectedly.")
+        token = tokens[position]
+        if token == "(":
+            documents, position = self._or(tokens, position + 1)
+            if position >= len(tokens) or tokens[position] != ")":
+                raise ValueError("Unbalanced parentheses in query.")
+            return documents, position + 1
+        if token in _OPERATORS or token == ")":
+            raise ValueError(f"Unexpected {token!r} in query.")
+        return self._term(token), position + 1
+
+
+@contextlib.contextmanager
+def _replacing(path: Path):
+    # Write to a temporary file, then rename it over `path`.
+    temporary = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with open(temporary, "wb") as f:
+            yield f
+        os.replace(temporary, path)
+    finally:
+        temporary.unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("data", type=Path, help="Survey data parquet file.")
+    parser.add_argument("query", help='Query, e.g. "(hybrid OR air*) AND NOT ground".')
+    args = parser.parse_args()
+
+    index = TextIndex.for_data(pandas.read_parquet(args.data))
+    with pandas.option_context("display.max_colwidth", 80):
+        print(index.search(args.query)[["response_id", "question", "text"]].to_string())
@@ -0,0 +1,348 @@
+"""Sync the project's inputs from S3, verifying what's downloaded.
+
+Replaces `aws s3 sync $S3_INPUT_PATH inputs` (`make inputs-pull`):
+
+- Objects are downloaded as ranged parts by a bounded pool of threads, so a
+  large file downloads in parallel with itself and with small files.
+- Parts are written into a `.part` file beside the destination, and the parts
+  completed are recorded next to it, so an interrupted sync resumes where it
+  stopped (unless the object has changed since).
+- Each downloaded file is checked against its object's ETag (the MD5 of the
+  object, or of its upload parts for multipart uploads) before it replaces the
+  local file.
+- A manifest in the inputs directory records the ETag, size and modification
+  time of each synced file, so unchanged files are skipped without hashing.
+
+`sync_inputs` takes an S3 client, so it can be pointed at a local stand-in
+(e.g. moto, or MinIO via `endpoint_url`).
+
+Usage:
+    python -m asf_installer_survey.getters.inputs [s3://bucket/prefix]
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import sys
+import threading
+from concurrent.futures import as_completed, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import boto3
+
+from asf_installer_survey import logger, PROJECT_DIR
+
+INPUTS_DIR = PROJECT_DIR / "inputs"
+MANIFEST = ".manifest.json"
+
+PART_SIZE = 8 * 1024 * 1024
+MAX_WORKERS = 8
+
+_PART = ".part"
+_STATE = ".part.json"
+_HASH_BLOCK = 1024 * 1024
+
+
+class SyncResult(NamedTuple):
+    """Outcome of syncing inputs.
+
+    Attributes:
+        downloaded: Paths (relative to the inputs directory) downloaded.
+        skipped: Paths already up to date.
+        failed: Paths that failed to download or verify, mapped to the error.
+    """
+
+    downloaded: List[str]
+    skipped: List[str]
+    failed: Dict[str, str]
+
+
+def parse_s3_path(s3_path: str) -> Tuple[str, str]:
+    """Split an S3 path, e.g. "s3://bucket/prefix", into bucket and prefix.
+
+    Raises:
+        ValueError: If the path isn't an S3 path.
+    """
+    if not s3_path.startswith("s3://"):
+        raise ValueError(f"{s3_path!r} isn't an S3 path (s3://bucket/prefix).")
+    bucket, _, prefix = s3_path[len("s3://") :].partition("/")
+    if prefix and not prefix.endswith("/"):
+        prefix += "/"
+    return bucket, prefix
+
+
+def sync_inputs(
+    s3_path: Optional[str] = None,
+    destination: Path = INPUTS_DIR,
+    max_workers: int = MAX_WORKERS,
+    part_size: int = PART_SIZE,
+    verify: bool = True,
+    client=None,
+    endpoint_url: Optional[str] = None,
+) -> SyncResult:
+    """Download new and changed objects under an S3 prefix.
+
+    Local files not in S3 are left alone.
+
+    Args:
+        s3_path (Optional[str]): Prefix to sync, e.g.
+            "s3://bucket/project/inputs". Defaults to the `S3_INPUT_PATH`
+            environment variable.
+        destination (Path): Local inputs directory.
+        max_workers (int): Most parts downloaded at once.
+        part_size (int): Bytes per ranged download.
+        verify (bool): Check downloads against their ETags. Turn off for
+            objects whose ETag isn't an MD5, e.g. encrypted with SSE-KMS.
+        client: Boto3 S3 client. Defaults to one for `endpoint_url`.
+        endpoint_url (Optional[str]): S3 endpoint, e.g. of a MinIO server.
+
+    Raises:
+        ValueError: If no S3 path is given and `S3_INPUT_PATH` isn't set.
+
+    Returns:
+        SyncResult: The files downloaded, skipped and failed.
+    """
+    s3_path = s3_path or os.environ.get("S3_INPUT_PATH")
+    if not s3_path:
+        raise ValueError("No S3 path given, and S3_INPUT_PATH isn't set.")
+    bucket, prefix = parse_s3_path(s3_path)
+    client = client or boto3.client("s3", endpoint_url=endpoint_url)
+    destination = Path(destination)
+    manifest = _load_manifest(destination)
+
+    skipped, transfers = [], []
+    for key, etag, size in _list_objects(client, bucket, prefix):
+        relative = key[len(prefix) :]
+        if ".." in Path(relative).parts:
+            raise ValueError(f"Object {key!r} would be written outside {destination}.")
+        path = destination / relative
+        if _unchanged(path, manifest.get(relative), etag):
+            skipped.append(relative)
+        else:
+            transfers.append(_Transfer(bucket, key, relative, etag, size, path))
+
+    failed = {}
+    with ThreadPoolExecutor(max_workers) as pool:
+        futures = {}
+        for transfer in transfers:
+            for part in transfer.prepare(part_size):
+                futures[pool.submit(transfer.download, client, part)] = transfer
+        for future in as_completed(futures):
+            if future.exception() is not None:
+                failed.setdefault(futures[future].relative, repr(future.exception()))
+
+        finished = [
+            transfer for transfer in transfers if transfer.relative not in failed
+        ]
+        for transfer, error in zip(
+            finished, pool.map(lambda t: t.finish(client, verify), finished)
+        ):
+            if error is None:
+                manifest[transfer.relative] = transfer.manifest_entry()
+            else:
+                failed[transfer.relative] = error
+    _save_manifest(destination, manifest)
+
+    downloaded = [t.relative for t in transfers if t.relative not in failed]
+    logger.info(
+        f"Synced {s3_path}: {len(downloaded)} downloaded, {len(skipped)} up to "
+        f"date, {len(failed)} failed."
+    )
+    for relative, error in failed.items():
+        logger.error(f"Failed to sync {relative}: {error}")
+    return SyncResult(downloaded, skipped, failed)
+
+
+def etag_matches(path: Path, etag: str, upload_part_size: Optional[int] = None) -> bool:
+    """Check a file's contents against an S3 ETag.
+
+    Args:
+        path (Path): Local file.
+        etag (str): The object's ETag, e.g. "<md5>" or "<md5 of md5s>-<n>".
+        upload_part_size (Optional[int]): Part size of a multipart upload,
+            required if the ETag is for one.
+
+    Returns:
+        bool: True if the file's checksum is the ETag.
+    """
+    etag = etag.strip('"')
+    if "-" not in etag:
+        return _md5s(path, None)[0].hexdigest() == etag
+    n_parts = int(etag.split("-")[1])
+    digests = _md5s(path, upload_part_size)
+    combined = hashlib.md5(b"".join(digest.digest() for digest in digests))
+    return f"{combined.hexdigest()}-{n_parts}" == etag
+
+
+class _Transfer:
+    # An object's download, resumed from a previous sync's parts if the
+    # object hasn't changed since.
+
+    def __init__(self, bucket: str, key: str, relative: str, etag: str, size, path):
+        self.bucket, self.key, self.relative = bucket, key, relative
+        self.etag, self.size, self.path = etag, size, path
+        self.part_path = path.with_name(path.name + _PART)
+        self.state_path = path.with_name(path.name + _STATE)
+        self.lock = threading.Lock()
+
+    def prepare(self, part_size: int) -> List[int]:
+        state = {}
+        if self.state_path.exists() and self.part_path.exists():
+            try:
+                with open(self.state_path) as f:
+                    state = json.load(f)
+            except ValueError:
+                # e.g. truncated by an older version; start again.
+                logger.warning(f"Ignoring unreadable {self.state_path}.")
+        if (
+            state.get("etag") == self.etag
+            and state.get("part_size") == part_size
+            and self.part_path.stat().st_size == self.size
+        ):
+            logger.info(f"Resuming {self.relative}.")
+        else:
+            state = {"etag": self.etag, "part_size": part_size, "done": []}
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.part_path, "wb") as f:
+                f.truncate(self.size)
+        self.part_size, self.done = part_size, set(state["done"])
+        self._save_state()
+        n_parts = max(math.ceil(self.size / part_size), 1)
+        return [part for part in range(n_parts) if part not in self.done]
+
+    def download(self, client, part: int) -> None:
+        start = part * self.part_size
+        end = min(start + self.part_size, self.size) - 1
+        if end >= start:
+            # IfMatch fails the request if the object changes mid-sync.
+            response = client.get_object(
+                Bucket=self.bucket,
+                Key=self.key,
+                Range=f"bytes={start}-{end}",
+                IfMatch=self.etag,
+            )
+            body = response["Body"].read()
+            if len(body) != end - start + 1:
+                raise IOError(f"Expected {end - start + 1} bytes, got {len(body)}.")
+            with open(self.part_path, "r+b") as f:
+                f.seek(start)
+                f.write(body)
+        with self.lock:
+            self.done.add(part)
+            self._save_state()
+
+    def finish(self, client, verify: bool) -> Optional[str]:
+        if verify:
+            upload_part_size = None
+            if "-" in self.etag:
+                upload_part_size = client.head_object(
+                    Bucket=self.bucket, Key=self.key, PartNumber=1
+                )["ContentLength"]
+            if not etag_matches(self.part_path, self.etag, upload_part_size):
+                # Start again from scratch next time.
+                self.part_path.unlink(missing_ok=True)
+                self.state_path.unlink(missing_ok=True)
+                return f"Checksum doesn't match ETag {self.etag}."
+        os.replace(self.part_path, self.path)
+        self.state_path.unlink(missing_ok=True)
+        return None
+
+    def manifest_entry(self) -> Dict:
+        stat = self.path.stat()
+        return {"etag": self.etag, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def _save_state(self) -> None:
+        # Written beside the state and renamed over it, so an interrupted
+        # sync never leaves it half written. Callers hold the lock once
+        # parts are downloading.
+        temporary = self.state_path.with_name(self.state_path.name + ".tmp")
+        with open(temporary, "w") as f:
+            json.dump(
+                {
+                    "etag": self.etag,
+                    "part_size": self.part_size,
+                    "done": sorted(self.done),
+                },
+                f,
+            )
+        os.replace(temporary, self.state_path)
+
+
+def _list_objects(client, bucket: str, prefix: str):
+    paginator = client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for item in page.get("Contents", []):
+            # Skip "directory" placeholder objects.
+            if not item["Key"].endswith("/"):
+                yield item["Key"], item["ETag"], item["Size"]
+
+
+def _unchanged(path: Path, entry: Optional[Dict], etag: str) -> bool:
+    if entry is None or entry["etag"] != etag or not path.exists():
+        return False
+    stat = path.stat()
+    return stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime_ns"]
+
+
+def _md5s(path: Path, part_size: Optional[int]) -> List:
+    # MD5 of each `part_size` part of a file, or of the whole file.
+    digests = [hashlib.md5()]
+    in_part = 0
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(
+                _HASH_BLOCK
+                if part_size is None
+                else min(_HASH_BLOCK, part_size - in_part)
+            )
+            if not block:
+                break
+            digests[-1].update(block)
+            in_part += len(block)
+            if part_size is not None and in_part == part_size:
+                digests.append(hashlib.md5())
+                in_part = 0
+    if part_size is not None and in_part == 0 and len(digests) > 1:
+        digests.pop()
+    return digests
+
+
+def _load_manifest(destination: Path) -> Dict[str, Dict]:
+    path = destination / MANIFEST
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_manifest(destination: Path, manifest: Dict[str, Dict]) -> None:
+    destination.mkdir(parents=True, exist_ok=True)
+    temporary = destination / f"{MANIFEST}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(temporary, destination / MANIFEST)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "s3_path", nargs="?", help="S3 prefix to sync. Defaults to $S3_INPUT_PATH."
+    )
+    parser.add_argument("--destination", type=Path, default=INPUTS_DIR)
+    parser.add_argument("--workers", type=int, default=MAX_WORKERS)
+    parser.add_argument("--endpoint-url", help="S3 endpoint, e.g. of MinIO.")
+    parser.add_argument(
+        "--no-verify", action="store_true", help="Don't check downloads' ETags."
+    )
+    args = parser.parse_args()
+
+    result = sync_inputs(
+        args.s3_path,
+        args.destination,
+        args.workers,
+        verify=not args.no_verify,
+        endpoint_url=args.endpoint_url,
+    )
+    sys.exit(1 if result.failed else 0)
@@ -0,0 +1,169 @@
+"""Getters for survey intermediates shared through the memory-mapped store.
+
+The survey data, the analytical sample and encoded answers are derived once
+per snapshot and stored in `utils.store`, keyed by the snapshot file's path,
+size and modification time. Notebooks and worker processes calling these
+getters then map the same files instead of each re-reading the parquet and
+re-deriving them.
+
+Bump an intermediate's entry in `VERSIONS` when the code deriving it changes;
+`collect_stale` removes entries of old versions.
+"""
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy
+import pandas
+
+from asf_installer_survey.getters.survey_data import get_survey_data, SNAPSHOT_PATH
+from asf_installer_survey.pipeline.analytical_sample import define_analytical_sample
+from asf_installer_survey.utils.encoding import (
+    grid_codes,
+    multi_select_indicators,
+    pack_bitsets,
+)
+from asf_installer_survey.utils.store import (
+    collect_garbage,
+    entry_key,
+    stored_array,
+    stored_frame,
+    STORE_DIR,
+)
+
+VERSIONS = {
+    "survey_data": 1,
+    "analytical_sample": 1,
+    "bitsets": 1,
+    "grid_codes": 1,
+}
+
+
+def snapshot_key(path: Path = SNAPSHOT_PATH) -> str:
+    """Return a key identifying the current contents of a snapshot file."""
+    path = Path(path).resolve()
+    stat = path.stat()
+    return entry_key(str(path), stat.st_size, stat.st_mtime_ns)
+
+
+def get_shared_survey_data(
+    path: Path = SNAPSHOT_PATH, root: Path = STORE_DIR
+) -> pandas.DataFrame:
+    """Load the survey data snapshot from the store.
+
+    Args:
+        path (Path): Parquet snapshot.
+        root (Path): Store directory.
+
+    Returns:
+        pandas.DataFrame: Survey data.
+    """
+    return stored_frame(
+        "survey_data",
+        snapshot_key(path),
+        lambda: get_survey_data(path),
+        VERSIONS["survey_data"],
+        root,
+    )
+
+
+def get_analytical_sample(
+    path: Path = SNAPSHOT_PATH, root: Path = STORE_DIR
+) -> pandas.DataFrame:
+    """Load the respondents in the analytical sample from the store.
+
+    Args:
+        path (Path): Parquet snapshot.
+        root (Path): Store directory.
+
+    Returns:
+        pandas.DataFrame: Survey data of respondents in the analytical sample
+            (see `pipeline.analytical_sample.define_analytical_sample`).
+    """
+
+    def compute():
+        data = get_shared_survey_data(path, root)
+        return data.loc[define_analytical_sample(data)]
+
+    return stored_frame(
+        "analytical_sample",
+        snapshot_key(path),
+        compute,
+        VERSIONS["analytical_sample"],
+        root,
+    )
+
+
+def get_bitsets(
+    column: str, path: Path = SNAPSHOT_PATH, root: Path = STORE_DIR
+) -> Tuple[numpy.ndarray, List]:
+    """Load a multi-select question's packed bitsets from the store.
+
+    Args:
+        column (str): Multi-select question column.
+        path (Path): Parquet snapshot.
+        root (Path): Store directory.
+
+    Returns:
+        Tuple[numpy.ndarray, List]: Read-only bitsets, one row per respondent
+            (see `utils.encoding.pack_bitsets`), and the options they index.
+    """
+
+    def compute():
+        data = get_shared_survey_data(path, root)
+        indicators, options = multi_select_indicators(data[column])
+        return pack_bitsets(indicators), {"options": [str(o) for o in options]}
+
+    bitsets, metadata = stored_array(
+        "bitsets",
+        entry_key(snapshot_key(path), column),
+        compute,
+        VERSIONS["bitsets"],
+        root,
+    )
+    return bitsets, metadata["options"]
+
+
+def get_grid_codes(
+    columns: List[str], path: Path = SNAPSHOT_PATH, root: Path = STORE_DIR
+) -> Tuple[numpy.ndarray, List]:
+    """Load a grid question's answer codes from the store.
+
+    Args:
+        columns (List[str]): The grid's item columns.
+        path (Path): Parquet snapshot.
+        root (Path): Store directory.
+
+    Returns:
+        Tuple[numpy.ndarray, List]: Read-only respondent by item codes (see
+            `utils.encoding.grid_codes`) and the answer scale.
+    """
+
+    def compute():
+        data = get_shared_survey_data(path, root)
+        codes, categories = grid_codes(data, columns)
+        return codes, {"categories": [str(c) for c in categories]}
+
+    codes, metadata = stored_array(
+        "grid_codes",
+        entry_key(snapshot_key(path), columns),
+        compute,
+        VERSIONS["grid_codes"],
+        root,
+    )
+    return codes, metadata["categories"]
+
+
+def collect_stale(
+    max_age: Optional[float] = 30 * 24 * 60 * 60, root: Path = STORE_DIR
+) -> List[Path]:
+    """Remove old versions of intermediates and unused entries from the store.
+
+    Args:
+        max_age (Optional[float]): Remove entries unused for this many
+            seconds. Defaults to 30 days.
+        root (Path): Store directory.
+
+    Returns:
+        List[Path]: Paths of the removed entries.
+    """
+    return collect_garbage(VERSIONS, max_age, root)
@@ -0,0 +1,145 @@
+"""Getters for the survey data, as a single snapshot or across survey waves.
+
+Each wave is stored as a partition of one parquet dataset
+(`<waves dir>/wave=<wave>/`), with its columns renamed to stable question IDs
+(see `utils.questions.stable_question_ids`) so the same question lines up
+across waves even when it's renumbered or reworded.
+
+Each wave has a question map from stable IDs to that wave's column names. The
+map for a wave is read from `<question maps dir>/<wave>.yaml` if it exists,
+otherwise the current `QuestionNumbers` questionnaire is assumed.
+"""
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas
+import pyarrow
+import pyarrow.dataset as ds
+import yaml
+
+from asf_installer_survey import config, logger, PROJECT_DIR
+from asf_installer_survey.utils.questions import stable_question_ids
+
+SNAPSHOT_PATH = PROJECT_DIR / config["data"]["snapshot"]
+WAVES_DIR = PROJECT_DIR / config["data"]["waves"]
+QUESTION_MAPS_DIR = PROJECT_DIR / config["data"]["question_maps"]
+
+WAVE = "wave"
+
+
+def get_survey_data(
+    path: Path = SNAPSHOT_PATH, columns: Optional[List[str]] = None
+) -> pandas.DataFrame:
+    """Load a single snapshot of the cleaned survey data.
+
+    Args:
+        path (Path): Parquet file to load.
+        columns (Optional[List[str]]): Columns to load. Defaults to all.
+
+    Returns:
+        pandas.DataFrame: Survey data.
+    """
+    return pandas.read_parquet(path, columns=columns)
+
+
+def get_question_map(wave: str, maps_dir: Path = QUESTION_MAPS_DIR) -> Dict[str, str]:
+    """Get the map from stable question IDs to a wave's column names.
+
+    Args:
+        wave (str): Survey wave, e.g. "2023".
+        maps_dir (Path): Directory of per-wave question map YAML files.
+
+    Returns:
+        Dict[str, str]: Stable question IDs mapped to column names.
+    """
+    path = Path(maps_dir) / f"{wave}.yaml"
+    if path.exists():
+        with open(path, "rt") as f:
+            return yaml.safe_load(f)
+    return stable_question_ids()
+
+
+def write_wave(
+    data: pandas.DataFrame,
+    wave: str,
+    question_map: Optional[Dict[str, str]] = None,
+    root: Path = WAVES_DIR,
+) -> None:
+    """Store a wave of survey data in the multi-wave dataset.
+
+    Any existing data for the wave is replaced. Columns not in the question
+    map are dropped.
+
+    Args:
+        data (pandas.DataFrame): The wave's survey data.
+        wave (str): Survey wave, e.g. "2023".
+        question_map (Optional[Dict[str, str]]): Stable question IDs mapped to
+            the wave's column names. Defaults to `get_question_map(wave)`.
+        root (Path): Root directory of the multi-wave dataset.
+    """
+    question_map = question_map or get_question_map(wave)
+    renames = {
+        column: stable_id
+        for stable_id, column in question_map.items()
+        if column in data.columns
+    }
+    missing = len(question_map) - len(renames)
+    if missing:
+        logger.warning(f"{missing} mapped questions not found in wave {wave}.")
+
+    table = pyarrow.Table.from_pandas(
+        data[list(renames)].rename(columns=renames), preserve_index=False
+    )
+    ds.write_dataset(
+        table,
+        Path(root) / f"{WAVE}={wave}",
+        format="parquet",
+        basename_template="part-{i}.parquet",
+        existing_data_behavior="delete_matching",
+    )
+
+
+def get_waves(
+    questions: Optional[List[str]] = None,
+    waves: Optional[List[str]] = None,
+    root: Path = WAVES_DIR,
+    labels: bool = True,
+) -> pandas.DataFrame:
+    """Load aligned survey data across waves.
+
+    Only the requested question columns and waves are read from disk.
+
+    Args:
+        questions (Optional[List[str]]): Stable question IDs to load, e.g.
+            ["q0d", "q4", "q105_1"]. Defaults to all.
+        waves (Optional[List[str]]): Waves to load. Defaults to all.
+        root (Path): Root directory of the multi-wave dataset.
+        labels (bool): If True, name columns with the current questionnaire's
+            column names (as in `QuestionNumbers`) rather than stable IDs.
+
+    Returns:
+        pandas.DataFrame: Survey data for all requested waves, with a
+            categorical `wave` column.
+    """
+    dataset = _open_waves(root)
+    if questions is not None:
+        questions = [q for q in questions if q in dataset.schema.names] + [WAVE]
+    expression = None if waves is None else ds.field(WAVE).isin(list(waves))
+
+    data = dataset.to_table(columns=questions, filter=expression).to_pandas()
+    data[WAVE] = data[WAVE].astype(str).astype("category")
+    if labels:
+        data = data.rename(columns=stable_question_ids())
+    return data
+
+
+def _open_waves(root: Path) -> ds.Dataset:
+    # Questions can be added or dropped between waves, so the dataset schema
+    # is the union of the schemas of each wave's files.
+    partitioning = ds.partitioning(
+        pyarrow.schema([(WAVE, pyarrow.string())]), flavor="hive"
+    )
+    dataset = ds.dataset(root, format="parquet", partitioning=partitioning)
+    schemas = [fragment.physical_schema for fragment in dataset.get_fragments()]
+    schema = pyarrow.unify_schemas(schemas + [dataset.partitioning.schema])
+    return ds.dataset(root, schema=schema, format="parquet", partitioning=partitioning)
@@ -0,0 +1,407 @@
+"""Define the analytical sample of eligible, sufficiently complete responses.
+
+Vectorised versions of the rules developed in
+`notebooks/develop_analytical_sample.py`:
+
+1. Exclude respondents who don't (yet) work with heat pumps.
+2. Exclude respondents who didn't fully complete the demographics section.
+3. Keep complete responses, and partial responses that reached `q113`.
+
+Optionally, respondents with a low grid response quality score (see
+`pipeline.response_quality`) can also be excluded.
+
+Each rule has alternatives (which `q4` answers to exclude, strict or lenient
+demographics, which question partial responses must have reached), and
+`sweep_analytical_samples` compares the samples a grid of them gives. The
+answers the rules read are encoded once, scenarios' samples are stacked into
+a scenario by respondent matrix, and sample sizes and estimates for every
+scenario in a chunk come out of a single matrix product. Chunks of scenarios
+are evaluated in a pool of processes.
+"""
+import functools
+import itertools
+import os
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy
+import pandas
+
+from asf_installer_survey.analysis.missingness import MissingnessIndex
+from asf_installer_survey.utils.answers import is_answered, is_selected
+from asf_installer_survey.utils.encoding import (
+    category_codes,
+    multi_select_indicators,
+)
+from asf_installer_survey.utils.instrumentation import instrumented
+from asf_installer_survey.utils.lookups import QuestionNumbers as col
+from asf_installer_survey.utils.parallel import process_map
+from asf_installer_survey.utils.routing import identify_subpopulation
+
+EXCLUSION_VALUES = [
+    "I don’t work with heat pumps and have no plans to do so",
+    "I don’t work with heat pumps, but plan to do so in the twelve months",
+    "Don't know",
+    None,
+]
+
+# Demographic questions shown to every respondent, which are all the lenient
+# rule requires.
+CORE_DEMOGRAPHICS = [col.q1, col.q2, col.q3, col.q4, col.q5, col.q8, col.q10]
+
+PARTIAL_CUTOFF = col.q113[0]
+
+# Estimates compared across samples by `sweep_analytical_samples`.
+ESTIMATE_COLUMNS = [col.q1, col.q3, col.q4, col.q5]
+
+
+class SampleRules(NamedTuple):
+    """A definition of the analytical sample.
+
+    Attributes:
+        exclusion_values: `q4` answers to exclude. Respondents who didn't
+            answer `q4` are always excluded.
+        strict_demographics: Require every demographic question shown to a
+            respondent, rather than only those shown to everyone.
+        partial_cutoff: Column partial responses must have answered to be
+            kept. If None, only complete responses are kept.
+        min_quality_score: Exclude respondents with a lower response quality
+            score, if given.
+    """
+
+    exclusion_values: Sequence = tuple(EXCLUSION_VALUES)
+    strict_demographics: bool = True
+    partial_cutoff: Optional[str] = PARTIAL_CUTOFF
+    min_quality_score: Optional[float] = None
+
+
+def excluded(
+    data: pandas.DataFrame, exclusion_values: Sequence = EXCLUSION_VALUES
+) -> pandas.Series:
+    """Flag respondents who are ineligible based on heat pump experience."""
+    return data[col.q4].isin(exclusion_values) | data[col.q4].isna()
+
+
+def incomplete_demographics(
+    data: pandas.DataFrame,
+    strict: bool = True,
+    missingness: Optional[MissingnessIndex] = None,
+) -> pandas.Series:
+    """Flag respondents who didn't complete the demographics section.
+
+    Routed questions are only required of the respondents who were shown
+    them, e.g. `q6a` is only required of owners.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        strict (bool): Require the routed questions. If False, only the
+            questions shown to every respondent (`CORE_DEMOGRAPHICS`) are
+            required.
+        missingness (Optional[MissingnessIndex]): Index of `data` to read
+            which questions were answered from.
+
+    Returns:
+        pandas.Series: True where any required demographic question is missing.
+    """
+    if not strict:
+        missing = ~numpy.logical_and.reduce(
+            [_answered(data, question, missingness) for question in CORE_DEMOGRAPHICS]
+        )
+        return pandas.Series(missing, index=data.index)
+    answered = {
+        question: _answered(data, question, missingness)
+        for question in [
+            col.q1,
+            col.q2,
+            col.q3,
+            col.q4,
+            col.q5,
+            col.q6a,
+            col.q6b,
+            col.q7,
+            col.q8,
+            col.q9a,
+            col.q9b,
+            col.q9c,
+            col.q9d,
+            col.q10,
+            col.q11a,
+            col.q11b,
+            col.q11c,
+        ]
+    }
+    owner = (data[col.q5] == "The owner or co-owner of a firm").to_numpy()
+    employee = (data[col.q5] == "An employee of a firm").to_numpy()
+    contractor = (data[col.q5] == "A contractor or freelancer").to_numpy()
+    small_firm = (
+        data[col.q6a]
+        .isin(["I own a company with 5 or fewer employees", "I’m a sole trader"])
+        .to_numpy()
+    )
+    nations = data[col.q8]
+    missing = (
+        ~answered[col.q1]
+        | ~answered[col.q2]
+        | ~answered[col.q3]
+        | ~answered[col.q4]
+        | ~answered[col.q5]
+        | (owner & ~answered[col.q6a])
+        | (employee & ~answered[col.q6b])
+        | (small_firm & ~answered[col.q7])
+        | ~answered[col.q8]
+        | (is_selected(nations, "England") & ~answered[col.q9a])
+        | (is_selected(nations, "Scotland") & ~answered[col.q9b])
+        | (is_selected(nations, "Wales") & ~answered[col.q9c])
+        | (is_selected(nations, "Northern Ireland") & ~answered[col.q9d])
+        | ~answered[col.q10]
+        | (owner & ~answered[col.q11a])
+        | (contractor & ~answered[col.q11b])
+        | (employee & ~answered[col.q11c])
+    )
+    return pandas.Series(missing, index=data.index)
+
+
+@instrumented
+def define_analytical_sample(
+    data: pandas.DataFrame,
+    quality_score: Optional[pandas.Series] = None,
+    min_quality_score: Optional[float] = None,
+    rules: SampleRules = SampleRules(),
+    missingness: Optional[MissingnessIndex] = None,
+) -> pandas.Series:
+    """Flag respondents to include in the analytical sample.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        quality_score (Optional[pandas.Series]): Grid response quality score,
+            e.g. the `quality_score` column from
+            `response_quality.score_response_quality`, indexed as `data`.
+        min_quality_score (Optional[float]): Exclude respondents with a
+            quality score below this. Respondents without a score (who
+            didn't answer enough grid items) are kept. Overrides the rules'.
+        rules (SampleRules): Alternative exclusion rules. Defaults to those
+            developed in the notebook.
+        missingness (Optional[MissingnessIndex]): Index of `data` from
+            `analysis.missingness`, to read which questions were answered
+            from rather than working it out again.
+
+    Returns:
+        pandas.Series: True for respondents in the analytical sample.
+    """
+    status = data[col.q0d]
+    reached_cutoff = (
+        _answered(data, rules.partial_cutoff, missingness)
+        if rules.partial_cutoff is not None
+        else False
+    )
+    sample = (
+        ~excluded(data, rules.exclusion_values)
+        & ~incomplete_demographics(data, rules.strict_demographics, missingness)
+        & ((status == "Complete") | ((status == "Partial") & reached_cutoff))
+    )
+    if min_quality_score is None:
+        min_quality_score = rules.min_quality_score
+    if quality_score is not None and min_quality_score is not None:
+        sample &= ~(quality_score.reindex(data.index) < min_quality_score)
+    return sample
+
+
+def rule_grid(**alternatives: List) -> List[SampleRules]:
+    """Combine alternatives for each rule into every possible definition.
+
+    Args:
+        **alternatives (List): Alternative values of `SampleRules` fields,
+            e.g. `strict_demographics=[True, False]`. Rules not given keep
+            their defaults.
+
+    Raises:
+        ValueError: If a keyword isn't a `SampleRules` field.
+
+    Returns:
+        List[SampleRules]: A definition for each combination of alternatives.
+    """
+    unknown = set(alternatives) - set(SampleRules._fields)
+    if unknown:
+        raise ValueError(f"Unknown sample rules: {', '.join(sorted(unknown))}.")
+    names = list(alternatives)
+    return [
+        SampleRules(**dict(zip(names, values)))
+        for values in itertools.product(*alternatives.values())
+    ]
+
+
+@instrumented
+def sweep_analytical_samples(
+    data: pandas.DataFrame,
+    scenarios: List[SampleRules],
+    estimate_columns: List[str] = ESTIMATE_COLUMNS,
+    quality_score: Optional[pandas.Series] = None,
+    n_jobs: Optional[int] = None,
+    missingness: Optional[MissingnessIndex] = None,
+) -> pandas.DataFrame:
+    """Compare the analytical samples given by alternative rules.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        scenarios (List[SampleRules]): Definitions to compare, e.g. from
+            `rule_grid`.
+        estimate_columns (List[str]): Single select or multi-select columns
+            whose answers to estimate in each sample.
+        quality_score (Optional[pandas.Series]): Grid response quality score,
+            indexed as `data`. Required by scenarios with a minimum score.
+        n_jobs (Optional[int]): Number of worker processes.
+        missingness (Optional[MissingnessIndex]): Index of `data` to read
+            which questions were answered from.
+
+    Raises:
+        ValueError: If there are no scenarios, or a scenario has a minimum
+            quality score but no scores are given.
+
+    Returns:
+        pandas.DataFrame: A row per scenario, with columns of its rules, its
+            sample size by status and subpopulation, and the proportion of
+            respondents in it answering each option of `estimate_columns`
+            (out of those answering the question).
+    """
+    if not scenarios:
+        raise ValueError("No scenarios to compare.")
+    if quality_score is None and any(
+        rules.min_quality_score is not None for rules in scenarios
+    ):
+        raise ValueError("Scenarios with a minimum quality score need scores.")
+    inputs = _sweep_inputs(
+        data, scenarios, estimate_columns, quality_score, missingness
+    )
+
+    n_chunks = max(min(len(scenarios), n_jobs or os.cpu_count() or 1), 1)
+    chunks = [
+        [scenarios[i] for i in indices]
+        for indices in numpy.array_split(numpy.arange(len(scenarios)), n_chunks)
+    ]
+    results = process_map(
+        functools.partial(_evaluate_scenarios, inputs=inputs), chunks, n_jobs
+    )
+    values = numpy.vstack(results) if results else numpy.empty((0, 0))
+
+    n_sizes = len(inputs["sizes"])
+    sizes = values[:, :n_sizes].round().astype(numpy.int64)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        estimates = (
+            values[:, n_sizes : n_sizes + len(inputs["estimates"])]
+            / values[:, n_sizes + len(inputs["estimates"]) :][:, inputs["bases"]]
+        )
+    rules = pandas.DataFrame(
+        [
+            {
+                **rules._asdict(),
+                "exclusion_values": "; ".join(map(str, rules.exclusion_values)),
+            }
+            for rules in scenarios
+        ],
+        columns=list(SampleRules._fields),
+    )
+    return pandas.concat(
+        [
+            pandas.concat({"rules": rules}, axis=1),
+            pandas.DataFrame(
+                sizes, columns=pandas.MultiIndex.from_tuples(inputs["sizes"])
+            ),
+            pandas.DataFrame(
+                estimates, columns=pandas.MultiIndex.from_tuples(inputs["estimates"])
+            ),
+        ],
+        axis=1,
+    )
+
+
+def _sweep_inputs(
+    data: pandas.DataFrame,
+    scenarios: List[SampleRules],
+    estimate_columns: List[str],
+    quality_score: Optional[pandas.Series],
+    missingness: Optional[MissingnessIndex],
+) -> Dict:
+    # Everything the rules and estimates read, encoded once and shared by
+    # every scenario.
+    q4, q4_options = category_codes(data[col.q4])
+    status = data[col.q0d].astype(object)
+    cutoffs = {rules.partial_cutoff for rules in scenarios} - {None}
+
+    # Columns summed over each sample: sizes by status and subpopulation,
+    # then the estimated options, then each estimated question's base.
+    subpopulation = identify_subpopulation(data)
+    columns = [
+        numpy.ones(len(data), dtype=bool),
+        (status == "Complete").to_numpy(),
+        (status == "Partial").to_numpy(),
+    ]
+    sizes = [("sample", "n"), ("sample", "Complete"), ("sample", "Partial")]
+    for label in sorted(subpopulation.unique()):
+        columns.append((subpopulation == label).to_numpy())
+        sizes.append(("subpopulation", label))
+
+    estimates, bases, answered = [], [], []
+    for i, column in enumerate(estimate_columns):
+        if data[column].dtype == "object":
+            indicators, options = multi_select_indicators(data[column])
+        else:
+            codes, options = category_codes(data[column])
+            indicators = codes[:, None] == numpy.arange(len(options))
+        columns += list(indicators.T)
+        estimates += [(column, option) for option in options]
+        bases += [i] * len(options)
+        answered.append(_answered(data, column, missingness))
+
+    return {
+        "q4": q4,
+        "q4_options": q4_options,
+        "complete": (status == "Complete").to_numpy(),
+        "partial": (status == "Partial").to_numpy(),
+        "incomplete_demographics": {
+            strict: incomplete_demographics(data, strict, missingness).to_numpy()
+            for strict in {rules.strict_demographics for rules in scenarios}
+        },
+        "reached": {cutoff: _answered(data, cutoff, missingness) for cutoff in cutoffs},
+        "quality_score": (
+            None
+            if quality_score is None
+            else quality_score.reindex(data.index).to_numpy(dtype=float)
+        ),
+        "measures": numpy.column_stack(columns + answered).astype(numpy.float64),
+        "sizes": sizes,
+        "estimates": estimates,
+        "bases": numpy.array(bases, dtype=numpy.int64),
+    }
+
+
+def _answered(
+    data: pandas.DataFrame, column: str, missingness: Optional[MissingnessIndex]
+) -> numpy.ndarray:
+    # Read from the index where it holds the column.
+    if missingness is not None and missingness.covers([column]):
+        return missingness.is_answered(column)
+    return is_answered(data[column])
+
+
+def _evaluate_scenarios(scenarios: List[SampleRules], inputs: Dict) -> numpy.ndarray:
+    # Sums of the measures over each scenario's sample, as one product.
+    samples = numpy.stack([_sample(rules, inputs) for rules in scenarios])
+    return samples.astype(numpy.float64) @ inputs["measures"]
+
+
+def _sample(rules: SampleRules, inputs: Dict) -> numpy.ndarray:
+    excluded_codes = [
+        code
+        for code, option in enumerate(inputs["q4_options"])
+        if option in rules.exclusion_values
+    ]
+    sample = (inputs["q4"] >= 0) & ~numpy.isin(inputs["q4"], excluded_codes)
+    sample &= ~inputs["incomplete_demographics"][rules.strict_demographics]
+    reached = (
+        inputs["reached"][rules.partial_cutoff]
+        if rules.partial_cutoff is not None
+        else False
+    )
+    sample &= inputs["complete"] | (inputs["partial"] & reached)
+    if rules.min_quality_score is not None:
+        sample &= ~(inputs["quality_score"] < rules.min_quality_score)
+    return sample
@@ -0,0 +1,374 @@
+"""Statistical disclosure control for aggregated output tables.
+
+Small counts, such as installers in Northern Ireland or working outside the
+UK, can identify respondents, so every table is protected before it's
+published:
+
+1. Primary suppression: counts below `THRESHOLD` are withheld (zeros only
+   optionally, as they rarely identify anyone).
+2. Secondary suppression: a withheld count can be recovered by subtraction if
+   it's the only one withheld from a row or column whose total is published.
+   Each table's counts and margins are written as linear relations (cells sum
+   to their total), and while any relation has exactly one withheld cell, its
+   smallest published (non-zero, if possible) cell is withheld too.
+3. Optional rounding of the published counts to a base, e.g. 5.
+
+Tables are linked when they share a margin, e.g. the answers to a question
+split by status and by subpopulation both sum to the question's overall
+answer counts. Margins are named, and tables naming the same margin share its
+cells, so a total withheld in one table is withheld in the others. All the
+relations are held in one sparse incidence matrix, so each round of secondary
+suppression is a handful of vectorised operations over every table at once.
+
+`protect_summary` protects the long format tables of `analysis.summaries`
+(and `protect_summaries` several splits of one question together), withholding
+the proportions of withheld counts and flagging why each was withheld. Each
+group's respondents (the proportions' base) are protected with its counts.
+"""
+from typing import List, NamedTuple, Optional
+
+import numpy
+import pandas
+from scipy import sparse
+
+from asf_installer_survey import config
+
+_config = config["disclosure"]
+THRESHOLD = _config["threshold"]
+ROUND_TO = _config["round_to"]
+
+# Status codes of protected cells.
+PUBLISHED, PRIMARY, SECONDARY = 0, 1, 2
+STATUSES = {PRIMARY: "primary", SECONDARY: "secondary"}
+_LABELS = numpy.array([None, *STATUSES.values()], dtype=object)
+
+
+class LinkedTable(NamedTuple):
+    """A table of counts to protect with tables it shares margins with.
+
+    Attributes:
+        counts: Integer counts, rows by columns.
+        row_margin: Name of the published row totals, or None if the rows'
+            totals aren't published (or the counts in a row don't add up,
+            as for a multi-select question's options).
+        column_margin: Name of the published column totals, or None.
+    """
+
+    counts: numpy.ndarray
+    row_margin: Optional[str] = None
+    column_margin: Optional[str] = None
+
+
+class ProtectedTable(NamedTuple):
+    """A protected table of counts.
+
+    Attributes:
+        counts: Published counts (rounded if requested), NaN where withheld.
+        status: `PUBLISHED`, `PRIMARY` or `SECONDARY` for each count.
+        row_totals: Published row totals, if the table has a row margin.
+        row_status: Status of each row total.
+        column_totals: Published column totals, if it has a column margin.
+        column_status: Status of each column total.
+    """
+
+    counts: numpy.ndarray
+    status: numpy.ndarray
+    row_totals: Optional[numpy.ndarray]
+    row_status: Optional[numpy.ndarray]
+    column_totals: Optional[numpy.ndarray]
+    column_status: Optional[numpy.ndarray]
+
+
+def suppress(
+    values: numpy.ndarray,
+    relations: sparse.csr_matrix,
+    threshold: int = THRESHOLD,
+    suppress_zeros: bool = False,
+) -> numpy.ndarray:
+    """Choose the cells to withhold from a set of linked counts.
+
+    Args:
+        values (numpy.ndarray): Counts of every cell.
+        relations (sparse.csr_matrix): Relation by cell incidence matrix,
+            each row flagging cells that add up (one of them being the
+            total of the others).
+        threshold (int): Withhold counts below this.
+        suppress_zeros (bool): Withhold zero counts too.
+
+    Returns:
+        numpy.ndarray: Status code of each cell.
+    """
+    values = numpy.asarray(values)
+    status = numpy.where(
+        (values < threshold) & (suppress_zeros | (values > 0)), PRIMARY, PUBLISHED
+    ).astype(numpy.int8)
+    # Prefer withholding small counts, and non-zero counts to zeros.
+    cost = numpy.where(values > 0, values, values.max(initial=0) + 1).astype(float)
+
+    relations = sparse.csr_matrix(relations, dtype=numpy.int64)
+    while True:
+        withheld = status != PUBLISHED
+        exposed = numpy.flatnonzero(relations @ withheld.astype(numpy.int64) == 1)
+        if not len(exposed):
+            return status
+        rows = relations[exposed]
+        lengths = numpy.diff(rows.indptr)
+        rows_cost = numpy.where(withheld[rows.indices], numpy.inf, cost[rows.indices])
+        # Each relation's cheapest published cell, by sorting the relations'
+        # cells by relation then cost.
+        relation_of = numpy.repeat(numpy.arange(len(exposed)), lengths)
+        order = numpy.lexsort((rows_cost, relation_of))
+        chosen = order[rows.indptr[:-1]]
+        chosen = chosen[numpy.isfinite(rows_cost[chosen])]
+        if not len(chosen):
+            return status
+        status[rows.indices[chosen]] = SECONDARY
+
+
+def protect_tables(
+    tables: List[LinkedTable],
+    threshold: int = THRESHOLD,
+    round_to: Optional[int] = ROUND_TO,
+    suppress_zeros: bool = False,
+) -> List[ProtectedTable]:
+    """Protect linked tables together.
+
+    Args:
+        tables (List[LinkedTable]): Tables and the names of their published
+            margins.
+        threshold (int): Withhold counts below this.
+        round_to (Optional[int]): Round published counts to a multiple of
+            this.
+        suppress_zeros (bool): Withhold zero counts too.
+
+    Raises:
+        ValueError: If tables sharing a margin disagree on its totals.
+
+    Returns:
+        List[ProtectedTable]: The protected tables, in order.
+    """
+    builder = _Relations()
+    layout = []
+    for table in tables:
+        counts = numpy.asarray(table.counts, dtype=numpy.int64)
+        cells = builder.cells(counts.ravel()).reshape(counts.shape)
+        rows = columns = None
+        if table.row_margin is not None:
+            rows = builder.margin(table.row_margin, counts.sum(axis=1))
+            builder.relate(numpy.column_stack([cells, rows[:-1]]))
+        if table.column_margin is not None:
+            columns = builder.margin(table.column_margin, counts.sum(axis=0))
+            builder.relate(numpy.column_stack([cells.T, columns[:-1]]))
+        if rows is not None and columns is not None and rows[-1] != columns[-1]:
+            # Both margins' grand totals are the table's total.
+            builder.relate(numpy.array([[rows[-1], columns[-1]]]))
+        layout.append((cells, rows, columns))
+
+    values = numpy.array(builder.values, dtype=numpy.int64)
+    status = suppress(values, builder.matrix(), threshold, suppress_zeros)
+    published = values.astype(float)
+    if round_to:
+        published = numpy.round(published / round_to) * round_to
+    published[status != PUBLISHED] = numpy.nan
+
+    def part(indices):
+        if indices is None:
+            return None, None
+        return published[indices[:-1]], status[indices[:-1]]
+
+    return [
+        ProtectedTable(published[cells], status[cells], *part(rows), *part(columns))
+        for cells, rows, columns in layout
+    ]
+
+
+def protect_crosstab(
+    table: pandas.DataFrame,
+    threshold: int = THRESHOLD,
+    round_to: Optional[int] = ROUND_TO,
+    margins: bool = True,
+) -> pandas.DataFrame:
+    """Protect a crosstab, e.g. from `pandas.crosstab`.
+
+    Args:
+        table (pandas.DataFrame): Counts, rows by columns.
+        threshold (int): Withhold counts below this.
+        round_to (Optional[int]): Round published counts to a multiple of
+            this.
+        margins (bool): Whether the row and column totals are published.
+
+    Returns:
+        pandas.DataFrame: Published counts, NaN where withheld.
+    """
+    names = ("rows", "columns") if margins else (None, None)
+    protected = protect_tables(
+        [LinkedTable(table.to_numpy(), *names)], threshold, round_to
+    )[0]
+    return pandas.DataFrame(protected.counts, index=table.index, columns=table.columns)
+
+
+def protect_summary(
+    summary: pandas.DataFrame,
+    threshold: int = THRESHOLD,
+    round_to: Optional[int] = ROUND_TO,
+) -> pandas.DataFrame:
+    """Protect a question summary from `analysis.summaries`.
+
+    The summary's totals over all groups are taken to be published (e.g. in
+    an unsplit report), so a count withheld in one group is withheld in
+    another too. Use `protect_summaries` to protect summaries of the same
+    question with different splits consistently.
+
+    Args:
+        summary (pandas.DataFrame): Long format summary.
+        threshold (int): Withhold counts below this.
+        round_to (Optional[int]): Round published counts to a multiple of
+            this.
+
+    Returns:
+        pandas.DataFrame: The summary with withheld counts and proportions
+            missing, and a "disclosure" column giving the reason a count was
+            withheld.
+    """
+    return protect_summaries([summary], threshold, round_to)[0]
+
+
+def protect_summaries(
+    summaries: List[pandas.DataFrame],
+    threshold: int = THRESHOLD,
+    round_to: Optional[int] = ROUND_TO,
+) -> List[pandas.DataFrame]:
+    """Protect summaries of the same question, split different ways, together.
+
+    The summaries share margins: each split's totals over its groups are the
+    unsplit counts.
+
+    Args:
+        summaries (List[pandas.DataFrame]): Long format summaries of one
+            question from `analysis.summaries`, e.g. unsplit and split by
+            subpopulation.
+        threshold (int): Withhold counts below this.
+        round_to (Optional[int]): Round published counts to a multiple of
+            this.
+
+    Returns:
+        List[pandas.DataFrame]: The protected summaries (see
+            `protect_summary`).
+    """
+    tables, parts = [], []
+    for i, summary in enumerate(summaries):
+        if "responses" in summary:
+            responses = summary["responses"].to_numpy(dtype=numpy.int64)[:, None]
+            parts.append((i, summary, len(tables), None))
+            tables.append(LinkedTable(responses, None, "responses"))
+            continue
+
+        additive = "answer" in summary
+        items = summary["item"].unique() if "item" in summary else [None]
+        for item in items:
+            frame = summary if item is None else summary[summary["item"] == item]
+            if frame.empty:
+                parts.append((i, frame, None, None))
+                continue
+            n_groups = frame["group"].nunique()
+            counts = frame["count"].to_numpy(dtype=numpy.int64).reshape(n_groups, -1)
+            parts.append((i, frame, len(tables), additive))
+            tables.append(
+                LinkedTable(
+                    counts, f"{i} {item} rows" if additive else None, f"{item} answers"
+                )
+            )
+            if not additive:
+                # A small group's respondents (the proportions' denominators)
+                # are withheld with its proportions.
+                respondents = frame["respondents"].to_numpy(dtype=numpy.int64)
+                respondents = respondents.reshape(n_groups, -1)[:, 0]
+                tables.append(
+                    LinkedTable(respondents[:, None], None, f"{item} respondents")
+                )
+
+    protected = protect_tables(tables, threshold, round_to)
+    frames = [[] for _ in summaries]
+    for i, frame, t, additive in parts:
+        if t is None:
+            frames[i].append(frame.assign(disclosure=None))
+            continue
+        table = protected[t]
+        if additive is None:
+            frames[i].append(_with_free_text_protection(frame, table))
+            continue
+        denominators = table.row_totals if additive else protected[t + 1].counts[:, 0]
+        frames[i].append(_with_protection(frame, table, denominators))
+    return [
+        pandas.concat(summary_frames, ignore_index=True) for summary_frames in frames
+    ]
+
+
+class _Relations:
+    # Accumulates cells' values and the relations between them.
+
+    def __init__(self):
+        self.values = []
+        self.margins = {}
+        self.rows = []
+
+    def cells(self, values: numpy.ndarray) -> numpy.ndarray:
+        start = len(self.values)
+        self.values.extend(values.tolist())
+        return numpy.arange(start, len(self.values))
+
+    def margin(self, name: str, totals: numpy.ndarray) -> numpy.ndarray:
+        # A margin's cells, with its grand total last, shared by every table
+        # naming it.
+        if name in self.margins:
+            indices = self.margins[name]
+            existing = numpy.array(self.values)[indices[:-1]]
+            if len(existing) != len(totals) or (existing != totals).any():
+                raise ValueError(f"Tables disagree on the totals of margin {name!r}.")
+            return indices
+        indices = self.cells(numpy.append(totals, totals.sum()))
+        self.relate(indices[None, :])
+        self.margins[name] = indices
+        return indices
+
+    def relate(self, members: numpy.ndarray) -> None:
+        self.rows.extend(members.tolist())
+
+    def matrix(self) -> sparse.csr_matrix:
+        lengths = [len(row) for row in self.rows]
+        return sparse.csr_matrix(
+            (
+                numpy.ones(sum(lengths), dtype=numpy.int64),
+                (
+                    numpy.repeat(numpy.arange(len(self.rows)), lengths),
+                    numpy.concatenate(self.rows) if self.rows else [],
+                ),
+            ),
+            shape=(len(self.rows), len(self.values)),
+        )
+
+
+def _with_protection(
+    frame: pandas.DataFrame, table: ProtectedTable, denominators: numpy.ndarray
+) -> pandas.DataFrame:
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        proportions = table.counts / denominators[:, None]
+    return frame.assign(
+        count=pandas.array(table.counts.ravel(), dtype="Int64"),
+        proportion=proportions.ravel(),
+        respondents=pandas.array(
+            numpy.repeat(denominators, table.counts.shape[1]), dtype="Int64"
+        ),
+        disclosure=_LABELS[table.status.ravel()],
+    )
+
+
+def _with_free_text_protection(
+    frame: pandas.DataFrame, table: ProtectedTable
+) -> pandas.DataFrame:
+    withheld = table.status[:, 0] != PUBLISHED
+    return frame.assign(
+        responses=pandas.array(table.counts[:, 0], dtype="Int64"),
+        distinct_responses=frame["distinct_responses"].astype("Int64").mask(withheld),
+        disclosure=_LABELS[table.status[:, 0]],
+    )
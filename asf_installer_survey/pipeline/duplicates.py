@@ -0,0 +1,377 @@
+"""Detect duplicate and repeat submissions from respondents' answer vectors.
+
+Each respondent's answers are encoded as single select codes plus packed
+multi-select bitsets, and as a set of answered tokens (one token per answered
+single select question or selected multi-select option). Then:
+
+- exact duplicates are found by hashing the full encoded answer vectors,
+- near-duplicates are found by MinHash locality sensitive hashing (LSH) over
+  the answered tokens, so only respondents sharing a band bucket are ever
+  compared,
+- partial responses are linked to complete responses that started shortly
+  after them and share identical demographics (page 1) answers, scored by the
+  proportion of the partial's answers contained in the complete response.
+
+The result is a table of matched pairs with similarity scores and a match
+group for each connected set of respondents.
+"""
+from typing import List, NamedTuple, Optional
+
+import numpy
+import pandas
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from asf_installer_survey.utils.encoding import (
+    category_codes,
+    multi_select_indicators,
+    pack_bitsets,
+)
+from asf_installer_survey.utils.instrumentation import instrumented
+from asf_installer_survey.utils.lookups import QuestionNumbers as col
+from asf_installer_survey.utils.questions import (
+    all_answer_columns,
+    column_kind,
+    MULTI_SELECT,
+    SINGLE_SELECT,
+)
+from asf_installer_survey.utils.routing import ROUTES, SUBPOPULATIONS
+
+# MinHash signature length and LSH bands. With 16 bands of 4 rows, pairs
+# with a Jaccard similarity of 0.5 become candidates about 63% of the time,
+# and pairs at 0.8 about 99.9% of the time.
+NUM_PERMUTATIONS = 64
+BANDS = 16
+
+# Buckets larger than this are skipped when generating candidate pairs, to
+# stop very common answer patterns making matching quadratic.
+MAX_BUCKET_SIZE = 50
+
+# Most token hashes (int64) computed at once when building MinHash
+# signatures: chunks of respondents are sized to hold about this many.
+MAX_CHUNK_HASHES = 8_000_000
+
+# Respondents with fewer answered tokens than this are too sparse to match.
+MIN_ANSWERED = 10
+
+MIN_JACCARD = 0.8
+MIN_CONTAINMENT = 0.9
+MAX_START_GAP = pandas.Timedelta(days=7)
+
+_PRIME = (1 << 31) - 1
+
+
+class AnswerVectors(NamedTuple):
+    """Encoded answers for a set of respondents.
+
+    Attributes:
+        codes: Single select codes, one column per question (-1 missing).
+        bitsets: Packed multi-select bitsets, concatenated across questions.
+        tokens: Sparse respondent by token binary matrix of answered items.
+    """
+
+    codes: numpy.ndarray
+    bitsets: numpy.ndarray
+    tokens: sparse.csr_matrix
+
+
+def encode_answer_vectors(
+    data: pandas.DataFrame, columns: Optional[List[str]] = None
+) -> AnswerVectors:
+    """Encode each respondent's full set of answers.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        columns (Optional[List[str]]): Answer columns to encode. Defaults to
+            every single and multi-select answer column in `data`.
+
+    Returns:
+        AnswerVectors: The encoded answers.
+    """
+    if columns is None:
+        columns = [column for column in all_answer_columns() if column in data]
+
+    codes, bitsets, rows, tokens = [], [], [], []
+    n_tokens = 0
+    for column in columns:
+        kind = column_kind(data[column])
+        if kind == SINGLE_SELECT:
+            values, categories = category_codes(data[column])
+            codes.append(values)
+            answered = numpy.flatnonzero(values >= 0)
+            rows.append(answered)
+            tokens.append(n_tokens + values[answered].astype(numpy.int64))
+            n_tokens += len(categories)
+        elif kind == MULTI_SELECT:
+            indicators, options = multi_select_indicators(data[column])
+            bitsets.append(pack_bitsets(indicators))
+            selected_rows, selected_options = numpy.nonzero(indicators)
+            rows.append(selected_rows)
+            tokens.append(n_tokens + selected_options)
+            n_tokens += len(options)
+
+    rows, tokens = numpy.concatenate(rows), numpy.concatenate(tokens)
+    return AnswerVectors(
+        codes=numpy.column_stack(codes).astype(numpy.int16),
+        bitsets=(
+            numpy.hstack(bitsets)
+            if bitsets
+            else numpy.zeros((len(data), 0), dtype=numpy.uint8)
+        ),
+        tokens=sparse.csr_matrix(
+            (numpy.ones(len(rows), dtype=numpy.int32), (rows, tokens)),
+            shape=(len(data), n_tokens),
+        ),
+    )
+
+
+def answer_hashes(vectors: AnswerVectors) -> numpy.ndarray:
+    """Hash each respondent's full answer vector to a 64-bit integer."""
+    frame = pandas.DataFrame(
+        numpy.hstack([vectors.codes, vectors.bitsets.astype(numpy.int16)])
+    )
+    return pandas.util.hash_pandas_object(frame, index=False).to_numpy()
+
+
+def minhash_signatures(
+    tokens: sparse.csr_matrix,
+    num_permutations: int = NUM_PERMUTATIONS,
+    seed: int = 0,
+    max_chunk_hashes: int = MAX_CHUNK_HASHES,
+) -> numpy.ndarray:
+    """Compute MinHash signatures of each respondent's answered tokens.
+
+    Args:
+        tokens (sparse.csr_matrix): Respondent by token binary matrix.
+        num_permutations (int): Signature length.
+        seed (int): Seed for the random hash functions.
+        max_chunk_hashes (int): Roughly the most token hashes computed at
+            once, bounding memory use. Respondents are hashed in chunks sized
+            from the signature length and their average number of tokens.
+
+    Returns:
+        numpy.ndarray: Signatures of shape (n_respondents, num_permutations).
+            Respondents with no answered tokens have every value set to the
+            hash modulus.
+    """
+    rng = numpy.random.default_rng(seed)
+    a = rng.integers(1, _PRIME, num_permutations, dtype=numpy.int64)[:, None]
+    b = rng.integers(0, _PRIME, num_permutations, dtype=numpy.int64)[:, None]
+
+    n_rows = tokens.shape[0]
+    per_row = num_permutations * max(tokens.nnz / max(n_rows, 1), 1)
+    chunk_size = max(1, int(max_chunk_hashes // per_row))
+    signatures = numpy.full((n_rows, num_permutations), _PRIME, dtype=numpy.int64)
+    for start in range(0, n_rows, chunk_size):
+        chunk = tokens[start : start + chunk_size]
+        counts = numpy.diff(chunk.indptr)
+        nonempty = counts > 0
+        if not nonempty.any():
+            continue
+        hashed = (a * chunk.indices.astype(numpy.int64) + b) % _PRIME
+        minimums = numpy.minimum.reduceat(hashed, chunk.indptr[:-1][nonempty], axis=1)
+        signatures[start + numpy.flatnonzero(nonempty)] = minimums.T
+    return signatures
+
+
+def lsh_candidates(
+    signatures: numpy.ndarray,
+    bands: int = BANDS,
+    max_bucket_size: int = MAX_BUCKET_SIZE,
+) -> numpy.ndarray:
+    """Find candidate near-duplicate pairs by LSH banding of signatures.
+
+    Args:
+        signatures (numpy.ndarray): MinHash signatures.
+        bands (int): Number of bands; must divide the signature length.
+        max_bucket_size (int): Buckets larger than this are skipped.
+
+    Returns:
+        numpy.ndarray: Unique candidate pairs, shape (n_pairs, 2), with the
+            smaller row index first.
+    """
+    n_rows, num_permutations = signatures.shape
+    rows_per_band = num_permutations // bands
+    nonempty = numpy.flatnonzero(signatures[:, 0] < _PRIME)
+
+    pairs = []
+    for band in range(bands):
+        block = signatures[nonempty, band * rows_per_band : (band + 1) * rows_per_band]
+        keys = pandas.util.hash_pandas_object(pandas.DataFrame(block), index=False)
+        pairs.append(_bucket_pairs(keys.to_numpy(), nonempty, max_bucket_size))
+    return _unique_pairs(numpy.vstack(pairs), n_rows)
+
+
+@instrumented
+def find_duplicates(
+    data: pandas.DataFrame,
+    min_jaccard: float = MIN_JACCARD,
+    min_containment: float = MIN_CONTAINMENT,
+    max_start_gap: pandas.Timedelta = MAX_START_GAP,
+    seed: int = 0,
+) -> pandas.DataFrame:
+    """Find exact duplicates, near-duplicates and partial to complete links.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        min_jaccard (float): Minimum Jaccard similarity of answered tokens for
+            a near-duplicate.
+        min_containment (float): Minimum proportion of a partial response's
+            answered tokens shared with a complete response to link them.
+        max_start_gap (pandas.Timedelta): Maximum time between a partial
+            response starting and a linked complete response starting.
+        seed (int): Seed for the MinHash hash functions.
+
+    Returns:
+        pandas.DataFrame: One row per matched pair with both response IDs,
+            the match type ("exact", "near" or "partial-complete"), Jaccard
+            similarity, containment of the first response in the second, time
+            between their starts and a `match_group` shared by all
+            respondents connected by a match.
+    """
+    vectors = encode_answer_vectors(data)
+    n_rows = len(data)
+    sizes = numpy.diff(vectors.tokens.indptr)
+    eligible = numpy.flatnonzero(sizes >= MIN_ANSWERED)
+    hashes = answer_hashes(vectors)
+    partial = (data[col.q0d] == "Partial").to_numpy()
+    started = pandas.to_datetime(data[col.q0b]).to_numpy()
+
+    # Exact duplicates share a hash of their full answer vector.
+    exact = _bucket_stars(hashes[eligible], eligible)
+
+    # Near-duplicates share at least one LSH bucket.
+    signatures = minhash_signatures(vectors.tokens[eligible], seed=seed)
+    near = eligible[lsh_candidates(signatures)]
+
+    # Repeat attempts share identical page 1 answers and start close together.
+    page_1 = [
+        column
+        for column in dict.fromkeys(
+            question for name in SUBPOPULATIONS for question in ROUTES[name][0][1]
+        )
+        if column in data
+    ]
+    linked = _linked_pairs(
+        answer_hashes(encode_answer_vectors(data, page_1))[eligible],
+        eligible,
+        started[eligible],
+        partial[eligible],
+        numpy.timedelta64(max_start_gap),
+    )
+
+    pairs = _unique_pairs(numpy.vstack([exact, near, linked]), n_rows)
+    first, second = pairs[:, 0], pairs[:, 1]
+
+    # Order partial to complete pairs with the partial first.
+    swap = ~partial[first] & partial[second]
+    first, second = numpy.where(swap, second, first), numpy.where(swap, first, second)
+
+    intersection = numpy.asarray(
+        vectors.tokens[first].multiply(vectors.tokens[second]).sum(axis=1)
+    ).ravel()
+    union = sizes[first] + sizes[second] - intersection
+    jaccard = intersection / union
+    containment = intersection / sizes[first]
+
+    gap = pandas.to_timedelta(started[second] - started[first])
+
+    kind = numpy.select(
+        [
+            hashes[first] == hashes[second],
+            jaccard >= min_jaccard,
+            partial[first]
+            & ~partial[second]
+            & (gap >= pandas.Timedelta(0))
+            & (gap <= max_start_gap)
+            & (containment >= min_containment),
+        ],
+        ["exact", "near", "partial-complete"],
+        default="",
+    )
+    keep = kind != ""
+    first, second = first[keep], second[keep]
+
+    _, groups = connected_components(
+        sparse.coo_matrix(
+            (numpy.ones(len(first)), (first, second)), shape=(n_rows, n_rows)
+        ),
+        directed=False,
+    )
+    response_id = data[col.q0a].to_numpy()
+    return pandas.DataFrame(
+        {
+            "response_id": response_id[first],
+            "matched_response_id": response_id[second],
+            "match": kind[keep],
+            "jaccard": jaccard[keep],
+            "containment": containment[keep],
+            "start_gap": gap[keep],
+            "match_group": groups[first],
+        }
+    ).sort_values(["match_group", "response_id"], ignore_index=True)
+
+
+def _bucket_pairs(
+    keys: numpy.ndarray, rows: numpy.ndarray, max_bucket_size: int
+) -> numpy.ndarray:
+    # All pairs of rows sharing a key, skipping singleton and oversize buckets.
+    order = numpy.argsort(keys, kind="stable")
+    keys, rows = keys[order], rows[order]
+    starts = numpy.flatnonzero(numpy.r_[True, keys[1:] != keys[:-1]])
+    sizes = numpy.diff(numpy.r_[starts, len(keys)])
+
+    pairs = [numpy.empty((0, 2), dtype=numpy.int64)]
+    for start, size in zip(starts[sizes > 1], sizes[sizes > 1]):
+        if size > max_bucket_size:
+            continue
+        i, j = numpy.triu_indices(size, 1)
+        bucket = rows[start : start + size]
+        pairs.append(numpy.column_stack([bucket[i], bucket[j]]))
+    return numpy.vstack(pairs)
+
+
+def _bucket_stars(keys: numpy.ndarray, rows: numpy.ndarray) -> numpy.ndarray:
+    # Pair each row with the first row sharing its key, linear in bucket size.
+    order = numpy.argsort(keys, kind="stable")
+    keys, rows = keys[order], rows[order]
+    new_bucket = numpy.r_[True, keys[1:] != keys[:-1]]
+    first = rows[numpy.flatnonzero(new_bucket)][numpy.cumsum(new_bucket) - 1]
+    return numpy.column_stack([first, rows])[~new_bucket]
+
+
+def _linked_pairs(
+    keys: numpy.ndarray,
+    rows: numpy.ndarray,
+    started: numpy.ndarray,
+    partial: numpy.ndarray,
+    max_start_gap: numpy.timedelta64,
+) -> numpy.ndarray:
+    # Pair partials with completes sharing their key that started within
+    # `max_start_gap` after them, via a sorted search within each key.
+    order = numpy.lexsort((started, keys))
+    keys, rows, started, partial = (
+        keys[order],
+        rows[order],
+        started[order],
+        partial[order],
+    )
+    completes = numpy.flatnonzero(~partial)
+    complete_keys, complete_started = keys[completes], started[completes]
+
+    pairs = [numpy.empty((0, 2), dtype=numpy.int64)]
+    for i in numpy.flatnonzero(partial):
+        low = numpy.searchsorted(complete_keys, keys[i], side="left")
+        high = numpy.searchsorted(complete_keys, keys[i], side="right")
+        window = complete_started[low:high]
+        begin = low + numpy.searchsorted(window, started[i], side="left")
+        end = low + numpy.searchsorted(window, started[i] + max_start_gap, "right")
+        matches = rows[completes[begin:end]]
+        pairs.append(numpy.column_stack([numpy.full(len(matches), rows[i]), matches]))
+    return numpy.vstack(pairs)
+
+
+def _unique_pairs(pairs: numpy.ndarray, n_rows: int) -> numpy.ndarray:
+    low, high = pairs.min(axis=1), pairs.max(axis=1)
+    keys = numpy.unique(low.astype(numpy.int64) * n_rows + high)
+    return numpy.column_stack([keys // n_rows, keys % n_rows])
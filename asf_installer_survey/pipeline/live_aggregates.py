@@ -0,0 +1,447 @@
+"""Incrementally maintained aggregates for refreshing results during fieldwork.
+
+`AggregateState` holds mergeable counts over a set of respondents:
+
+- answer counts for every single select question, split by status (`q0d`),
+  from which value counts and status crosstabs are read,
+- option co-occurrence counts for every multi-select question, by status,
+- the number of respondents answering each question, by status.
+
+Alongside the counts, each respondent's encoded answers (codes and packed
+multi-select bitsets) are kept, keyed by response ID. When a new batch of
+responses arrives, new respondents are added, and respondents already counted
+(e.g. whose status changed from Partial to Complete) have their previous
+contribution retracted before their new answers are added. A refresh therefore
+only touches the rows in the batch: stored answers are held in arrays grown
+by doubling their capacity, with a dict from response ID to row, so appending
+a batch takes time in proportion to the batch, not to every row stored.
+
+The state is saved next to the survey data it summarises.
+"""
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy
+import pandas
+
+from asf_installer_survey import logger
+from asf_installer_survey.analysis.independence import (
+    CrosstabTest,
+    independence_test,
+)
+from asf_installer_survey.getters.survey_data import SNAPSHOT_PATH
+from asf_installer_survey.utils.encoding import (
+    category_codes,
+    multi_select_indicators,
+    pack_bitsets,
+    unpack_bitsets,
+)
+from asf_installer_survey.utils.lookups import QuestionNumbers as col
+from asf_installer_survey.utils.questions import (
+    all_answer_columns,
+    column_kind,
+    MULTI_SELECT,
+    SINGLE_SELECT,
+)
+
+STATE_PATH = SNAPSHOT_PATH.with_suffix(".aggregates")
+
+# Rows of stored answers allocated when a state is first added to.
+INITIAL_CAPACITY = 1024
+
+
+class AggregateState:
+    """Mergeable counts over survey respondents, split by status.
+
+    Args:
+        single_selects (Dict[str, List]): Single select columns mapped to
+            their answer categories.
+        multi_selects (Dict[str, List]): Multi-select columns mapped to their
+            options.
+        statuses (List[str]): Response statuses to split counts by.
+    """
+
+    def __init__(
+        self,
+        single_selects: Dict[str, List],
+        multi_selects: Dict[str, List],
+        statuses: List[str],
+    ):
+        self.categories = {column: list(c) for column, c in single_selects.items()}
+        self.options = {column: list(o) for column, o in multi_selects.items()}
+        self.statuses = list(statuses)
+        n_statuses = len(self.statuses)
+
+        self.respondents = numpy.zeros(n_statuses, dtype=numpy.int64)
+        self.answered = numpy.zeros((n_statuses, len(self.columns)), dtype=numpy.int64)
+        self.counts = {
+            column: numpy.zeros((n_statuses, len(c)), dtype=numpy.int64)
+            for column, c in self.categories.items()
+        }
+        self.cooccurrence = {
+            column: numpy.zeros((n_statuses, len(o), len(o)), dtype=numpy.int64)
+            for column, o in self.options.items()
+        }
+
+        # Encoded answers of every respondent counted, for retraction, in the
+        # first `_size` rows of arrays with spare capacity.
+        self._size = 0
+        self._rows = {}
+        self._ids = numpy.empty(0, dtype=object)
+        self._status = numpy.zeros(0, dtype=numpy.int16)
+        self._codes = numpy.zeros((0, len(self.categories)), dtype=numpy.int16)
+        self._bitsets = {
+            column: numpy.zeros((0, -(-len(o) // 8)), dtype=numpy.uint8)
+            for column, o in self.options.items()
+        }
+
+    @property
+    def columns(self) -> List[str]:
+        """All question columns counted, single selects first."""
+        return list(self.categories) + list(self.options)
+
+    @property
+    def ids(self) -> pandas.Index:
+        """Response IDs of the respondents counted."""
+        return pandas.Index(self._ids[: self._size], dtype=object)
+
+    @classmethod
+    def from_data(
+        cls, data: pandas.DataFrame, columns: Optional[List[str]] = None
+    ) -> "AggregateState":
+        """Build the aggregate state of a dataset.
+
+        Args:
+            data (pandas.DataFrame): Survey data.
+            columns (Optional[List[str]]): Single and multi-select columns to
+                count. Defaults to every answer column in `data`.
+
+        Returns:
+            AggregateState: State counting every respondent in `data`.
+        """
+        if columns is None:
+            columns = [column for column in all_answer_columns() if column in data]
+        kinds = {column: column_kind(data[column]) for column in columns}
+        state = cls(
+            {
+                c: category_codes(data[c])[1]
+                for c, k in kinds.items()
+                if k == SINGLE_SELECT
+            },
+            {
+                c: multi_select_indicators(data[c])[1]
+                for c, k in kinds.items()
+                if k == MULTI_SELECT
+            },
+            category_codes(data[col.q0d])[1],
+        )
+        state.update(data)
+        return state
+
+    def update(self, batch: pandas.DataFrame) -> None:
+        """Fold a batch of new or changed responses into the state.
+
+        Respondents whose response ID is already counted have their previous
+        answers retracted and are recounted with their answers in `batch`.
+
+        Args:
+            batch (pandas.DataFrame): Survey data for the new or changed
+                responses, including response IDs (`q0a`) and status (`q0d`).
+        """
+        batch = batch.drop_duplicates(col.q0a, keep="last")
+        ids = batch[col.q0a].to_numpy()
+        existing = self._find(ids)
+        changed = existing >= 0
+
+        self._extend(batch)
+        if changed.any():
+            self._apply(self._stored(existing[changed]), sign=-1)
+
+        encoded = self._encode(batch)
+        self._apply(encoded, sign=1)
+
+        # Overwrite changed rows' stored answers and append new rows.
+        rows = existing.copy()
+        rows[~changed] = self._append(ids[~changed])
+        self._status[rows] = encoded["status"]
+        self._codes[rows] = encoded["codes"]
+        for column, bitsets in self._bitsets.items():
+            bitsets[rows] = pack_bitsets(encoded["indicators"][column])
+        logger.info(
+            f"Aggregates updated: {(~changed).sum()} new and {changed.sum()} "
+            f"changed responses ({self._size} in total)."
+        )
+
+    def remove(self, ids: List) -> None:
+        """Retract respondents from the state, e.g. withdrawn responses."""
+        rows = self._find(pandas.unique(numpy.asarray(ids, dtype=object)))
+        rows = numpy.sort(rows[rows >= 0])
+        self._apply(self._stored(rows), sign=-1)
+
+        # Fill the removed rows with the last rows kept, so only as many rows
+        # move as are removed.
+        size = self._size - len(rows)
+        holes = rows[rows < size]
+        tail = numpy.arange(size, self._size)
+        moved = tail[~numpy.isin(tail, rows)]
+        for row in rows:
+            del self._rows[self._ids[row]]
+        self._move(moved, holes)
+        self._ids[size : self._size] = None
+        self._size = size
+
+    def merge(self, other: "AggregateState") -> "AggregateState":
+        """Combine with the state of a disjoint set of respondents.
+
+        Both states must count the same columns with the same categories.
+
+        Args:
+            other (AggregateState): State to merge in.
+
+        Returns:
+            AggregateState: This state, updated in place.
+        """
+        if (
+            other.categories != self.categories
+            or other.options != self.options
+            or other.statuses != self.statuses
+        ):
+            raise ValueError("Can only merge states with identical categories.")
+        other_ids = other._ids[: other._size]
+        if (self._find(other_ids) >= 0).any():
+            raise ValueError("Can only merge states of disjoint respondents.")
+
+        self.respondents += other.respondents
+        self.answered += other.answered
+        for column in self.counts:
+            self.counts[column] += other.counts[column]
+        for column in self.cooccurrence:
+            self.cooccurrence[column] += other.cooccurrence[column]
+
+        rows = self._append(other_ids)
+        self._status[rows] = other._status[: other._size]
+        self._codes[rows] = other._codes[: other._size]
+        for column, bitsets in self._bitsets.items():
+            bitsets[rows] = other._bitsets[column][: other._size]
+        return self
+
+    def value_counts(self, column: str) -> pandas.Series:
+        """Count the answers to a single select question."""
+        return pandas.Series(
+            self.counts[column].sum(axis=0), index=self.categories[column], name="count"
+        )
+
+    def crosstab(self, column: str) -> pandas.DataFrame:
+        """Crosstabulate status against the answers to a single select question."""
+        return pandas.DataFrame(
+            self.counts[column], index=self.statuses, columns=self.categories[column]
+        )
+
+    def crosstab_test(self, column: str, **kwargs) -> CrosstabTest:
+        """Test status and a single select question for independence.
+
+        Small tables are tested by Monte Carlo (see
+        `analysis.independence.independence_test`, which takes `kwargs`).
+        """
+        return independence_test(self.crosstab(column), **kwargs)
+
+    def option_cooccurrence(self, column: str) -> pandas.DataFrame:
+        """Count respondents selecting each pair of a multi-select's options."""
+        return pandas.DataFrame(
+            self.cooccurrence[column].sum(axis=0),
+            index=self.options[column],
+            columns=self.options[column],
+        )
+
+    def completeness(self) -> pandas.DataFrame:
+        """Proportion of respondents answering each question, by status."""
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            proportions = self.answered / self.respondents[:, None]
+        return pandas.DataFrame(
+            proportions.T, index=self.columns, columns=self.statuses
+        )
+
+    def save(self, path: Path = STATE_PATH) -> None:
+        """Save the state to a directory."""
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        with open(path / "state.json", "w") as f:
+            json.dump(
+                {
+                    "categories": self.categories,
+                    "options": self.options,
+                    "statuses": self.statuses,
+                    "ids": self.ids.tolist(),
+                },
+                f,
+            )
+        numpy.savez(
+            path / "arrays.npz",
+            respondents=self.respondents,
+            answered=self.answered,
+            row_status=self._status[: self._size],
+            row_codes=self._codes[: self._size],
+            **{f"counts_{i}": c for i, c in enumerate(self.counts.values())},
+            **{f"cooc_{i}": c for i, c in enumerate(self.cooccurrence.values())},
+            **{
+                f"bitsets_{i}": b[: self._size]
+                for i, b in enumerate(self._bitsets.values())
+            },
+        )
+
+    @classmethod
+    def load(cls, path: Path = STATE_PATH) -> "AggregateState":
+        """Load a state saved with `save`."""
+        path = Path(path)
+        with open(path / "state.json") as f:
+            metadata = json.load(f)
+        state = cls(metadata["categories"], metadata["options"], metadata["statuses"])
+        with numpy.load(path / "arrays.npz") as arrays:
+            state.respondents = arrays["respondents"]
+            state.answered = arrays["answered"]
+            state._status = arrays["row_status"]
+            state._codes = arrays["row_codes"]
+            for i, column in enumerate(state.categories):
+                state.counts[column] = arrays[f"counts_{i}"]
+            for i, column in enumerate(state.options):
+                state.cooccurrence[column] = arrays[f"cooc_{i}"]
+                state._bitsets[column] = arrays[f"bitsets_{i}"]
+        state._ids = numpy.array(metadata["ids"] + [None], dtype=object)[:-1]
+        state._size = len(state._ids)
+        state._rows = {id_: row for row, id_ in enumerate(state._ids)}
+        return state
+
+    def _encode(self, batch: pandas.DataFrame) -> dict:
+        codes = numpy.column_stack(
+            [category_codes(batch[c], self.categories[c])[0] for c in self.categories]
+            or [numpy.zeros((len(batch), 0))]
+        ).astype(numpy.int16)
+        return {
+            "status": category_codes(batch[col.q0d], self.statuses)[0].astype(
+                numpy.int16
+            ),
+            "codes": codes,
+            "indicators": {
+                c: multi_select_indicators(batch[c], self.options[c])[0]
+                for c in self.options
+            },
+        }
+
+    def _stored(self, rows: numpy.ndarray) -> dict:
+        return {
+            "status": self._status[rows],
+            "codes": self._codes[rows],
+            "indicators": {
+                c: unpack_bitsets(bitsets[rows], len(self.options[c]))
+                for c, bitsets in self._bitsets.items()
+            },
+        }
+
+    def _find(self, ids: Iterable) -> numpy.ndarray:
+        # Stored rows of response IDs, -1 for those not counted.
+        return numpy.array([self._rows.get(id_, -1) for id_ in ids], dtype=numpy.int64)
+
+    def _append(self, ids: numpy.ndarray) -> numpy.ndarray:
+        # Rows for new respondents, growing the stored arrays if needed.
+        start, end = self._size, self._size + len(ids)
+        if end > len(self._status):
+            capacity = max(end, 2 * len(self._status), INITIAL_CAPACITY)
+            self._ids = _grow(self._ids, capacity)
+            self._status = _grow(self._status, capacity)
+            self._codes = _grow(self._codes, capacity)
+            self._bitsets = {c: _grow(b, capacity) for c, b in self._bitsets.items()}
+        self._ids[start:end] = ids
+        self._rows.update(zip(ids, range(start, end)))
+        self._size = end
+        return numpy.arange(start, end)
+
+    def _move(self, source: numpy.ndarray, destination: numpy.ndarray) -> None:
+        # Move stored rows, keeping the ID to row map up to date.
+        self._ids[destination] = self._ids[source]
+        self._status[destination] = self._status[source]
+        self._codes[destination] = self._codes[source]
+        for bitsets in self._bitsets.values():
+            bitsets[destination] = bitsets[source]
+        self._rows.update(zip(self._ids[destination], destination.tolist()))
+
+    def _apply(self, encoded: dict, sign: int) -> None:
+        # Add (sign=1) or retract (sign=-1) respondents' contributions.
+        status = encoded["status"].astype(numpy.int64)
+        known = status >= 0
+        n_statuses = len(self.statuses)
+        self.respondents += sign * numpy.bincount(status[known], minlength=n_statuses)
+
+        answered = numpy.column_stack(
+            [encoded["codes"] >= 0]
+            + [encoded["indicators"][c].any(axis=1)[:, None] for c in self.options]
+        )[known]
+        for i in range(n_statuses):
+            self.answered[i] += sign * answered[status[known] == i].sum(axis=0)
+
+        for j, column in enumerate(self.categories):
+            codes = encoded["codes"][:, j].astype(numpy.int64)
+            valid = known & (codes >= 0)
+            n = len(self.categories[column])
+            self.counts[column] += sign * numpy.bincount(
+                status[valid] * n + codes[valid], minlength=n_statuses * n
+            ).reshape(n_statuses, n)
+
+        for column in self.options:
+            indicators = encoded["indicators"][column].astype(numpy.int64)
+            for i in range(n_statuses):
+                selected = indicators[status == i]
+                self.cooccurrence[column][i] += sign * (selected.T @ selected)
+
+    def _extend(self, batch: pandas.DataFrame) -> None:
+        # Make room for answers and options not seen before.
+        for column, categories in self.categories.items():
+            new = [
+                value
+                for value in pandas.unique(batch[column].dropna())
+                if value not in categories
+            ]
+            if new:
+                categories.extend(new)
+                self.counts[column] = numpy.pad(
+                    self.counts[column], ((0, 0), (0, len(new)))
+                )
+        for column, options in self.options.items():
+            new = [
+                value
+                for value in pandas.unique(batch[column].explode().dropna())
+                if value not in options
+            ]
+            if new:
+                options.extend(new)
+                self.cooccurrence[column] = numpy.pad(
+                    self.cooccurrence[column], ((0, 0), (0, len(new)), (0, len(new)))
+                )
+                width = -(-len(options) // 8) - self._bitsets[column].shape[1]
+                if width:
+                    self._bitsets[column] = numpy.pad(
+                        self._bitsets[column], ((0, 0), (0, width))
+                    )
+        new = [
+            s for s in pandas.unique(batch[col.q0d].dropna()) if s not in self.statuses
+        ]
+        if new:
+            self.statuses.extend(new)
+            self.respondents = numpy.pad(self.respondents, (0, len(new)))
+            self.answered = numpy.pad(self.answered, ((0, len(new)), (0, 0)))
+            self.counts = {
+                c: numpy.pad(a, ((0, len(new)), (0, 0))) for c, a in self.counts.items()
+            }
+            self.cooccurrence = {
+                c: numpy.pad(a, ((0, len(new)), (0, 0), (0, 0)))
+                for c, a in self.cooccurrence.items()
+            }
+
+
+def _grow(array: numpy.ndarray, capacity: int) -> numpy.ndarray:
+    # A copy of an array with `capacity` rows, the new rows zeroed.
+    grown = numpy.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+    if array.dtype == object:
+        grown[:] = None
+    grown[: len(array)] = array
+    return grown
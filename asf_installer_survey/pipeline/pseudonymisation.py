@@ -0,0 +1,265 @@
+"""Pseudonymise respondent-level outputs before they leave the pipeline.
+
+- Response IDs (`q0a`) are replaced with keyed hashes, computed for the whole
+  column at once with pandas' SipHash implementation. The key is read from the
+  environment variable named in `config/base.yaml`, so pseudonyms are stable
+  across runs and waves but can't be reversed or recomputed without it.
+- "Other" free text is scrubbed of the patterns configured in
+  `config/base.yaml` (emails, phone numbers, postcodes) and of a configured
+  list of company names. The rules are combined into one precompiled regex
+  with a named group per rule, so each answer is scanned in one pass, and
+  chunks of answers are redacted in a pool of processes.
+
+Each match is replaced with the rule's name in capitals, e.g. "[EMAIL]", and
+counted, giving an audit of redactions by rule and column.
+
+Usage:
+    python -m asf_installer_survey.pipeline.pseudonymisation <in.parquet> <out.parquet>
+"""
+import argparse
+import base64
+import functools
+import hashlib
+import os
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import pandas
+
+from asf_installer_survey import config, logger, PROJECT_DIR
+from asf_installer_survey.utils.instrumentation import instrumented
+from asf_installer_survey.utils.lookups import QuestionNumbers as col
+from asf_installer_survey.utils.parallel import process_map
+from asf_installer_survey.utils.questions import free_text_columns
+
+_config = config["pseudonymisation"]
+KEY_VARIABLE = _config["key_variable"]
+PATTERNS: Dict[str, str] = _config["patterns"]
+COMPANY_NAMES_PATH = (
+    PROJECT_DIR / _config["company_names"] if _config["company_names"] else None
+)
+
+COMPANY = "company"
+CHUNK_SIZE = 10_000
+
+
+class Pseudonymised(NamedTuple):
+    """Pseudonymised survey data.
+
+    Attributes:
+        data: The data, with pseudonymised IDs and redacted free text.
+        audit: Number of redactions by rule and column.
+    """
+
+    data: pandas.DataFrame
+    audit: pandas.DataFrame
+
+
+def redaction_pattern(
+    patterns: Dict[str, str] = PATTERNS,
+    company_names: Optional[List[str]] = None,
+) -> re.Pattern:
+    """Combine redaction rules into a single regex.
+
+    Args:
+        patterns (Dict[str, str]): Regexes by rule name.
+        company_names (Optional[List[str]]): Names to redact as whole words,
+            under the rule `COMPANY`. Defaults to those in the configured
+            file, if any.
+
+    Returns:
+        re.Pattern: Case insensitive regex with a named group per rule.
+    """
+    if company_names is None:
+        company_names = _read_company_names()
+    rules = dict(patterns)
+    if company_names:
+        # Longest first, so a name isn't redacted only up to a shorter one.
+        names = sorted({name.strip() for name in company_names if name.strip()})
+        names.sort(key=len, reverse=True)
+        rules[COMPANY] = rf"(?<!\w)(?:{'|'.join(map(re.escape, names))})(?!\w)"
+    return re.compile(
+        "|".join(f"(?P<{name}>{pattern})" for name, pattern in rules.items()),
+        re.IGNORECASE,
+    )
+
+
+def pseudonymise_ids(ids: pandas.Series, key: str) -> pandas.Series:
+    """Replace IDs with keyed hashes.
+
+    Args:
+        ids (pandas.Series): Respondent IDs.
+        key (str): Secret key.
+
+    Raises:
+        ValueError: If two distinct IDs hash to the same pseudonym.
+
+    Returns:
+        pandas.Series: 16 hex digit pseudonyms, missing where the ID is.
+    """
+    # `hash_pandas_object` takes a 16 character key. Numbers are hashed
+    # without it, so IDs are hashed as strings.
+    siphash_key = base64.b64encode(hashlib.sha256(key.encode()).digest()[:12])
+    answered = ids.notna()
+    hashes = pandas.util.hash_pandas_object(
+        ids[answered].astype(str),
+        index=False,
+        hash_key=siphash_key.decode(),
+        categorize=False,
+    )
+    pseudonyms = pandas.Series(
+        [f"{h:016x}" for h in hashes.to_numpy()], index=hashes.index, dtype="str"
+    ).reindex(ids.index)
+    if pseudonyms[answered].nunique() != ids[answered].nunique():
+        raise ValueError("Pseudonyms collide; use a different key.")
+    return pseudonyms
+
+
+def redact(
+    data: pandas.DataFrame,
+    columns: List[str],
+    pattern: Optional[re.Pattern] = None,
+    chunk_size: int = CHUNK_SIZE,
+    n_jobs: Optional[int] = None,
+) -> Tuple[pandas.DataFrame, pandas.DataFrame]:
+    """Redact free text columns.
+
+    Answers from every column are chunked together, so small columns don't
+    each cost a pass of their own.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        columns (List[str]): Free text columns to redact.
+        pattern (Optional[re.Pattern]): Combined regex (see
+            `redaction_pattern`). Defaults to the configured rules.
+        chunk_size (int): Answers per chunk.
+        n_jobs (Optional[int]): Number of worker processes.
+
+    Returns:
+        Tuple[pandas.DataFrame, pandas.DataFrame]: The columns, redacted, and
+            the number of redactions by rule and column.
+    """
+    pattern = pattern or redaction_pattern()
+    answered = {column: data[column].notna().to_numpy() for column in columns}
+    texts, labels = [], []
+    for i, column in enumerate(columns):
+        values = data[column].to_numpy(dtype=object)[answered[column]]
+        texts += [str(value) for value in values]
+        labels += [i] * len(values)
+    chunks = [
+        (texts[start : start + chunk_size], labels[start : start + chunk_size])
+        for start in range(0, len(texts), chunk_size)
+    ]
+    results = process_map(
+        functools.partial(_redact_chunk, pattern=pattern), chunks, n_jobs
+    )
+
+    redacted_texts = iter([text for chunk, _ in results for text in chunk])
+    redacted = {}
+    for column in columns:
+        values = data[column].to_numpy(dtype=object, copy=True)
+        values[answered[column]] = [
+            next(redacted_texts) for _ in range(answered[column].sum())
+        ]
+        # Redactions aren't among a categorical column's categories.
+        dtype = data[column].dtype
+        redacted[column] = pandas.Series(
+            values,
+            index=data.index,
+            dtype=dtype if isinstance(dtype, pandas.StringDtype) else object,
+        )
+
+    counts = sum((chunk_counts for _, chunk_counts in results), Counter())
+    audit = pandas.DataFrame(
+        [
+            (rule, column, counts[i, rule])
+            for rule in pattern.groupindex
+            for i, column in enumerate(columns)
+        ],
+        columns=["rule", "column", "redactions"],
+    )
+    return pandas.DataFrame(redacted, index=data.index), audit
+
+
+@instrumented
+def pseudonymise(
+    data: pandas.DataFrame,
+    key: Optional[str] = None,
+    columns: Optional[List[str]] = None,
+    pattern: Optional[re.Pattern] = None,
+    n_jobs: Optional[int] = None,
+) -> Pseudonymised:
+    """Pseudonymise response IDs and redact free text.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        key (Optional[str]): Secret key for hashing IDs. Defaults to the
+            value of the configured environment variable.
+        columns (Optional[List[str]]): Free text columns to redact. Defaults
+            to every "Other" column in `data`.
+        pattern (Optional[re.Pattern]): Combined redaction regex. Defaults to
+            the configured rules.
+        n_jobs (Optional[int]): Number of worker processes.
+
+    Raises:
+        ValueError: If no key is given and the environment variable isn't set.
+
+    Returns:
+        Pseudonymised: The data and an audit of redactions.
+    """
+    key = key or os.environ.get(KEY_VARIABLE)
+    if not key:
+        raise ValueError(
+            f"No pseudonymisation key given, and {KEY_VARIABLE} isn't set."
+        )
+    if columns is None:
+        columns = [column for column in free_text_columns() if column in data]
+
+    data = data.copy()
+    data[col.q0a] = pseudonymise_ids(data[col.q0a], key)
+    redacted, audit = redact(data, columns, pattern, n_jobs=n_jobs)
+    data[columns] = redacted
+
+    totals = audit.groupby("rule", sort=False)["redactions"].sum()
+    logger.info(
+        "Redacted "
+        + ", ".join(f"{count} {rule}" for rule, count in totals.items())
+        + f" from {len(columns)} free text columns."
+    )
+    return Pseudonymised(data, audit)
+
+
+def _redact_chunk(chunk, pattern: re.Pattern):
+    # Each text is scanned on its own, so no rule can match across answers.
+    texts, labels = chunk
+    counts = Counter()
+    redacted = [
+        pattern.sub(functools.partial(_replace, counts=counts, label=label), text)
+        for text, label in zip(texts, labels)
+    ]
+    return redacted, counts
+
+
+def _replace(match: re.Match, counts: Counter, label: int) -> str:
+    counts[label, match.lastgroup] += 1
+    return f"[{match.lastgroup.upper()}]"
+
+
+def _read_company_names() -> List[str]:
+    if COMPANY_NAMES_PATH is None or not COMPANY_NAMES_PATH.exists():
+        return []
+    return COMPANY_NAMES_PATH.read_text().splitlines()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("data", type=Path, help="Survey data parquet file.")
+    parser.add_argument("output", type=Path, help="Pseudonymised parquet file.")
+    parser.add_argument("--jobs", type=int, default=None)
+    args = parser.parse_args()
+
+    result = pseudonymise(pandas.read_parquet(args.data), n_jobs=args.jobs)
+    result.data.to_parquet(args.output)
+    print(result.audit.loc[lambda df: df["redactions"] > 0].to_string())
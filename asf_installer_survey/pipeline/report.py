@@ -0,0 +1,250 @@
+"""Build a report summarising every question in the survey.
+
+Each question in `QuestionNumbers` becomes a section holding the summary for
+its type (see `analysis.summaries`), optionally split by a grouping column.
+Summaries pass through disclosure control (see `pipeline.disclosure`) before
+they're rendered, with withheld counts shown as "[c]" (other missing values,
+such as the proportion of an empty group, are left blank). Sections are rendered
+in a pool of processes and cached on disk by a hash of the question's
+columns, their data and the split, so rebuilding the report after a change to
+one question only re-renders that question's section.
+
+Usage:
+    python -m asf_installer_survey.pipeline.report <data.parquet> [--by COL]
+"""
+import argparse
+import html
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy
+import pandas
+
+from asf_installer_survey import logger, PROJECT_DIR
+from asf_installer_survey.analysis.summaries import (
+    free_text_summary,
+    summarise_question,
+)
+from asf_installer_survey.pipeline.disclosure import (
+    protect_summary,
+    ROUND_TO,
+    THRESHOLD,
+)
+from asf_installer_survey.utils.cache import (
+    dataset_fingerprint,
+    hash_key,
+    load_cached,
+    save_cached,
+)
+from asf_installer_survey.utils.instrumentation import instrumented
+from asf_installer_survey.utils.parallel import process_map
+from asf_installer_survey.utils.questions import (
+    other_column,
+    question_columns,
+    question_kind,
+    question_numbers,
+)
+from asf_installer_survey.utils.routing import identify_subpopulation
+
+REPORTS_DIR = PROJECT_DIR / "outputs/reports"
+
+# Bump to invalidate cached sections after changing how they're rendered.
+_SECTION_VERSION = 3
+
+# Shown in place of counts withheld for disclosure control.
+WITHHELD = "[c]"
+
+
+def section_key(
+    data: pandas.DataFrame, number: str, by: Optional[str], fmt: str
+) -> str:
+    """Hash everything a question's report section depends on."""
+    columns = [column for column in question_columns(number) if column in data]
+    used = list(dict.fromkeys(columns + ([by] if by is not None else [])))
+    return hash_key(
+        _SECTION_VERSION,
+        number,
+        columns,
+        by,
+        fmt,
+        THRESHOLD,
+        ROUND_TO,
+        dataset_fingerprint(data[used]),
+    )
+
+
+def section_title(number: str) -> str:
+    """Return a question's title: its column, or its grid's shared stem."""
+    columns = question_columns(number)
+    return columns[0].split(":")[0] if len(columns) > 1 else columns[0]
+
+
+def render_section(
+    data: pandas.DataFrame, number: str, by: Optional[str] = None, fmt: str = "html"
+) -> str:
+    """Render the report section for one question.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        number (str): Question number, e.g. "q16a".
+        by (Optional[str]): Column to split the summary by.
+        fmt (str): "html" or "md".
+
+    Returns:
+        str: The rendered section.
+    """
+    title = section_title(number)
+    kind = question_kind(data, number)
+    tables = [summarise_question(data, number, by)]
+    other = other_column(number)
+    if other is not None:
+        tables.append(free_text_summary(data, other, by))
+    tables = [protect_summary(table).fillna({"disclosure": ""}) for table in tables]
+
+    if fmt == "md":
+        body = "\n\n".join(_markdown_table(table) for table in tables)
+        return f"## {title}\n\n_{kind}_\n\n{body}\n"
+    body = "".join(_display(table).to_html(index=False) for table in tables)
+    return (
+        f'<section id="{number}"><h2>{html.escape(title)}</h2>'
+        f"<p><em>{kind}</em></p>{body}</section>\n"
+    )
+
+
+@instrumented
+def build_report(
+    data: pandas.DataFrame,
+    path: Optional[Path] = None,
+    by: Optional[str] = None,
+    fmt: str = "html",
+    n_jobs: Optional[int] = None,
+    title: str = "ASF Installer Survey: All Questions",
+) -> Path:
+    """Write a report summarising every question present in the data.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        path (Optional[Path]): Output file. Defaults to
+            `outputs/reports/all_questions.<fmt>`.
+        by (Optional[str]): Column to split summaries by, e.g.
+            "subpopulation" (added with `identify_subpopulation` if missing).
+        fmt (str): "html" for a self-contained HTML page or "md" for Markdown.
+        n_jobs (Optional[int]): Worker processes for uncached sections.
+        title (str): Report title.
+
+    Returns:
+        Path: The path written to.
+    """
+    if by == "subpopulation" and by not in data:
+        data = data.assign(subpopulation=identify_subpopulation(data))
+    path = Path(path or REPORTS_DIR / f"all_questions.{fmt}")
+
+    numbers = [
+        number
+        for number in question_numbers()
+        if all(column in data for column in question_columns(number))
+    ]
+    keys = [section_key(data, number, by, fmt) for number in numbers]
+    sections = [load_cached("report_sections", key) for key in keys]
+
+    stale = [i for i, section in enumerate(sections) if section is None]
+    logger.info(
+        f"Rendering {len(stale)} of {len(numbers)} report sections "
+        f"({len(numbers) - len(stale)} cached)."
+    )
+    rendered = process_map(
+        _render_task,
+        [
+            (
+                data[_section_columns(numbers[i], by)],
+                numbers[i],
+                by,
+                fmt,
+            )
+            for i in stale
+        ],
+        n_jobs=n_jobs,
+    )
+    for i, section in zip(stale, rendered):
+        save_cached("report_sections", keys[i], section)
+        sections[i] = section
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf8") as f:
+        f.write(_document(sections, title, fmt))
+    logger.info(f"Report written to {path}.")
+    return path
+
+
+def _section_columns(number: str, by: Optional[str]) -> List[str]:
+    # A question's columns and the split column, which may be one of them.
+    return list(dict.fromkeys(question_columns(number) + ([by] if by else [])))
+
+
+def _render_task(task: Tuple[pandas.DataFrame, str, Optional[str], str]) -> str:
+    return render_section(*task)
+
+
+def _document(sections: List[str], title: str, fmt: str) -> str:
+    if fmt == "md":
+        return f"# {title}\n\n" + "\n".join(sections)
+    return (
+        "<!DOCTYPE html>\n<html><head><meta charset='utf-8'>"
+        f"<title>{html.escape(title)}</title><style>"
+        "body{font-family:sans-serif;max-width:70em;margin:auto}"
+        "table{border-collapse:collapse;margin-bottom:2em}"
+        "td,th{border:1px solid #ccc;padding:0.2em 0.5em}"
+        f"</style></head><body><h1>{html.escape(title)}</h1>\n"
+        + "".join(sections)
+        + "</body></html>\n"
+    )
+
+
+def _display(frame: pandas.DataFrame) -> pandas.DataFrame:
+    # Cells as text. Missing values are shown as withheld only in rows
+    # disclosure control flagged, as in `pipeline.workbook`.
+    withheld = (
+        frame["disclosure"].fillna("").to_numpy() != ""
+        if "disclosure" in frame
+        else numpy.zeros(len(frame), dtype=bool)
+    )
+    return pandas.DataFrame(
+        [
+            [_cell(value, row_withheld) for value in row]
+            for row, row_withheld in zip(frame.itertuples(index=False), withheld)
+        ],
+        columns=frame.columns,
+    )
+
+
+def _cell(value, withheld: bool) -> str:
+    if pandas.isna(value):
+        return WITHHELD if withheld else ""
+    return f"{value:.3f}" if isinstance(value, float) else str(value)
+
+
+def _markdown_table(frame: pandas.DataFrame) -> str:
+    rows = [list(frame.columns), ["---"] * frame.shape[1]]
+    rows += [
+        [text.replace("|", "\\|") for text in row]
+        for row in _display(frame).itertuples(index=False)
+    ]
+    return "\n".join("| " + " | ".join(map(str, row)) + " |" for row in rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("data", type=Path, help="Survey data parquet file.")
+    parser.add_argument("--by", help="Column to split summaries by.")
+    parser.add_argument("--format", dest="fmt", choices=["html", "md"], default="html")
+    parser.add_argument("--output", type=Path, help="Output file.")
+    parser.add_argument("--jobs", type=int, help="Number of worker processes.")
+    args = parser.parse_args()
+
+    build_report(
+        pandas.read_parquet(args.data),
+        path=args.output,
+        by=args.by,
+        fmt=args.fmt,
+        n_jobs=args.jobs,
+    )
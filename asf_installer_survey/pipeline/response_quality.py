@@ -0,0 +1,127 @@
+"""Straight-lining and low-variance response detection for grid questions.
+
+Each grid is encoded as a respondent by item array of answer codes, and the
+following are computed for every respondent over the items they answered:
+
+- the variance of their answer codes,
+- the longest run of identical consecutive answers,
+- the entropy of their answer distribution.
+
+Straight-lining (the same answer for every item) gives zero variance and zero
+entropy. The per-grid entropies are normalised and averaged into a single
+quality score between 0 (straight-lined every grid) and 1.
+"""
+from typing import Dict, List
+
+import numpy
+import pandas
+
+from asf_installer_survey.utils.encoding import grid_codes
+from asf_installer_survey.utils.instrumentation import instrumented
+from asf_installer_survey.utils.lookups import QuestionNumbers as col
+
+GRIDS: Dict[str, List[str]] = {
+    "q57": col.q57,
+    "q58a": col.q58a,
+    "q58b": col.q58b,
+    "q58c": col.q58c,
+    "q58d": col.q58d,
+    "q105": col.q105,
+    "q106": col.q106,
+}
+
+# Grids with fewer answered items than this don't contribute to the score.
+MIN_ITEMS = 3
+
+
+def grid_metrics(codes: numpy.ndarray, n_categories: int) -> pandas.DataFrame:
+    """Compute within-grid response variability for each respondent.
+
+    Args:
+        codes (numpy.ndarray): Respondent by item answer codes, -1 for missing.
+        n_categories (int): Number of answer categories in the grid.
+
+    Returns:
+        pandas.DataFrame: Number of items answered, variance of answer codes,
+            longest run of identical consecutive answers, answer entropy (in
+            nats) and a straight-lining flag, one row per respondent.
+    """
+    n_respondents, n_items = codes.shape
+    answered = codes >= 0
+    n_answered = answered.sum(axis=1)
+
+    # Counts of each answer category per respondent, via one bincount.
+    offset = numpy.arange(n_respondents)[:, None] * n_categories
+    counts = numpy.bincount(
+        (offset + codes)[answered], minlength=n_respondents * n_categories
+    ).reshape(n_respondents, n_categories)
+
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        values = numpy.arange(n_categories)
+        mean = (counts * values).sum(axis=1) / n_answered
+        variance = (counts * values**2).sum(axis=1) / n_answered - mean**2
+        proportions = counts / n_answered[:, None]
+        information = numpy.where(counts > 0, proportions * numpy.log(proportions), 0)
+        entropy = 0.0 - information.sum(axis=1)
+
+    # Longest run of identical answers, skipping over unanswered items.
+    run = answered[:, 0].astype(numpy.int64)
+    longest = run.copy()
+    previous = codes[:, 0].copy()
+    for i in range(1, n_items):
+        current = codes[:, i]
+        same = answered[:, i] & (current == previous)
+        run = numpy.where(same, run + 1, numpy.where(answered[:, i], 1, run))
+        previous = numpy.where(answered[:, i], current, previous)
+        numpy.maximum(longest, run, out=longest)
+
+    return pandas.DataFrame(
+        {
+            "n_answered": n_answered,
+            "variance": numpy.where(n_answered > 0, variance, numpy.nan),
+            "longest_run": longest,
+            "entropy": numpy.where(n_answered > 0, entropy, numpy.nan),
+            "straight_lined": (n_answered >= MIN_ITEMS) & (longest == n_answered),
+        }
+    )
+
+
+@instrumented
+def score_response_quality(
+    data: pandas.DataFrame, grids: Dict[str, List[str]] = GRIDS
+) -> pandas.DataFrame:
+    """Score each respondent's grid answers for straight-lining.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        grids (Dict[str, List[str]]): Grid names mapped to their item columns.
+
+    Returns:
+        pandas.DataFrame: Per-grid metrics (with columns named
+            `<grid>_<metric>`), the number of grids straight-lined and the
+            overall `quality_score`, indexed as `data`. The score is `NaN` for
+            respondents who didn't answer at least `MIN_ITEMS` of any grid.
+    """
+    frames = []
+    normalised = []
+    for name, columns in grids.items():
+        codes, categories = grid_codes(data, columns)
+        metrics = grid_metrics(codes, len(categories))
+
+        # Maximum attainable entropy given the items answered and scale size.
+        n_distinct = numpy.minimum(metrics["n_answered"], len(categories))
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            score = metrics["entropy"] / numpy.log(n_distinct)
+        normalised.append(
+            numpy.where(metrics["n_answered"] >= MIN_ITEMS, score, numpy.nan)
+        )
+        frames.append(metrics.add_prefix(f"{name}_"))
+
+    quality = pandas.concat(frames, axis=1).set_index(data.index)
+    quality["grids_straight_lined"] = quality.filter(like="_straight_lined").sum(axis=1)
+    normalised = numpy.column_stack(normalised)
+    eligible = ~numpy.isnan(normalised)
+    with numpy.errstate(invalid="ignore"):
+        score = numpy.nansum(normalised, axis=1) / eligible.sum(axis=1)
+    quality["quality_score"] = score
+    return quality
@@ -0,0 +1,423 @@
+"""Compare two snapshots of the survey data, aligned on response ID.
+
+Extracts are re-delivered with new date prefixes, and a diff shows what
+changed between deliveries: responses added or removed, answers edited (e.g.
+by changes to cleaning) and statuses flipped from partial to complete.
+
+Snapshots are streamed from parquet in batches, reading only the columns
+compared, so neither is held in memory whole:
+
+1. Each respondent's answers are hashed per column group (a question's
+   columns, or a single metadata column), giving a respondent by group array
+   of hashes per snapshot. Answer distributions are counted along the way.
+2. Respondents in both snapshots whose hashes differ for a group have
+   changed; only their rows, and only the columns of the groups that differ,
+   are read again to list the changed cells.
+
+Values are compared as strings (multi-select answers as the list of options
+selected), so a column that changes type without changing value isn't
+reported as changed. Integral floats are written as integers: pandas stores
+integer columns as floats once any value is missing, and 1.0 in one snapshot
+is the same answer as 1 in the other. Response IDs are aligned on the same
+strings.
+
+Usage:
+    python -m asf_installer_survey.pipeline.snapshot_diff <old.parquet> <new.parquet>
+"""
+import argparse
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+import numpy
+import pandas
+import pyarrow
+import pyarrow.dataset as ds
+
+from asf_installer_survey import logger
+from asf_installer_survey.utils.instrumentation import instrumented
+from asf_installer_survey.utils.lookups import QuestionNumbers as col
+from asf_installer_survey.utils.questions import (
+    METADATA,
+    MULTI_SELECT,
+    question_columns,
+    question_numbers,
+    SINGLE_SELECT,
+)
+
+ID_COLUMN = col.q0a
+BATCH_SIZE = 10_000
+
+_HASH_MULTIPLIER = numpy.uint64(0x100000001B3)
+
+
+class SnapshotDiff(NamedTuple):
+    """Differences between two snapshots of the survey data.
+
+    Attributes:
+        added: Response IDs only in the new snapshot.
+        removed: Response IDs only in the old snapshot.
+        changed_cells: Each changed answer of a respondent in both snapshots,
+            with its response ID, question, column and old and new values.
+        changes: Number of respondents and cells changed by question.
+        shifts: For each single and multi-select column and option, its count
+            and share of respondents answering in each snapshot.
+    """
+
+    added: List
+    removed: List
+    changed_cells: pandas.DataFrame
+    changes: pandas.DataFrame
+    shifts: pandas.DataFrame
+
+
+def column_groups(columns: List[str]) -> Dict[str, List[str]]:
+    """Group columns by the question they belong to.
+
+    Args:
+        columns (List[str]): Column names.
+
+    Returns:
+        Dict[str, List[str]]: Columns by question number (e.g. "q16a"), with
+            response metadata and columns not in the questionnaire each in a
+            group of their own, named after the column.
+    """
+    present = set(columns)
+    groups, grouped = {}, set()
+    for number in METADATA + question_numbers():
+        members = [column for column in question_columns(number) if column in present]
+        if members:
+            groups[number] = members
+            grouped.update(members)
+    groups.update({column: [column] for column in columns if column not in grouped})
+    return groups
+
+
+@instrumented
+def diff_snapshots(
+    old_path: Path,
+    new_path: Path,
+    columns: Optional[List[str]] = None,
+    batch_size: int = BATCH_SIZE,
+) -> SnapshotDiff:
+    """Compare two snapshots of the survey data.
+
+    Args:
+        old_path (Path): Parquet file of the earlier snapshot.
+        new_path (Path): Parquet file of the later snapshot.
+        columns (Optional[List[str]]): Columns to compare. Defaults to every
+            column in both snapshots.
+        batch_size (int): Rows read at a time.
+
+    Raises:
+        ValueError: If a snapshot has no response ID column, or repeats an ID.
+
+    Returns:
+        SnapshotDiff: The differences.
+    """
+    old = ds.dataset(old_path, format="parquet")
+    new = ds.dataset(new_path, format="parquet")
+    for dataset, path in [(old, old_path), (new, new_path)]:
+        if ID_COLUMN not in dataset.schema.names:
+            raise ValueError(f"{path} has no {ID_COLUMN!r} column.")
+
+    shared = set(old.schema.names) & set(new.schema.names)
+    compared = [
+        column
+        for column in (columns or new.schema.names)
+        if column != ID_COLUMN and column in shared
+    ]
+    for dataset, name in [(old, "old"), (new, "new")]:
+        only = set(dataset.schema.names) - shared
+        if columns is None and only:
+            logger.warning(f"{len(only)} columns only in the {name} snapshot.")
+    groups = column_groups(compared)
+    kinds = {
+        column: _kind(new.schema.field(column).type)
+        or _kind(old.schema.field(column).type)
+        for column in compared
+    }
+
+    old_scan = _scan(old, groups, kinds, batch_size)
+    new_scan = _scan(new, groups, kinds, batch_size)
+    for scan, path in [(old_scan, old_path), (new_scan, new_path)]:
+        if len(numpy.unique(scan["ids"])) != len(scan["ids"]):
+            raise ValueError(f"{path} has repeated response IDs.")
+
+    _, in_old, in_new = numpy.intersect1d(
+        old_scan["ids"], new_scan["ids"], return_indices=True
+    )
+    added = new_scan["raw_ids"][
+        numpy.setdiff1d(numpy.arange(len(new_scan["ids"])), in_new)
+    ]
+    removed = old_scan["raw_ids"][
+        numpy.setdiff1d(numpy.arange(len(old_scan["ids"])), in_old)
+    ]
+
+    # Respondent by group flags of which answers changed.
+    differs = old_scan["hashes"][in_old] != new_scan["hashes"][in_new]
+    changed = differs.any(axis=1)
+    changed_groups = [
+        name for name, differ in zip(groups, differs.any(axis=0)) if differ
+    ]
+    read = [column for name in changed_groups for column in groups[name]]
+    old_rows = _read_rows(old, old_scan["raw_ids"][in_old[changed]], read, batch_size)
+    new_rows = _read_rows(new, new_scan["raw_ids"][in_new[changed]], read, batch_size)
+
+    changed_cells = _changed_cells(
+        old_rows,
+        new_rows,
+        new_scan["ids"][in_new],
+        differs,
+        groups,
+        changed_groups,
+    )
+    logger.info(
+        f"{len(added)} responses added, {len(removed)} removed and "
+        f"{changed.sum()} changed ({len(changed_cells)} cells)."
+    )
+    return SnapshotDiff(
+        added=added.tolist(),
+        removed=removed.tolist(),
+        changed_cells=changed_cells,
+        changes=(
+            changed_cells.groupby("question", sort=False)
+            .agg(
+                respondents=("response_id", "nunique"),
+                cells=("response_id", "size"),
+            )
+            .reset_index()
+        ),
+        shifts=_shifts(old_scan, new_scan, compared),
+    )
+
+
+def _kind(data_type: pyarrow.DataType) -> Optional[str]:
+    # Single and multi-select columns have their distributions compared.
+    if pyarrow.types.is_dictionary(data_type):
+        return SINGLE_SELECT
+    if pyarrow.types.is_list(data_type) or pyarrow.types.is_large_list(data_type):
+        return MULTI_SELECT
+    return None
+
+
+def _canonical(series: pandas.Series) -> numpy.ndarray:
+    # Values as strings (None where missing), so that both snapshots' values
+    # hash and compare alike whatever their dtypes.
+    if isinstance(series.dtype, pandas.CategoricalDtype):
+        categories = numpy.append(
+            _canonical(series.cat.categories.to_series()), numpy.array([None])
+        )
+        return categories[series.cat.codes.to_numpy()]
+    if series.dtype == "object":
+        values = series.to_numpy()
+        canonical = numpy.full(len(values), None, dtype=object)
+        for i in numpy.flatnonzero(~pandas.isna(values)):
+            value = values[i]
+            # Multi-select answers are array-likes of options.
+            canonical[i] = (
+                value
+                if isinstance(value, str)
+                else (
+                    repr([str(option) for option in value])
+                    if hasattr(value, "__len__")
+                    else str(value)
+                )
+            )
+        return canonical
+    if pandas.api.types.is_float_dtype(series.dtype):
+        # Integral floats as integers (1.0 as "1").
+        values = series.to_numpy(dtype=numpy.float64, na_value=numpy.nan)
+        canonical = series.astype(str).to_numpy(dtype=object)
+        integral = numpy.abs(values) < 2**63
+        integral[integral] = values[integral] == numpy.floor(values[integral])
+        canonical[integral] = values[integral].astype(numpy.int64).astype(str)
+        canonical[numpy.isnan(values)] = None
+        return canonical
+    missing = series.isna().to_numpy()
+    values = series.astype(str).to_numpy(dtype=object)
+    values[missing] = None
+    return values
+
+
+def _scan(
+    dataset: ds.Dataset,
+    groups: Dict[str, List[str]],
+    kinds: Dict[str, Optional[str]],
+    batch_size: int,
+) -> Dict:
+    # Stream a snapshot, hashing each row's groups and counting answers.
+    ids, raw_ids, hashes = [], [], []
+    counts = {column: Counter() for column, kind in kinds.items() if kind}
+    answered = {column: 0 for column in counts}
+    columns = [ID_COLUMN] + [column for group in groups.values() for column in group]
+    for batch in dataset.to_batches(columns=columns, batch_size=batch_size):
+        frame = batch.to_pandas()
+        raw = frame[ID_COLUMN].to_numpy()
+        keep = pandas.notna(raw)
+        if not keep.all():
+            logger.warning(f"Skipping {(~keep).sum()} responses without an ID.")
+        frame = frame[keep]
+        raw_ids.append(raw[keep])
+        ids.append(_canonical(frame[ID_COLUMN]))
+
+        values = {column: _canonical(frame[column]) for column in columns[1:]}
+        hashes.append(
+            numpy.column_stack(
+                [_group_hash([values[c] for c in group]) for group in groups.values()]
+                or [numpy.empty((len(frame), 0), dtype=numpy.uint64)]
+            )
+        )
+
+        for column in counts:
+            if kinds[column] == SINGLE_SELECT:
+                selected = values[column][pandas.notna(values[column])]
+                answered[column] += len(selected)
+            else:
+                answers = [
+                    options
+                    for options in frame[column].to_numpy()
+                    if isinstance(options, (list, numpy.ndarray)) and len(options)
+                ]
+                answered[column] += len(answers)
+                selected = numpy.concatenate(answers).astype(str) if answers else []
+            options, n = numpy.unique(selected, return_counts=True)
+            counts[column].update(dict(zip(options, n)))
+
+    return {
+        "ids": numpy.concatenate(ids) if ids else numpy.empty(0, dtype=object),
+        "raw_ids": numpy.concatenate(raw_ids) if raw_ids else numpy.empty(0),
+        "hashes": (
+            numpy.vstack(hashes)
+            if hashes
+            else numpy.empty((0, len(groups)), dtype=numpy.uint64)
+        ),
+        "counts": pandas.Series(
+            [n for options in counts.values() for n in options.values()],
+            index=pandas.MultiIndex.from_tuples(
+                [
+                    (column, option)
+                    for column, options in counts.items()
+                    for option in options
+                ],
+                names=["column", "option"],
+            ),
+            dtype="int64",
+        ),
+        "answered": answered,
+    }
+
+
+def _group_hash(values: List[numpy.ndarray]) -> numpy.ndarray:
+    # Combine the hashes of a group's columns, order sensitively.
+    combined = numpy.zeros(len(values[0]), dtype=numpy.uint64)
+    for column in values:
+        combined = combined * _HASH_MULTIPLIER ^ pandas.util.hash_array(column)
+    return combined
+
+
+def _read_rows(
+    dataset: ds.Dataset, raw_ids: numpy.ndarray, columns: List[str], batch_size: int
+) -> pandas.DataFrame:
+    # Canonical values of only the given respondents and columns, indexed by
+    # canonical response ID.
+    if not len(raw_ids) or not columns:
+        return pandas.DataFrame(columns=columns)
+    batches = dataset.to_batches(
+        columns=[ID_COLUMN] + columns,
+        filter=ds.field(ID_COLUMN).isin(raw_ids.tolist()),
+        batch_size=batch_size,
+    )
+    frames = []
+    for batch in batches:
+        frame = batch.to_pandas()
+        frames.append(
+            pandas.DataFrame(
+                {column: _canonical(frame[column]) for column in columns},
+                index=_canonical(frame[ID_COLUMN]),
+            )
+        )
+    return pandas.concat(frames)
+
+
+def _changed_cells(
+    old_rows: pandas.DataFrame,
+    new_rows: pandas.DataFrame,
+    ids: numpy.ndarray,
+    differs: numpy.ndarray,
+    groups: Dict[str, List[str]],
+    changed_groups: List[str],
+) -> pandas.DataFrame:
+    frames = []
+    positions = {name: i for i, name in enumerate(groups)}
+    for name in changed_groups:
+        respondents = ids[differs[:, positions[name]]]
+        for column in groups[name]:
+            old = old_rows.loc[respondents, column].to_numpy()
+            new = new_rows.loc[respondents, column].to_numpy()
+            cells = old != new
+            if cells.any():
+                frames.append(
+                    pandas.DataFrame(
+                        {
+                            "response_id": respondents[cells],
+                            "question": name,
+                            "column": column,
+                            "old": old[cells],
+                            "new": new[cells],
+                        }
+                    )
+                )
+    if not frames:
+        return pandas.DataFrame(
+            columns=["response_id", "question", "column", "old", "new"]
+        )
+    return pandas.concat(frames, ignore_index=True)
+
+
+def _shifts(old_scan: Dict, new_scan: Dict, columns: List[str]) -> pandas.DataFrame:
+    counts = pandas.concat(
+        {"old_count": old_scan["counts"], "new_count": new_scan["counts"]}, axis=1
+    )
+    if counts.empty:
+        return pandas.DataFrame(
+            columns=[
+                "column",
+                "option",
+                "old_count",
+                "new_count",
+                "old_share",
+                "new_share",
+                "difference",
+            ]
+        )
+    counts = counts.fillna(0).astype(numpy.int64).reset_index()
+    # Columns in snapshot order, options alphabetically within them.
+    order = counts["column"].map({column: i for i, column in enumerate(columns)})
+    counts = counts.iloc[numpy.lexsort((counts["option"], order))].reset_index(
+        drop=True
+    )
+    for snapshot, scan in [("old", old_scan), ("new", new_scan)]:
+        answered = counts["column"].map(scan["answered"])
+        counts[f"{snapshot}_share"] = counts[f"{snapshot}_count"] / answered
+    counts["difference"] = counts["new_share"] - counts["old_share"]
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("old", type=Path, help="Earlier snapshot parquet file.")
+    parser.add_argument("new", type=Path, help="Later snapshot parquet file.")
+    parser.add_argument("--columns", nargs="+", help="Columns to compare.")
+    parser.add_argument(
+        "--cells", type=Path, help="CSV file to write changed cells to."
+    )
+    args = parser.parse_args()
+
+    diff = diff_snapshots(args.old, args.new, args.columns)
+    print(f"Added: {len(diff.added)}, removed: {len(diff.removed)}")
+    print(diff.changes.to_string())
+    shifts = diff.shifts.loc[lambda df: df["difference"].abs() >= 0.01]
+    print(shifts.sort_values("difference", key=abs, ascending=False).to_string())
+    if args.cells:
+        diff.changed_cells.to_csv(args.cells, index=False)
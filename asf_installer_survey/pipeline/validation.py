@@ -0,0 +1,352 @@
+"""Check that survey data is consistent with the questionnaire routing.
+
+Rules are compiled from the questionnaire definitions into whole-column
+masks, each flagging the respondents who violate it:
+
+- routing: questions are only answered by subpopulations whose route includes
+  them (see `utils.routing.ROUTES`), e.g. employees don't answer `q6a`.
+- condition: questions shown only after a particular earlier answer are only
+  answered by respondents who gave it, e.g. `q9a` (English region) is only
+  answered by firms located in England.
+- selection limit: "You can select up to N options" questions have at most N
+  options selected.
+- other text: "Other" free text is only given where an "Other" option was
+  selected.
+
+`check_routing` runs the rules as a pipeline gate, rejecting data with too
+many violations.
+
+Usage:
+    python -m asf_installer_survey.pipeline.validation <data.parquet>
+"""
+import argparse
+import functools
+import re
+import sys
+from pathlib import Path
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+import numpy
+import pandas
+
+from asf_installer_survey import logger
+from asf_installer_survey.utils.answers import is_answered
+from asf_installer_survey.utils.encoding import multi_select_indicators
+from asf_installer_survey.utils.instrumentation import instrumented
+from asf_installer_survey.utils.lookups import QuestionNumbers as col
+from asf_installer_survey.utils.questions import (
+    answer_columns,
+    other_column,
+    question_numbers,
+)
+from asf_installer_survey.utils.routing import (
+    identify_subpopulation,
+    route_questions,
+    SUBPOPULATIONS,
+)
+
+SMALL_FIRMS = ["I own a company with 5 or fewer employees", "I’m a sole trader"]
+
+# Options that "Other" free text elaborates on, e.g. "Other (please specify)".
+OTHER_OPTION = re.compile(r"^other\b", re.IGNORECASE)
+
+_NUMBERS = {"two": 2, "three": 3, "four": 4, "five": 5}
+_SELECTION_LIMIT = re.compile(
+    rf"select up to (\d+|{'|'.join(_NUMBERS)})\b", re.IGNORECASE
+)
+
+
+class Rule(NamedTuple):
+    """A routing constraint.
+
+    Attributes:
+        name: Rule name, e.g. "routing: q6a".
+        question: The column the rule constrains.
+        description: What the rule requires.
+        violated: Function of the survey data and each respondent's
+            subpopulation code (an index into `SUBPOPULATIONS`, -1 if
+            unknown) returning a boolean array flagging violations.
+        depends_on: Other columns the rule reads.
+    """
+
+    name: str
+    question: str
+    description: str
+    violated: Callable[[pandas.DataFrame, numpy.ndarray], numpy.ndarray]
+    depends_on: Tuple[str, ...] = ()
+
+
+class RoutingViolations(NamedTuple):
+    """Violations of the routing rules.
+
+    Attributes:
+        by_rule: Number and proportion of respondents violating each rule.
+        by_respondent: One row per respondent and rule they violate.
+    """
+
+    by_rule: pandas.DataFrame
+    by_respondent: pandas.DataFrame
+
+
+# Questions shown only to respondents who selected one of the given options
+# of an earlier question.
+CONDITIONS = [
+    (col.q7, col.q6a, SMALL_FIRMS),
+    (col.q9a, col.q8, ["England"]),
+    (col.q9b, col.q8, ["Scotland"]),
+    (col.q9c, col.q8, ["Wales"]),
+    (col.q9d, col.q8, ["Northern Ireland"]),
+]
+
+
+def compile_rules() -> List[Rule]:
+    """Compile the routing rules from the questionnaire definitions.
+
+    Returns:
+        List[Rule]: Routing, condition, selection limit and "Other" text
+            rules, in questionnaire order within each kind.
+    """
+    rules = []
+
+    routes = [set(route_questions(subpopulation)) for subpopulation in SUBPOPULATIONS]
+    for number in question_numbers():
+        for column in answer_columns(number):
+            shown = numpy.array([column in route for route in routes])
+            if shown.any() and not shown.all():
+                shown_to = ", ".join(numpy.array(SUBPOPULATIONS)[shown])
+                rules.append(
+                    Rule(
+                        f"routing: {number}",
+                        column,
+                        f"only shown to: {shown_to}",
+                        functools.partial(_answered_off_route, column, shown),
+                    )
+                )
+
+    for column, condition, options in CONDITIONS:
+        rules.append(
+            Rule(
+                f"condition: {_number(column)}",
+                column,
+                f"only shown if {_number(condition)} is one of: {', '.join(options)}",
+                functools.partial(
+                    _answered_unless_selected, column, condition, options.__contains__
+                ),
+                (condition,),
+            )
+        )
+
+    for number in question_numbers():
+        column = answer_columns(number)[0]
+        limit = selection_limit(column)
+        if limit is not None:
+            rules.append(
+                Rule(
+                    f"selection limit: {number}",
+                    column,
+                    f"at most {limit} options selected",
+                    functools.partial(_too_many_selected, column, limit),
+                )
+            )
+
+    for number in question_numbers():
+        other = other_column(number)
+        if other is not None:
+            rules.append(
+                Rule(
+                    f"other text: {number}",
+                    other,
+                    "only given where an Other option was selected",
+                    functools.partial(
+                        _answered_unless_selected,
+                        other,
+                        answer_columns(number)[0],
+                        _is_other,
+                    ),
+                    (answer_columns(number)[0],),
+                )
+            )
+    return rules
+
+
+def selection_limit(column: str) -> Optional[int]:
+    """Return the most options a question allows, if it sets a limit.
+
+    Args:
+        column (str): Question column, e.g. "... You can select up to 3
+            options."
+
+    Returns:
+        Optional[int]: The limit, or None if the question doesn't set one.
+    """
+    match = _SELECTION_LIMIT.search(column)
+    if match is None:
+        return None
+    limit = match.group(1).lower()
+    return _NUMBERS[limit] if limit in _NUMBERS else int(limit)
+
+
+@instrumented
+def find_violations(
+    data: pandas.DataFrame, rules: Optional[List[Rule]] = None
+) -> RoutingViolations:
+    """Evaluate routing rules against survey data.
+
+    Rules reading columns that aren't in `data` are skipped. Routing
+    rules don't apply to respondents whose subpopulation is unknown.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        rules (Optional[List[Rule]]): Rules to evaluate. Defaults to
+            `compile_rules()`.
+
+    Returns:
+        RoutingViolations: Violations by rule and by respondent.
+    """
+    rules = compile_rules() if rules is None else rules
+    subpopulation = identify_subpopulation(data)
+    codes = numpy.asarray(
+        pandas.Categorical(subpopulation, categories=SUBPOPULATIONS).codes,
+        dtype=numpy.int64,
+    )
+
+    applied, rows, rule_index = [], [], []
+    for rule in rules:
+        if not {rule.question, *rule.depends_on}.issubset(data.columns):
+            continue
+        violated = rule.violated(data, codes)
+        violators = numpy.flatnonzero(violated)
+        rows.append(violators)
+        rule_index.append(numpy.full(len(violators), len(applied)))
+        applied.append(rule)
+
+    counts = numpy.array([len(violators) for violators in rows], dtype=numpy.int64)
+    by_rule = pandas.DataFrame(
+        {
+            "rule": [rule.name for rule in applied],
+            "question": [rule.question for rule in applied],
+            "description": [rule.description for rule in applied],
+            "violations": counts,
+            "proportion": counts / max(len(data), 1),
+        }
+    )
+
+    rows = numpy.concatenate(rows) if rows else numpy.array([], dtype=numpy.int64)
+    rule_index = (
+        numpy.concatenate(rule_index) if rule_index else numpy.array([], dtype=int)
+    )
+    by_respondent = pandas.DataFrame(
+        {
+            "response_id": data[col.q0a].to_numpy()[rows],
+            "subpopulation": subpopulation.to_numpy()[rows],
+            "rule": by_rule["rule"].to_numpy()[rule_index],
+        }
+    ).sort_values(["response_id", "rule"], ignore_index=True)
+    return RoutingViolations(by_rule, by_respondent)
+
+
+def check_routing(
+    data: pandas.DataFrame,
+    max_violation_rate: float = 0.0,
+    rules: Optional[List[Rule]] = None,
+) -> RoutingViolations:
+    """Reject survey data that doesn't follow the questionnaire routing.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        max_violation_rate (float): Largest tolerated proportion of
+            respondents violating any rule.
+        rules (Optional[List[Rule]]): Rules to evaluate. Defaults to
+            `compile_rules()`.
+
+    Raises:
+        ValueError: If more than `max_violation_rate` of respondents violate
+            a rule.
+
+    Returns:
+        RoutingViolations: Violations by rule and by respondent.
+    """
+    violations = find_violations(data, rules)
+    violators = violations.by_respondent["response_id"].nunique()
+    rate = violators / max(len(data), 1)
+    failing = violations.by_rule.loc[lambda df: df["violations"] > 0]
+    if rate > max_violation_rate:
+        raise ValueError(
+            f"{violators} respondents ({rate:.1%}) violate the questionnaire "
+            f"routing, more than the {max_violation_rate:.1%} tolerated. Rules "
+            f"violated: {', '.join(failing['rule'])}."
+        )
+    if violators:
+        logger.warning(
+            f"{violators} respondents ({rate:.1%}) violate the questionnaire routing."
+        )
+    return violations
+
+
+def _answered_off_route(
+    column: str, shown: numpy.ndarray, data: pandas.DataFrame, codes: numpy.ndarray
+) -> numpy.ndarray:
+    return is_answered(data[column]) & (codes >= 0) & ~shown[codes]
+
+
+def _answered_unless_selected(
+    column: str,
+    condition: str,
+    options: Callable[[str], bool],
+    data: pandas.DataFrame,
+    codes: numpy.ndarray,
+) -> numpy.ndarray:
+    # The condition only matters for respondents who answered, so only
+    # encode their answers to it.
+    violated = is_answered(data[column]).copy()
+    rows = numpy.flatnonzero(violated)
+    answers = data[condition].iloc[rows]
+    if isinstance(answers.dtype, pandas.CategoricalDtype):
+        matching = [i for i, c in enumerate(answers.cat.categories) if options(c)]
+        selected = numpy.isin(answers.cat.codes.to_numpy(), matching)
+    else:
+        indicators, selectable = multi_select_indicators(answers)
+        matching = [options(option) for option in selectable]
+        selected = indicators[:, matching].any(axis=1)
+    violated[rows] = ~selected
+    return violated
+
+
+def _too_many_selected(
+    column: str, limit: int, data: pandas.DataFrame, codes: numpy.ndarray
+) -> numpy.ndarray:
+    if isinstance(data[column].dtype, pandas.CategoricalDtype):
+        return numpy.zeros(len(data), dtype=bool)
+    selected = data[column].map(len, na_action="ignore").fillna(0)
+    return selected.to_numpy() > limit
+
+
+def _is_other(option) -> bool:
+    return isinstance(option, str) and OTHER_OPTION.match(option) is not None
+
+
+def _number(column: str) -> str:
+    return next(
+        number for number in question_numbers() if column in answer_columns(number)
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("data", type=Path, help="Survey data parquet file.")
+    parser.add_argument(
+        "--max-violation-rate",
+        type=float,
+        default=0.0,
+        help="Largest tolerated proportion of respondents violating a rule.",
+    )
+    args = parser.parse_args()
+
+    try:
+        violations = check_routing(
+            pandas.read_parquet(args.data), args.max_violation_rate
+        )
+    except ValueError as error:
+        logger.error(error)
+        sys.exit(1)
+    print(violations.by_rule.loc[lambda df: df["violations"] > 0].to_string())
@@ -0,0 +1,395 @@
+"""Export every question's tables to a spreadsheet for stakeholder packs.
+
+Each question present in the data gets a sheet holding its summary (see
+`analysis.summaries`) unsplit and split by each grouping column (e.g.
+subpopulation and wave), with its "Other" free text counts, after disclosure
+control (see `pipeline.disclosure`). A contents sheet links to every
+question's sheet.
+
+Tables are streamed to the file: summaries are computed a batch of questions
+at a time in a pool of processes, written and dropped before the next batch,
+and rows are flushed to disk as they're written rather than held until the
+workbook is saved, so memory stays flat however many questions and splits
+there are.
+
+- `.xlsx` workbooks are written with XlsxWriter in constant memory mode.
+- `.ods` spreadsheets are written as OpenDocument XML straight into the zip
+  archive.
+
+Counts and proportions are written as numbers with number formats, and
+withheld counts as "[c]" with the reason in a "disclosure" column.
+
+Usage:
+    python -m asf_installer_survey.pipeline.workbook <data.parquet> [--by COL ...]
+"""
+import argparse
+import contextlib
+import functools
+import os
+import zipfile
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+from xml.sax.saxutils import escape, quoteattr
+
+import pandas
+import xlsxwriter
+
+from asf_installer_survey import logger
+from asf_installer_survey.analysis.summaries import (
+    free_text_summary,
+    summarise_question,
+)
+from asf_installer_survey.getters.survey_data import WAVE
+from asf_installer_survey.pipeline.disclosure import protect_summaries
+from asf_installer_survey.pipeline.report import REPORTS_DIR, section_title, WITHHELD
+from asf_installer_survey.utils.instrumentation import instrumented
+from asf_installer_survey.utils.parallel import process_pool
+from asf_installer_survey.utils.questions import (
+    other_column,
+    question_columns,
+    question_kind,
+    question_numbers,
+)
+from asf_installer_survey.utils.routing import identify_subpopulation
+
+SUBPOPULATION = "subpopulation"
+CONTENTS = "Contents"
+FORMATS = ["xlsx", "ods"]
+
+# Questions per worker process in each batch of tables.
+BATCH_SIZE = 4
+
+# Cell styles.
+TEXT, TITLE, HEADER, COUNT, PROPORTION, LINK = (
+    "text",
+    "title",
+    "header",
+    "count",
+    "proportion",
+    "link",
+)
+
+_COUNT_COLUMNS = {"count", "respondents", "responses", "distinct_responses"}
+_COLUMN_WIDTHS = [40, 60, 12, 12, 12]
+
+Cell = Tuple[object, str]
+
+
+@instrumented
+def build_workbook(
+    data: pandas.DataFrame,
+    path: Optional[Path] = None,
+    splits: Optional[List[str]] = None,
+    n_jobs: Optional[int] = None,
+    title: str = "ASF Installer Survey: All Questions",
+) -> Path:
+    """Write a spreadsheet of every question's tables.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        path (Optional[Path]): Output `.xlsx` or `.ods` file. Defaults to
+            `outputs/reports/all_questions.xlsx`.
+        splits (Optional[List[str]]): Columns to split each summary by, as
+            well as unsplit. Defaults to subpopulation (added with
+            `identify_subpopulation` if missing), and wave if `data` has one.
+        n_jobs (Optional[int]): Worker processes computing tables.
+        title (str): Title on the contents sheet.
+
+    Raises:
+        ValueError: If the file isn't `.xlsx` or `.ods`.
+
+    Returns:
+        Path: The path written to.
+    """
+    path = Path(path or REPORTS_DIR / "all_questions.xlsx")
+    fmt = path.suffix.lstrip(".").lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Can't write {path}; use one of {', '.join(FORMATS)}.")
+    if splits is None:
+        splits = [SUBPOPULATION] + ([WAVE] if WAVE in data else [])
+    if SUBPOPULATION in splits and SUBPOPULATION not in data:
+        data = data.assign(subpopulation=identify_subpopulation(data))
+
+    numbers = [
+        number
+        for number in question_numbers()
+        if all(column in data for column in question_columns(number))
+    ]
+    kinds = [question_kind(data, number) for number in numbers]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    writer = _XlsxWriter(path) if fmt == "xlsx" else _OdsWriter(path)
+    with contextlib.ExitStack() as stack:
+        stack.callback(writer.close)
+        mapper = map if n_jobs == 1 else stack.enter_context(process_pool(n_jobs)).map
+        writer.add_sheet(CONTENTS)
+        for row in _contents(numbers, kinds, splits, title):
+            writer.write_row(row)
+        # Tables are computed a batch of questions at a time, so only one
+        # batch's tables are held while they're written.
+        batch_size = BATCH_SIZE * (n_jobs or os.cpu_count() or 1)
+        for start in range(0, len(numbers), batch_size):
+            batch = numbers[start : start + batch_size]
+            tables = mapper(
+                functools.partial(_question_tables, splits=splits),
+                [
+                    (
+                        data[list(dict.fromkeys(question_columns(number) + splits))],
+                        number,
+                    )
+                    for number in batch
+                ],
+            )
+            for number, kind, question in zip(batch, kinds[start:], tables):
+                writer.add_sheet(number)
+                for row in _question_rows(number, kind, question):
+                    writer.write_row(row)
+    logger.info(f"Wrote {len(numbers)} questions' tables to {path}.")
+    return path
+
+
+def _contents(
+    numbers: List[str], kinds: List[str], splits: List[str], title: str
+) -> Iterator[List[Cell]]:
+    yield [(title, TITLE)]
+    yield [(f"Split by: {', '.join(['none'] + splits)}", TEXT)]
+    yield []
+    yield [("Sheet", HEADER), ("Question", HEADER), ("Type", HEADER)]
+    for number, kind in zip(numbers, kinds):
+        yield [(number, LINK), (section_title(number), TEXT), (kind, TEXT)]
+
+
+def _question_tables(
+    task: Tuple[pandas.DataFrame, str], splits: List[str]
+) -> List[Tuple[str, pandas.DataFrame]]:
+    # A question's protected tables, unsplit then split each way, with their
+    # headings.
+    data, number = task
+    names = ["all respondents" if by is None else f"by {by}" for by in [None] + splits]
+    tables = [
+        (f"Answers, {name}", summary)
+        for name, summary in zip(
+            names,
+            protect_summaries(
+                [summarise_question(data, number, by) for by in [None] + splits]
+            ),
+        )
+    ]
+    other = other_column(number)
+    if other is not None:
+        tables += [
+            (f"Other, {name}", summary)
+            for name, summary in zip(
+                names,
+                protect_summaries(
+                    [free_text_summary(data, other, by) for by in [None] + splits]
+                ),
+            )
+        ]
+    return tables
+
+
+def _question_rows(
+    number: str, kind: str, tables: List[Tuple[str, pandas.DataFrame]]
+) -> Iterator[List[Cell]]:
+    yield [(section_title(number), TITLE)]
+    yield [(kind, TEXT)]
+    for heading, table in tables:
+        yield []
+        yield [(heading, HEADER)]
+        yield from _table_rows(table)
+
+
+def _table_rows(frame: pandas.DataFrame) -> Iterator[List[Cell]]:
+    frame = frame.fillna({"disclosure": ""}) if "disclosure" in frame else frame
+    yield [(column.replace("_", " ").capitalize(), HEADER) for column in frame]
+    styles = [
+        (
+            COUNT
+            if column in _COUNT_COLUMNS
+            else PROPORTION if column == "proportion" else TEXT
+        )
+        for column in frame
+    ]
+    withheld = (
+        frame["disclosure"].to_numpy() != ""
+        if "disclosure" in frame
+        else [False] * len(frame)
+    )
+    for row, row_withheld in zip(frame.itertuples(index=False), withheld):
+        cells = []
+        for value, style in zip(row, styles):
+            if pandas.isna(value):
+                cells.append((WITHHELD if row_withheld else None, TEXT))
+            elif style == TEXT:
+                cells.append((str(value), TEXT))
+            else:
+                cells.append((float(value), style))
+        yield cells
+
+
+class _XlsxWriter:
+    # Rows are flushed to disk as each is written (constant memory mode), so
+    # each sheet's rows must be written in order.
+
+    def __init__(self, path: Path):
+        self.workbook = xlsxwriter.Workbook(str(path), {"constant_memory": True})
+        self.formats = {
+            TEXT: None,
+            TITLE: self.workbook.add_format({"bold": True, "font_size": 14}),
+            HEADER: self.workbook.add_format({"bold": True, "bottom": 1}),
+            COUNT: self.workbook.add_format({"num_format": "#,##0"}),
+            PROPORTION: self.workbook.add_format({"num_format": "0.0%"}),
+            LINK: self.workbook.get_default_url_format(),
+        }
+        self.sheet, self.row = None, 0
+
+    def add_sheet(self, name: str) -> None:
+        self.sheet, self.row = self.workbook.add_worksheet(name), 0
+        for column, width in enumerate(_COLUMN_WIDTHS):
+            self.sheet.set_column(column, column, width)
+
+    def write_row(self, cells: List[Cell]) -> None:
+        for column, (value, style) in enumerate(cells):
+            if value is None:
+                continue
+            if style == LINK:
+                self.sheet.write_url(
+                    self.row,
+                    column,
+                    f"internal:'{value}'!A1",
+                    self.formats[LINK],
+                    string=value,
+                )
+            else:
+                self.sheet.write(self.row, column, value, self.formats[style])
+        self.row += 1
+
+    def close(self) -> None:
+        self.workbook.close()
+
+
+class _OdsWriter:
+    # content.xml is streamed into the archive a row at a time.
+
+    _NAMESPACES = (
+        " ".join(
+            f'xmlns:{prefix}="urn:oasis:names:tc:opendocument:xmlns:{name}:1.0"'
+            for prefix, name in [
+                ("office", "office"),
+                ("style", "style"),
+                ("table", "table"),
+                ("text", "text"),
+                ("number", "datastyle"),
+                ("fo", "xsl-fo-compatible"),
+            ]
+        )
+        + ' xmlns:xlink="http://www.w3.org/1999/xlink"'
+    )
+    _STYLES = (
+        '<number:number-style style:name="N0"><number:number '
+        'number:decimal-places="0" number:grouping="true"/></number:number-style>'
+        '<number:percentage-style style:name="P0"><number:number '
+        'number:decimal-places="1" number:min-integer-digits="1"/>'
+        "<number:text>%</number:text></number:percentage-style>"
+        f'<style:style style:name="{TITLE}" style:family="table-cell">'
+        '<style:text-properties fo:font-weight="bold" fo:font-size="14pt"/>'
+        "</style:style>"
+        f'<style:style style:name="{HEADER}" style:family="table-cell">'
+        '<style:text-properties fo:font-weight="bold"/></style:style>'
+        f'<style:style style:name="{COUNT}" style:family="table-cell" '
+        'style:data-style-name="N0"/>'
+        f'<style:style style:name="{PROPORTION}" style:family="table-cell" '
+        'style:data-style-name="P0"/>'
+        + "".join(
+            f'<style:style style:name="co{i}" style:family="table-column">'
+            f'<style:table-column-properties style:column-width="{width * 0.19:.2f}cm"/>'
+            "</style:style>"
+            for i, width in enumerate(_COLUMN_WIDTHS)
+        )
+    )
+    _MIMETYPE = "application/vnd.oasis.opendocument.spreadsheet"
+
+    def __init__(self, path: Path):
+        self.archive = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED)
+        # The mimetype must come first, uncompressed.
+        self.archive.writestr(
+            zipfile.ZipInfo("mimetype"), self._MIMETYPE, zipfile.ZIP_STORED
+        )
+        self.archive.writestr(
+            "META-INF/manifest.xml",
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<manifest:manifest xmlns:manifest="urn:oasis:names:tc:opendocument:'
+            'xmlns:manifest:1.0" manifest:version="1.2">'
+            f'<manifest:file-entry manifest:full-path="/" '
+            f'manifest:media-type="{self._MIMETYPE}"/>'
+            '<manifest:file-entry manifest:full-path="content.xml" '
+            'manifest:media-type="text/xml"/></manifest:manifest>',
+        )
+        self.content = self.archive.open("content.xml", "w")
+        self._write(
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<office:document-content {self._NAMESPACES} office:version="1.2">'
+            f"<office:automatic-styles>{self._STYLES}</office:automatic-styles>"
+            "<office:body><office:spreadsheet>"
+        )
+        self.open_sheet = False
+
+    def add_sheet(self, name: str) -> None:
+        if self.open_sheet:
+            self._write("</table:table>")
+        self._write(f"<table:table table:name={quoteattr(name)}>")
+        for i in range(len(_COLUMN_WIDTHS)):
+            self._write(f'<table:table-column table:style-name="co{i}"/>')
+        self.open_sheet = True
+
+    def write_row(self, cells: List[Cell]) -> None:
+        self._write(
+            "<table:table-row>"
+            + "".join(self._cell(value, style) for value, style in cells)
+            + "</table:table-row>"
+        )
+
+    def close(self) -> None:
+        if self.open_sheet:
+            self._write("</table:table>")
+        self._write("</office:spreadsheet></office:body></office:document-content>")
+        self.content.close()
+        self.archive.close()
+
+    def _write(self, text: str) -> None:
+        self.content.write(text.encode("utf8"))
+
+    @staticmethod
+    def _cell(value, style: str) -> str:
+        if value is None:
+            return "<table:table-cell/>"
+        if style in (COUNT, PROPORTION):
+            value_type = "float" if style == COUNT else "percentage"
+            text = f"{value:,.0f}" if style == COUNT else f"{value:.1%}"
+            return (
+                f'<table:table-cell table:style-name="{style}" '
+                f'office:value-type="{value_type}" office:value="{value!r}">'
+                f"<text:p>{text}</text:p></table:table-cell>"
+            )
+        text = escape(str(value))
+        if style == LINK:
+            text = (
+                f"<text:a xlink:href={quoteattr('#' + value + '.A1')}>{text}</text:a>"
+            )
+        style_name = f' table:style-name="{style}"' if style in (TITLE, HEADER) else ""
+        return (
+            f'<table:table-cell{style_name} office:value-type="string">'
+            f"<text:p>{text}</text:p></table:table-cell>"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("data", type=Path, help="Survey data parquet file.")
+    parser.add_argument(
+        "--by", nargs="*", help="Columns to split by. Defaults to subpopulation."
+    )
+    parser.add_argument("--output", type=Path, help="Output .xlsx or .ods file.")
+    args = parser.parse_args()
+
+    build_workbook(pandas.read_parquet(args.data), path=args.output, splits=args.by)
@@ -0,0 +1,69 @@
+"""Utilities for working out which questions respondents have answered.
+
+Single select questions are stored as categoricals, with missing answers as
+`NaN`. Multi-select questions are stored as array-like values, with an empty
+array when no options were selected. Free text is stored as strings.
+"""
+from typing import List
+
+import numpy
+import pandas
+
+
+def is_answered(series: pandas.Series) -> numpy.ndarray:
+    """Return a boolean array flagging respondents who answered a question.
+
+    Args:
+        series (pandas.Series): A single question column.
+
+    Returns:
+        numpy.ndarray: True where the question was answered.
+    """
+    if series.dtype == "object":
+        return (
+            series.map(_has_content, na_action="ignore")
+            .fillna(False)
+            .to_numpy(dtype=bool)
+        )
+    if pandas.api.types.is_string_dtype(series.dtype):
+        return series.fillna("").str.strip().ne("").to_numpy(dtype=bool)
+    return series.notna().to_numpy()
+
+
+def answered_matrix(data: pandas.DataFrame, columns: List[str]) -> numpy.ndarray:
+    """Build a respondent by question boolean matrix of answered questions.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        columns (List[str]): Question columns, in the order they should appear.
+
+    Returns:
+        numpy.ndarray: Boolean array of shape (len(data), len(columns)).
+    """
+    matrix = numpy.zeros((len(data), len(columns)), dtype=bool)
+    for i, column in enumerate(columns):
+        matrix[:, i] = is_answered(data[column])
+    return matrix
+
+
+def is_selected(series: pandas.Series, option: str) -> numpy.ndarray:
+    """Return a boolean array flagging respondents who selected an option.
+
+    Args:
+        series (pandas.Series): A multi-select question column.
+        option (str): The option to look for.
+
+    Returns:
+        numpy.ndarray: True where `option` was among the selected options.
+    """
+    return (
+        series.map(lambda x: option in x, na_action="ignore")
+        .fillna(False)
+        .to_numpy(dtype=bool)
+    )
+
+
+def _has_content(value) -> bool:
+    if isinstance(value, str):
+        return len(value.strip()) > 0
+    return len(value) > 0
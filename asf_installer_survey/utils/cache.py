@@ -0,0 +1,74 @@
+"""A simple on-disk cache for expensive derived results.
+
+Results are pickled under `CACHE_DIR/<namespace>/<key>.pkl`, where the key is
+a hash of everything the result depends on (e.g. a dataset fingerprint).
+"""
+import hashlib
+import os
+import pickle
+import uuid
+from pathlib import Path
+from typing import Any, Optional
+
+import pandas
+
+from asf_installer_survey import PROJECT_DIR
+
+CACHE_DIR = PROJECT_DIR / ".cache"
+
+
+def dataset_fingerprint(data: pandas.DataFrame) -> str:
+    """Return a hash identifying a dataset's columns, index and values."""
+    digest = hashlib.sha256()
+    digest.update(repr(list(data.columns)).encode())
+    digest.update(pandas.util.hash_pandas_object(data.index).to_numpy().tobytes())
+    for column in data.columns:
+        digest.update(_hash_column(data[column]).tobytes())
+    return digest.hexdigest()
+
+
+def hash_key(*parts: Any) -> str:
+    """Combine the reprs of several values into a single hash key."""
+    return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+
+def cache_path(namespace: str, key: str, cache_dir: Path = CACHE_DIR) -> Path:
+    """Return the path a cached result is stored at."""
+    return cache_dir / namespace / f"{key}.pkl"
+
+
+def load_cached(namespace: str, key: str, cache_dir: Path = CACHE_DIR) -> Optional[Any]:
+    """Load a cached result, or return None if it hasn't been cached."""
+    path = cache_path(namespace, key, cache_dir)
+    if not path.exists():
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def save_cached(
+    namespace: str, key: str, value: Any, cache_dir: Path = CACHE_DIR
+) -> None:
+    """Save a result to the cache.
+
+    The result is written to a temporary file and renamed into place, so an
+    interrupted save never leaves a partial entry behind.
+    """
+    path = cache_path(namespace, key, cache_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with open(temporary, "wb") as f:
+            pickle.dump(value, f)
+        os.replace(temporary, path)
+    finally:
+        temporary.unlink(missing_ok=True)
+
+
+def _hash_column(series: pandas.Series):
+    if series.dtype == "object":
+        # Array-likes (multi-select answers) aren't hashable, so hash their repr.
+        series = series.map(
+            lambda x: x if isinstance(x, str) else repr(list(x)), na_action="ignore"
+        )
+    return pandas.util.hash_pandas_object(series, index=False).to_numpy()
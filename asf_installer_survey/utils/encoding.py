@@ -0,0 +1,115 @@
+"""Integer encodings of survey answers for vectorised processing.
+
+Single select answers are encoded as category codes, with -1 for a missing
+answer. Grid questions (batteries of single select items sharing the same
+answer scale) are encoded as a respondent by item array of codes. Multi-select
+answers are encoded as a respondent by option boolean indicator matrix, which
+can be packed into bitsets of one bit per option.
+"""
+from typing import List, Optional, Tuple
+
+import numpy
+import pandas
+
+
+def category_codes(
+    series: pandas.Series, categories: Optional[List] = None
+) -> Tuple[numpy.ndarray, List]:
+    """Encode a single select question as integer codes.
+
+    Args:
+        series (pandas.Series): Single select question column.
+        categories (Optional[List]): Categories to encode against. Defaults to
+            the column's own categories (or sorted unique values if it isn't
+            categorical). Values not in `categories` are encoded as missing.
+
+    Returns:
+        Tuple[numpy.ndarray, List]: Integer codes (-1 for missing) and the
+            categories they index.
+    """
+    if categories is None:
+        if isinstance(series.dtype, pandas.CategoricalDtype):
+            return series.cat.codes.to_numpy(), list(series.cat.categories)
+        categories = sorted(series.dropna().unique())
+    index = pandas.Index(categories)
+    if isinstance(series.dtype, pandas.CategoricalDtype):
+        # Recode the column's categories rather than every value.
+        lookup = numpy.append(index.get_indexer(series.cat.categories), -1)
+        return lookup[series.cat.codes.to_numpy()], list(categories)
+    return index.get_indexer(series.to_numpy(dtype=object)), list(categories)
+
+
+def grid_codes(
+    data: pandas.DataFrame, columns: List[str], categories: Optional[List] = None
+) -> Tuple[numpy.ndarray, List]:
+    """Encode the items of a grid question as a respondent by item array.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        columns (List[str]): The grid's item columns.
+        categories (Optional[List]): The shared answer scale. Defaults to the
+            first item's categories if all items share them, otherwise the
+            sorted union of every item's answers.
+
+    Returns:
+        Tuple[numpy.ndarray, List]: Array of shape (len(data), len(columns))
+            of integer codes (-1 for missing) and the answer scale.
+    """
+    if categories is None:
+        categories = _shared_categories([data[column] for column in columns])
+
+    codes = numpy.empty((len(data), len(columns)), dtype=numpy.int16)
+    for i, column in enumerate(columns):
+        codes[:, i] = category_codes(data[column], categories)[0]
+    return codes, categories
+
+
+def multi_select_indicators(
+    series: pandas.Series, options: Optional[List] = None
+) -> Tuple[numpy.ndarray, List]:
+    """Encode a multi-select question as a boolean indicator matrix.
+
+    Args:
+        series (pandas.Series): Multi-select question column of array-likes.
+        options (Optional[List]): Options to encode. Defaults to the sorted
+            options selected by any respondent. Other options are ignored.
+
+    Returns:
+        Tuple[numpy.ndarray, List]: Boolean array of shape
+            (len(series), len(options)) and the options its columns index.
+    """
+    exploded = series.reset_index(drop=True).explode().dropna()
+    if options is None:
+        options = sorted(exploded.unique())
+    codes = pandas.Categorical(exploded, categories=options).codes
+    selected = codes >= 0
+
+    indicators = numpy.zeros((len(series), len(options)), dtype=bool)
+    indicators[exploded.index.to_numpy()[selected], codes[selected]] = True
+    return indicators, list(options)
+
+
+def pack_bitsets(indicators: numpy.ndarray) -> numpy.ndarray:
+    """Pack a boolean indicator matrix into one bitset per row.
+
+    Args:
+        indicators (numpy.ndarray): Boolean array of shape (n, n_options).
+
+    Returns:
+        numpy.ndarray: `uint8` array of shape (n, ceil(n_options / 8)), with
+            option `i` in bit `7 - i % 8` of byte `i // 8`.
+    """
+    return numpy.packbits(indicators, axis=1)
+
+
+def unpack_bitsets(bitsets: numpy.ndarray, n_options: int) -> numpy.ndarray:
+    """Unpack bitsets produced by `pack_bitsets` into an indicator matrix."""
+    return numpy.unpackbits(bitsets, axis=1, count=n_options).astype(bool)
+
+
+def _shared_categories(items: List[pandas.Series]) -> List:
+    if all(isinstance(item.dtype, pandas.CategoricalDtype) for item in items):
+        first = list(items[0].cat.categories)
+        if all(list(item.cat.categories) == first for item in items[1:]):
+            return first
+    return sorted(set().union(*(item.dropna().unique() for item in items)))
@@ -0,0 +1,243 @@
+"""Lightweight performance instrumentation for pipeline stages.
+
+Wrap a stage in the `stage` context manager, or decorate it with
+`instrumented`, to record its wall time, CPU time, peak traced memory and
+rows in and out. Each record is logged through the package logger and
+appended as a JSON line to the metrics file.
+
+Instrumentation is off unless enabled in `config/base.yaml` or with the
+`ASF_INSTRUMENT=1` environment variable; when off, stages run with only a
+flag check of overhead.
+
+Each top level stage in the main process starts a new run (see `new_run`),
+so repeated runs in one notebook kernel are summarised separately. Worker
+processes inherit the run ID through the environment, so their stages are
+attributed to the run that started them.
+
+Usage (summarise where a run spent its time):
+    python -m asf_installer_survey.utils.instrumentation [metrics.jsonl]
+"""
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+import pandas
+
+from asf_installer_survey import config, logger, PROJECT_DIR
+
+_config = config["instrumentation"]
+ENABLED = _config["enabled"] or os.environ.get("ASF_INSTRUMENT") == "1"
+TRACE_MEMORY = _config["trace_memory"]
+METRICS_FILE = PROJECT_DIR / _config["metrics_file"]
+
+RUN_ID_VARIABLE = "ASF_RUN_ID"
+
+_stack = []
+
+
+class StageRecord:
+    """Measurements for one run of a stage.
+
+    Set `rows_out` inside the stage to record its output size.
+    """
+
+    def __init__(self, name: str, rows_in: Optional[int] = None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.peak_memory = 0
+
+    def as_dict(self) -> dict:
+        """Return the record as a JSON serialisable dict."""
+        return {
+            key: value for key, value in vars(self).items() if not key.startswith("_")
+        }
+
+
+class _NullRecord(StageRecord):
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_RECORD = _NullRecord("disabled")
+
+
+def enable(enabled: bool = True) -> None:
+    """Turn instrumentation on (or off) for this process."""
+    global ENABLED
+    ENABLED = enabled
+
+
+def new_run() -> str:
+    """Start a new run, inherited by worker processes started after it.
+
+    Returns:
+        str: The run ID.
+    """
+    run_id = uuid.uuid4().hex[:12]
+    os.environ[RUN_ID_VARIABLE] = run_id
+    return run_id
+
+
+def current_run() -> Optional[str]:
+    """Return the ID of the current run, if one has started."""
+    return os.environ.get(RUN_ID_VARIABLE)
+
+
+@contextmanager
+def stage(name: str, rows_in: Optional[int] = None) -> Iterator[StageRecord]:
+    """Record the performance of the enclosed block.
+
+    Args:
+        name (str): Stage name.
+        rows_in (Optional[int]): Number of input rows, if relevant.
+
+    Yields:
+        StageRecord: The stage's record, to set `rows_out` on.
+    """
+    if not ENABLED:
+        yield _NULL_RECORD
+        return
+
+    if not _stack and multiprocessing.parent_process() is None:
+        new_run()
+    record = StageRecord(name, rows_in)
+    started_tracing = TRACE_MEMORY and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    if TRACE_MEMORY and hasattr(tracemalloc, "reset_peak"):
+        # Keep the parent's peak so far before resetting it for this stage.
+        if _stack:
+            _stack[-1].peak_memory = max(
+                _stack[-1].peak_memory, tracemalloc.get_traced_memory()[1]
+            )
+        tracemalloc.reset_peak()
+
+    _stack.append(record)
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield record
+    finally:
+        record.wall_time = time.perf_counter() - wall
+        record.cpu_time = time.process_time() - cpu
+        _stack.pop()
+        if TRACE_MEMORY:
+            # Nested stages reset the peak, so also take the peak of children.
+            record.peak_memory = max(
+                record.peak_memory, tracemalloc.get_traced_memory()[1]
+            )
+            if _stack:
+                _stack[-1].peak_memory = max(_stack[-1].peak_memory, record.peak_memory)
+            if started_tracing:
+                tracemalloc.stop()
+        record.parent = _stack[-1].name if _stack else None
+        _emit(record)
+
+
+def instrumented(function: Optional[Callable] = None, *, name: Optional[str] = None):
+    """Decorate a function to record its performance as a stage.
+
+    Rows in is the length of the first argument if it has one (e.g. a
+    DataFrame), and rows out the length of the return value if it has one.
+
+    Args:
+        function (Optional[Callable]): Function to decorate.
+        name (Optional[str]): Stage name. Defaults to the function's
+            qualified name.
+
+    Returns:
+        Callable: The decorated function (or a decorator, if `function` is
+            not given).
+    """
+    if function is None:
+        return functools.partial(instrumented, name=name)
+    stage_name = name or f"{function.__module__}.{function.__qualname__}"
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not ENABLED:
+            return function(*args, **kwargs)
+        with stage(stage_name, rows_in=_length(args[0]) if args else None) as record:
+            result = function(*args, **kwargs)
+            record.rows_out = _length(result)
+        return result
+
+    return wrapper
+
+
+def read_metrics(path: Path = METRICS_FILE) -> pandas.DataFrame:
+    """Read recorded stage metrics."""
+    return pandas.read_json(path, lines=True)
+
+
+def summarise_metrics(
+    metrics: pandas.DataFrame, run_id: Optional[str] = None
+) -> pandas.DataFrame:
+    """Summarise where a run spent its time, by stage.
+
+    Args:
+        metrics (pandas.DataFrame): Metrics from `read_metrics`.
+        run_id (Optional[str]): Run to summarise. Defaults to the latest.
+
+    Returns:
+        pandas.DataFrame: Calls, total and mean wall time, total CPU time,
+            maximum peak memory (MB) and share of top level wall time for each
+            stage, slowest first.
+    """
+    if run_id is None:
+        run_id = metrics.sort_values("time")["run_id"].iloc[-1]
+    run = metrics.loc[lambda df: df["run_id"] == run_id]
+    top_level = run.loc[run["parent"].isna(), "wall_time"].sum()
+    return (
+        run.groupby("name")
+        .agg(
+            calls=("wall_time", "size"),
+            wall_time=("wall_time", "sum"),
+            mean_wall_time=("wall_time", "mean"),
+            cpu_time=("cpu_time", "sum"),
+            peak_memory_mb=("peak_memory", lambda x: x.max() / 2**20),
+        )
+        .assign(share=lambda df: df["wall_time"] / top_level)
+        .sort_values("wall_time", ascending=False)
+    )
+
+
+def _emit(record: StageRecord) -> None:
+    fields = {"run_id": current_run(), "pid": os.getpid(), "time": time.time()}
+    fields.update(record.as_dict())
+    logger.info(
+        "stage "
+        + " ".join(
+            f"{k}={v:.4f}" if isinstance(v, float) else f"{k}={v}"
+            for k, v in fields.items()
+            if k not in ("time", "run_id")
+        )
+    )
+    METRICS_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with open(METRICS_FILE, "a") as f:
+        f.write(json.dumps(fields) + "\n")
+
+
+def _length(value) -> Optional[int]:
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarise stage metrics.")
+    parser.add_argument("path", nargs="?", type=Path, default=METRICS_FILE)
+    parser.add_argument("--run", help="Run ID to summarise. Defaults to latest.")
+    args = parser.parse_args()
+
+    with pandas.option_context("display.width", 200, "display.max_rows", None):
+        print(summarise_metrics(read_metrics(args.path), args.run))
@@ -0,0 +1,117 @@
+"""Helpers for running work across a pool of processes.
+
+Pools started here log through a queue: worker processes push their package
+log records onto it with a `QueueHandler`, and a single listener thread in the
+parent passes them to the package logger's own handlers. Only the parent
+writes (and rotates) the log files, and workers never block on file I/O.
+
+Data every task needs (e.g. large arrays) can be handed to each worker once
+through an initializer, rather than pickled into every task.
+"""
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+from asf_installer_survey import logger
+
+
+def process_map(
+    function: Callable,
+    items: Iterable,
+    n_jobs: Optional[int] = None,
+    initializer: Optional[Callable] = None,
+    initargs: Tuple = (),
+) -> List[Any]:
+    """Apply a function to each item in a pool of processes.
+
+    Args:
+        function (Callable): A picklable (module level) function of one item.
+        items (Iterable): The items to apply it to.
+        n_jobs (Optional[int]): Number of worker processes. Defaults to the
+            number of CPUs. If 1, items are processed in this process.
+        initializer (Optional[Callable]): A picklable function called with
+            `initargs` once in each worker (or in this process, if items are
+            processed here) before any items.
+        initargs (Tuple): Arguments of `initializer`.
+
+    Returns:
+        List[Any]: The results, in the same order as `items`.
+    """
+    items = list(items)
+    if n_jobs == 1 or len(items) <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        return [function(item) for item in items]
+    with process_pool(n_jobs, initializer, initargs) as executor:
+        return list(executor.map(function, items))
+
+
+@contextmanager
+def process_pool(
+    n_jobs: Optional[int] = None,
+    initializer: Optional[Callable] = None,
+    initargs: Tuple = (),
+) -> Iterator[ProcessPoolExecutor]:
+    """Start a pool of worker processes that log through the parent.
+
+    Args:
+        n_jobs (Optional[int]): Number of worker processes. Defaults to the
+            number of CPUs.
+        initializer (Optional[Callable]): A picklable function called with
+            `initargs` once in each worker.
+        initargs (Tuple): Arguments of `initializer`.
+
+    Yields:
+        ProcessPoolExecutor: The pool.
+    """
+    context = multiprocessing.get_context()
+    with queue_logging(context) as queue:
+        with ProcessPoolExecutor(
+            max_workers=n_jobs,
+            mp_context=context,
+            initializer=_initialise_worker,
+            initargs=(queue, initializer, initargs),
+        ) as executor:
+            yield executor
+
+
+@contextmanager
+def queue_logging(context=multiprocessing) -> Iterator[multiprocessing.Queue]:
+    """Pass log records put on a queue to the package logger's handlers.
+
+    Args:
+        context: Multiprocessing context to create the queue with.
+
+    Yields:
+        multiprocessing.Queue: Queue for worker processes to log to (see
+            `_log_to_queue`).
+    """
+    queue = context.Queue(-1)
+    listener = QueueListener(queue, *logger.handlers, respect_handler_level=True)
+    listener.start()
+    try:
+        yield queue
+    finally:
+        # Drains records already on the queue before returning.
+        listener.stop()
+        queue.close()
+        queue.join_thread()
+
+
+def _initialise_worker(
+    queue: multiprocessing.Queue, initializer: Optional[Callable], initargs: Tuple
+) -> None:
+    _log_to_queue(queue)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def _log_to_queue(queue: multiprocessing.Queue) -> None:
+    # Worker initializer: replace the handlers inherited from (or recreated
+    # by importing) the package with one that puts records on the queue.
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    logger.addHandler(QueueHandler(queue))
@@ -0,0 +1,123 @@
+"""Helpers for navigating the questions defined in `QuestionNumbers`.
+
+Each question number maps to either a single column, a main column paired
+with an "Other" free text column, or a grid of item columns.
+"""
+from typing import Dict, List, Optional
+
+import pandas
+
+from asf_installer_survey.utils.lookups import QuestionNumbers as col
+
+SINGLE_SELECT = "single-select"
+MULTI_SELECT = "multi-select"
+GRID = "grid"
+FREE_TEXT = "free text"
+
+# Response metadata rather than survey questions.
+METADATA = ["q0a", "q0b", "q0c", "q0d"]
+
+
+def question_numbers() -> List[str]:
+    """Return every question number (e.g. "q16a"), in questionnaire order."""
+    return [
+        number
+        for number in vars(col)
+        if number.startswith("q") and number not in METADATA
+    ]
+
+
+def question_columns(number: str) -> List[str]:
+    """Return all of the columns belonging to a question number."""
+    columns = getattr(col, number)
+    return [columns] if isinstance(columns, str) else list(columns)
+
+
+def other_column(number: str) -> Optional[str]:
+    """Return a question's "Other" free text column, if it has one."""
+    for column in question_columns(number):
+        if _is_other(column):
+            return column
+    return None
+
+
+def answer_columns(number: str) -> List[str]:
+    """Return a question's answer columns, excluding any "Other" free text."""
+    return [column for column in question_columns(number) if not _is_other(column)]
+
+
+def all_answer_columns() -> List[str]:
+    """Return the answer columns of every question, in questionnaire order."""
+    return [
+        column for number in question_numbers() for column in answer_columns(number)
+    ]
+
+
+def free_text_columns() -> List[str]:
+    """Return every "Other" free text column, in questionnaire order."""
+    return [
+        column
+        for number in question_numbers()
+        if (column := other_column(number)) is not None
+    ]
+
+
+def stable_question_ids() -> Dict[str, str]:
+    """Map stable question IDs onto this questionnaire's column names.
+
+    IDs are the question number for single columns (e.g. "q1"), with an
+    "_other" suffix for "Other" free text columns (e.g. "q16a_other") and a
+    1-based item suffix for grid items (e.g. "q105_1"). Response metadata
+    columns keep their numbers (e.g. "q0a").
+
+    Returns:
+        Dict[str, str]: Stable IDs mapped to column names.
+    """
+    ids = {number: getattr(col, number) for number in METADATA}
+    for number in question_numbers():
+        answers = answer_columns(number)
+        if len(answers) == 1:
+            ids[number] = answers[0]
+        else:
+            ids.update({f"{number}_{i}": c for i, c in enumerate(answers, start=1)})
+        other = other_column(number)
+        if other is not None:
+            ids[f"{number}_other"] = other
+    return ids
+
+
+def column_kind(series: pandas.Series) -> str:
+    """Infer whether a column holds single-select, multi-select or free text.
+
+    Args:
+        series (pandas.Series): A question column.
+
+    Returns:
+        str: One of `SINGLE_SELECT`, `MULTI_SELECT` or `FREE_TEXT`.
+    """
+    if isinstance(series.dtype, pandas.CategoricalDtype):
+        return SINGLE_SELECT
+    values = series.dropna()
+    if values.empty or isinstance(values.iloc[0], str):
+        return FREE_TEXT
+    return MULTI_SELECT
+
+
+def question_kind(data: pandas.DataFrame, number: str) -> str:
+    """Infer the type of a question from its columns in `data`.
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+        number (str): Question number, e.g. "q105".
+
+    Returns:
+        str: One of `SINGLE_SELECT`, `MULTI_SELECT`, `GRID` or `FREE_TEXT`.
+    """
+    columns = answer_columns(number)
+    if len(columns) > 1:
+        return GRID
+    return column_kind(data[columns[0]])
+
+
+def _is_other(column: str) -> bool:
+    return column.endswith("Other.") or column.endswith("Other")
@@ -0,0 +1,443 @@
+"""Questionnaire routing: which questions each subpopulation is shown, by page.
+
+The routes mirror the question orders used to assess partial completeness in
+`notebooks/develop_analytical_sample.py`. Multi-select questions are
+represented by their main column only (not the "Other" free text column).
+"""
+from typing import Dict, List, Tuple
+
+import numpy
+import pandas
+
+from asf_installer_survey.utils.lookups import QuestionNumbers as col
+
+EMPLOYEE = "An employee of a firm"
+CONTRACTOR = "A contractor or freelancer"
+SOLE_TRADER = "A sole trader"
+OWNER = "The owner or co-owner of a firm"
+
+SUBPOPULATIONS = [EMPLOYEE, CONTRACTOR, SOLE_TRADER, OWNER]
+
+# Pages shared by every subpopulation.
+_PAGE_10 = [col.q90, col.q91, col.q92[0], col.q93, col.q94[0], col.q95, col.q96[0]]
+_PAGE_11 = [
+    col.q97[0],
+    col.q98,
+    col.q99[0],
+    col.q100[0],
+    col.q101,
+    col.q102[0],
+    col.q103[0],
+    col.q104[0],
+]
+_PAGE_12 = [
+    *col.q105,
+    *col.q106,
+    col.q107[0],
+    col.q108,
+    col.q109,
+    col.q110,
+    col.q111,
+    col.q112[0],
+    col.q113[0],
+]
+_PAGE_13 = [col.q114, col.q115]
+
+# Pages only shown to firm owners (including sole traders).
+_PAGE_8 = [
+    *col.q71,
+    col.q72[0],
+    col.q73,
+    col.q74,
+    col.q75,
+    col.q76,
+    col.q77[0],
+    col.q78,
+    col.q79,
+]
+_PAGE_9 = [
+    col.q80,
+    col.q81[0],
+    col.q82[0],
+    col.q83,
+    col.q84[0],
+    col.q85[0],
+    col.q86,
+    col.q87[0],
+    col.q88[0],
+    col.q89a[0],
+    col.q89b[0],
+]
+
+ROUTES: Dict[str, List[Tuple[str, List[str]]]] = {
+    EMPLOYEE: [
+        (
+            "Page 1",
+            [
+                col.q1,
+                col.q2,
+                col.q3,
+                col.q4,
+                col.q5,
+                col.q6b,
+                col.q8,
+                col.q10,
+                col.q11c,
+            ],
+        ),
+        (
+            "Page 2",
+            [
+                col.q12b,
+                col.q13b,
+                col.q14b,
+                col.q15b,
+                col.q16b[0],
+                col.q17b[0],
+                col.q18,
+                col.q20[0],
+            ],
+        ),
+        ("Page 3", [col.q21c, col.q22c, col.q26c]),
+        (
+            "Page 4",
+            [
+                col.q30b,
+                col.q31b[0],
+                col.q32b[0],
+                col.q33b,
+                col.q34b[0],
+                col.q35b[0],
+                col.q36c[0],
+            ],
+        ),
+        ("Page 5", [col.q37b, col.q38b, *col.q41b]),
+        (
+            "Page 6",
+            [col.q42b, col.q43c, col.q44b[0], col.q48c, col.q49b[0], col.q52b[0]],
+        ),
+        (
+            "Page 7",
+            [
+                col.q53b,
+                col.q54b[0],
+                col.q55b,
+                col.q56b[0],
+                *col.q57,
+                *col.q58b,
+                col.q59,
+                col.q60a[0],
+                col.q70[0],
+            ],
+        ),
+        ("Page 10", _PAGE_10),
+        ("Page 11", _PAGE_11),
+        ("Page 12", _PAGE_12),
+        ("Page 13", _PAGE_13),
+    ],
+    CONTRACTOR: [
+        (
+            "Page 1",
+            [col.q1, col.q2, col.q3, col.q4, col.q5, col.q8, col.q10, col.q11b],
+        ),
+        (
+            "Page 2",
+            [
+                col.q12b,
+                col.q13b,
+                col.q14b,
+                col.q15b,
+                col.q16b[0],
+                col.q17b[0],
+                col.q18,
+                col.q20[0],
+            ],
+        ),
+        (
+            "Page 3",
+            [
+                col.q21b,
+                col.q22b,
+                col.q23b,
+                col.q24b,
+                col.q25c[0],
+                col.q26b,
+                col.q27b,
+                col.q29[0],
+            ],
+        ),
+        (
+            "Page 4",
+            [
+                col.q30b,
+                col.q31b[0],
+                col.q32b[0],
+                col.q33b,
+                col.q34b[0],
+                col.q35b[0],
+                col.q36d[0],
+            ],
+        ),
+        ("Page 5", [col.q37b, col.q38b, *col.q41b]),
+        (
+            "Page 6",
+            [
+                col.q42a,
+                col.q43b,
+                col.q44a[0],
+                col.q45[0],
+                col.q46,
+                col.q47,
+                col.q48b,
+                col.q49a[0],
+                col.q50[0],
+                col.q51[0],
+                col.q52a[0],
+            ],
+        ),
+        (
+            "Page 7",
+            [
+                col.q53b,
+                col.q54b[0],
+                col.q55b,
+                col.q56b[0],
+                *col.q57,
+                *col.q58c,
+                col.q59,
+                col.q60b[0],
+                col.q70[0],
+            ],
+        ),
+        ("Page 10", _PAGE_10),
+        ("Page 11", _PAGE_11),
+        ("Page 12", _PAGE_12),
+        ("Page 13", _PAGE_13),
+    ],
+    SOLE_TRADER: [
+        (
+            "Page 1",
+            [
+                col.q1,
+                col.q2,
+                col.q3,
+                col.q4,
+                col.q5,
+                col.q6a,
+                col.q7,
+                col.q8,
+                col.q10,
+                col.q11a,
+            ],
+        ),
+        (
+            "Page 2",
+            [
+                col.q12b,
+                col.q13b,
+                col.q14b,
+                col.q15b,
+                col.q16b[0],
+                col.q17b[0],
+                col.q18,
+                col.q20[0],
+            ],
+        ),
+        (
+            "Page 3",
+            [
+                col.q21b,
+                col.q22b,
+                col.q23b,
+                col.q24b,
+                col.q25b[0],
+                col.q25c[0],
+                col.q26b,
+                col.q27b,
+                col.q29[0],
+            ],
+        ),
+        (
+            "Page 4",
+            [
+                col.q30b,
+                col.q31b[0],
+                col.q32b[0],
+                col.q33b,
+                col.q34b[0],
+                col.q35b[0],
+                col.q36b[0],
+            ],
+        ),
+        ("Page 5", [col.q37b, col.q38b, col.q40b[0], col.q39b[0], *col.q41b]),
+        (
+            "Page 6",
+            [
+                col.q42a,
+                col.q43b,
+                col.q44a[0],
+                col.q45[0],
+                col.q46,
+                col.q47,
+                col.q48b,
+                col.q49a[0],
+                col.q50[0],
+                col.q51[0],
+                col.q52a[0],
+            ],
+        ),
+        (
+            "Page 7",
+            [
+                col.q53b,
+                col.q54b[0],
+                col.q55b,
+                col.q56b[0],
+                *col.q57,
+                *col.q58d,
+                col.q59,
+                col.q60a[0],
+                col.q70[0],
+            ],
+        ),
+        ("Page 8", _PAGE_8),
+        ("Page 9", _PAGE_9),
+        ("Page 10", _PAGE_10),
+        ("Page 11", _PAGE_11),
+        ("Page 12", _PAGE_12),
+        ("Page 13", _PAGE_13),
+    ],
+    OWNER: [
+        (
+            "Page 1",
+            [
+                col.q1,
+                col.q2,
+                col.q3,
+                col.q4,
+                col.q5,
+                col.q6a,
+                col.q7,
+                col.q8,
+                col.q10,
+                col.q11a,
+            ],
+        ),
+        (
+            "Page 2",
+            [
+                col.q12a,
+                col.q13a,
+                col.q14a,
+                col.q15a,
+                col.q16a[0],
+                col.q17a[0],
+                col.q18,
+                col.q19[0],
+                col.q20[0],
+            ],
+        ),
+        (
+            "Page 3",
+            [
+                col.q21a,
+                col.q22a,
+                col.q23a,
+                col.q24a,
+                col.q25a[0],
+                col.q26a,
+                col.q27a,
+                col.q28,
+                col.q29[0],
+            ],
+        ),
+        (
+            "Page 4",
+            [
+                col.q30a,
+                col.q31a[0],
+                col.q32a[0],
+                col.q33a,
+                col.q34a[0],
+                col.q35a[0],
+                col.q36a[0],
+            ],
+        ),
+        ("Page 5", [col.q37a, col.q38a, col.q39a[0], col.q40a[0], *col.q41a]),
+        (
+            "Page 6",
+            [
+                col.q42a,
+                col.q43a,
+                col.q44a[0],
+                col.q45[0],
+                col.q46,
+                col.q47,
+                col.q48a,
+                col.q49a[0],
+                col.q50[0],
+                col.q51[0],
+                col.q52a[0],
+            ],
+        ),
+        (
+            "Page 7",
+            [
+                col.q53a,
+                col.q54a[0],
+                col.q55a,
+                col.q56a[0],
+                *col.q57,
+                *col.q58a,
+                col.q59,
+                col.q60a[0],
+                col.q70[0],
+            ],
+        ),
+        ("Page 8", _PAGE_8),
+        ("Page 9", _PAGE_9),
+        ("Page 10", _PAGE_10),
+        ("Page 11", _PAGE_11),
+        ("Page 12", _PAGE_12),
+        ("Page 13", _PAGE_13),
+    ],
+}
+
+
+def route_questions(subpopulation: str) -> List[str]:
+    """Return the ordered list of questions shown to a subpopulation."""
+    return [
+        question for _, questions in ROUTES[subpopulation] for question in questions
+    ]
+
+
+def route_pages(subpopulation: str) -> List[str]:
+    """Return the page label of each question in a subpopulation's route."""
+    return [page for page, questions in ROUTES[subpopulation] for _ in questions]
+
+
+def identify_subpopulation(data: pandas.DataFrame) -> pandas.Series:
+    """Label each respondent with their survey subpopulation.
+
+    Sole traders are separated out from other owners using `q6a`. Respondents
+    with no answer to `q5` are labelled "Error".
+
+    Args:
+        data (pandas.DataFrame): Survey data.
+
+    Returns:
+        pandas.Series: Subpopulation label for each respondent.
+    """
+    respondent_type = data[col.q5].astype("object")
+    sole_trader = data[col.q6a].astype("object") == "I’m a sole trader"
+    labels = numpy.select(
+        [
+            respondent_type == EMPLOYEE,
+            respondent_type == CONTRACTOR,
+            (respondent_type == OWNER) & sole_trader,
+            respondent_type == OWNER,
+        ],
+        SUBPOPULATIONS,
+        default="Error",
+    )
+    return pandas.Series(labels, index=data.index, name="subpopulation")
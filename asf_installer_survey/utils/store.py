@@ -0,0 +1,454 @@
+"""A memory-mapped store of intermediate results shared between processes.
+
+Entries are uncompressed Arrow IPC (Feather v2) files under
+`STORE_DIR/<name>/<key>.v<version>.arrow`. They're opened with memory mapping,
+so every notebook and worker process reading an entry shares the operating
+system's cached pages of the file rather than each decoding its own copy, and
+workers can be sent an entry's name and key instead of pickled data.
+
+- Frames are stored column by column in fixed-width layouts that pandas can
+  view without decoding: categoricals as their codes (categories in the
+  schema metadata), nullable columns as values and a byte mask, and booleans
+  and datetimes as integers. `read_frame` rebuilds the frame from views of the
+  mapped file; strings and multi-select lists are returned as Arrow-backed
+  columns over the mapped buffers. `read_table` returns the stored Arrow table
+  itself, e.g. for workers that only need a column's codes.
+- Arrays (e.g. packed bitsets or grid codes) are stored as a single fixed-size
+  list column with string metadata, and read back as read-only NumPy views of
+  the mapped file.
+
+Keys should be hashes of everything an entry depends on (see `entry_key`),
+and each intermediate has a version, to bump when the code producing it
+changes. Entries are written to a temporary file and renamed into place, so a
+concurrent reader sees either the whole entry or none of it.
+`collect_garbage` removes entries of superseded versions, entries that
+haven't been read for a while and abandoned temporary files.
+"""
+import functools
+import json
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy
+import pandas
+import pyarrow
+import pyarrow.feather as feather
+
+from asf_installer_survey import logger
+from asf_installer_survey.utils.cache import CACHE_DIR, hash_key
+
+STORE_DIR = CACHE_DIR / "store"
+
+# Bump to invalidate every entry, e.g. when the file layout changes.
+FORMAT_VERSION = 2
+
+_SUFFIX = ".arrow"
+_TEMPORARY = ".tmp"
+_VALUES = "values"
+_LAYOUT = b"layout"
+_MASKED = (
+    pandas.arrays.BooleanArray,
+    pandas.arrays.FloatingArray,
+    pandas.arrays.IntegerArray,
+)
+
+
+def entry_key(*parts: Any) -> str:
+    """Combine the values an entry depends on into its key."""
+    return hash_key(FORMAT_VERSION, *parts)
+
+
+def entry_path(name: str, key: str, version: int = 1, root: Path = STORE_DIR) -> Path:
+    """Return the path an entry is stored at."""
+    return Path(root) / name / f"{key}.v{version}{_SUFFIX}"
+
+
+def write_frame(
+    name: str,
+    key: str,
+    data: pandas.DataFrame,
+    version: int = 1,
+    root: Path = STORE_DIR,
+) -> Path:
+    """Store a data frame.
+
+    Args:
+        name (str): Intermediate name, e.g. "analytical_sample".
+        key (str): Entry key (see `entry_key`).
+        data (pandas.DataFrame): Frame to store.
+        version (int): Version of the code producing the intermediate.
+        root (Path): Store directory.
+
+    Returns:
+        Path: Path of the entry.
+    """
+    index_names = [f"__index_level_{i}__" for i in range(data.index.nlevels)]
+    fields, layout = [], []
+    for i, field in enumerate(index_names):
+        fields += _encode(field, data.index.get_level_values(i), layout)
+    for column in data.columns:
+        fields += _encode(str(column), data[column], layout)
+    metadata = {
+        "index": index_names,
+        "index_labels": list(data.index.names),
+        "columns": list(data.columns),
+        "fields": layout,
+    }
+    table = pyarrow.Table.from_arrays(
+        [values for _, values in fields],
+        schema=pyarrow.schema(
+            [(field, values.type) for field, values in fields],
+            metadata={_LAYOUT: json.dumps(metadata, default=str)},
+        ),
+    )
+    return _write(table, entry_path(name, key, version, root))
+
+
+def read_table(
+    name: str,
+    key: str,
+    columns: Optional[List[str]] = None,
+    version: int = 1,
+    root: Path = STORE_DIR,
+) -> Optional[pyarrow.Table]:
+    """Open a stored frame as a memory-mapped Arrow table.
+
+    Args:
+        name (str): Intermediate name.
+        key (str): Entry key.
+        columns (Optional[List[str]]): Columns to read. Defaults to all.
+        version (int): Version of the intermediate.
+        root (Path): Store directory.
+
+    Returns:
+        Optional[pyarrow.Table]: The table, or None if it isn't stored.
+    """
+    path = entry_path(name, key, version, root)
+    if not path.exists():
+        return None
+    _touch(path)
+    table = _open(path)
+    return table if columns is None else table.select(columns)
+
+
+def read_frame(
+    name: str,
+    key: str,
+    columns: Optional[List[str]] = None,
+    version: int = 1,
+    root: Path = STORE_DIR,
+) -> Optional[pandas.DataFrame]:
+    """Read a stored frame, or return None if it isn't stored.
+
+    Columns are views of the mapped file, so processes reading the same entry
+    share its pages (see `read_table` for arguments). Only object columns
+    Arrow can't represent are decoded into memory.
+    """
+    table = read_table(name, key, version=version, root=root)
+    if table is None:
+        return None
+    metadata = json.loads(table.schema.metadata[_LAYOUT])
+    layout = {field["name"]: field for field in metadata["fields"]}
+    labels = metadata["columns"] if columns is None else columns
+    index = [_decode(table, layout[name]) for name in metadata["index"]]
+    return pandas.DataFrame(
+        {label: _decode(table, layout[str(label)]) for label in labels},
+        index=(
+            pandas.MultiIndex.from_arrays(index, names=metadata["index_labels"])
+            if len(index) > 1
+            else pandas.Index(index[0], name=metadata["index_labels"][0], copy=False)
+        ),
+        columns=labels,
+        copy=False,
+    )
+
+
+def write_array(
+    name: str,
+    key: str,
+    array: numpy.ndarray,
+    metadata: Optional[Dict[str, Any]] = None,
+    version: int = 1,
+    root: Path = STORE_DIR,
+) -> Path:
+    """Store an array of one or more dimensions.
+
+    Args:
+        name (str): Intermediate name, e.g. "bitsets".
+        key (str): Entry key (see `entry_key`).
+        array (numpy.ndarray): Array to store.
+        metadata (Optional[Dict[str, Any]]): JSON serialisable values to
+            store with the array, e.g. the options a bitset's bits index.
+        version (int): Version of the code producing the intermediate.
+        root (Path): Store directory.
+
+    Returns:
+        Path: Path of the entry.
+    """
+    array = numpy.ascontiguousarray(array)
+    if array.ndim == 0:
+        raise ValueError("Can only store arrays of one or more dimensions.")
+    width = int(numpy.prod(array.shape[1:], dtype=numpy.int64))
+    values = pyarrow.array(array.reshape(-1))
+    rows = pyarrow.FixedSizeListArray.from_arrays(values, max(width, 1))
+    schema = pyarrow.schema(
+        [(_VALUES, rows.type)],
+        metadata={
+            "shape": json.dumps(array.shape),
+            "metadata": json.dumps(metadata or {}),
+        },
+    )
+    table = pyarrow.Table.from_arrays([rows], schema=schema)
+    return _write(table, entry_path(name, key, version, root))
+
+
+def read_array(
+    name: str, key: str, version: int = 1, root: Path = STORE_DIR
+) -> Optional[Tuple[numpy.ndarray, Dict[str, Any]]]:
+    """Read a stored array as a read-only view of the mapped file.
+
+    Args:
+        name (str): Intermediate name.
+        key (str): Entry key.
+        version (int): Version of the intermediate.
+        root (Path): Store directory.
+
+    Returns:
+        Optional[Tuple[numpy.ndarray, Dict[str, Any]]]: The array and its
+            metadata, or None if it isn't stored.
+    """
+    path = entry_path(name, key, version, root)
+    if not path.exists():
+        return None
+    _touch(path)
+    table = _open(path)
+    schema_metadata = table.schema.metadata
+    shape = tuple(json.loads(schema_metadata[b"shape"]))
+    metadata = json.loads(schema_metadata[b"metadata"])
+    values = _numpy(table.column(_VALUES), flatten=True)
+    return values.reshape(shape), metadata
+
+
+def stored_frame(
+    name: str,
+    key: str,
+    compute: Callable[[], pandas.DataFrame],
+    version: int = 1,
+    root: Path = STORE_DIR,
+) -> pandas.DataFrame:
+    """Read a stored frame, computing and storing it first if needed.
+
+    Args:
+        name (str): Intermediate name.
+        key (str): Entry key.
+        compute (Callable[[], pandas.DataFrame]): Computes the frame.
+        version (int): Version of the intermediate.
+        root (Path): Store directory.
+
+    Returns:
+        pandas.DataFrame: The frame, read back from the store so that it's
+            backed by the same pages as in other processes.
+    """
+    data = read_frame(name, key, version=version, root=root)
+    if data is None:
+        write_frame(name, key, compute(), version, root)
+        data = read_frame(name, key, version=version, root=root)
+    return data
+
+
+def stored_array(
+    name: str,
+    key: str,
+    compute: Callable[[], Tuple[numpy.ndarray, Dict[str, Any]]],
+    version: int = 1,
+    root: Path = STORE_DIR,
+) -> Tuple[numpy.ndarray, Dict[str, Any]]:
+    """Read a stored array, computing and storing it first if needed.
+
+    Args:
+        name (str): Intermediate name.
+        key (str): Entry key.
+        compute (Callable[[], Tuple[numpy.ndarray, Dict[str, Any]]]): Computes
+            the array and its metadata.
+        version (int): Version of the intermediate.
+        root (Path): Store directory.
+
+    Returns:
+        Tuple[numpy.ndarray, Dict[str, Any]]: The array, as a view of the
+            stored file, and its metadata.
+    """
+    stored = read_array(name, key, version, root)
+    if stored is None:
+        array, metadata = compute()
+        write_array(name, key, array, metadata, version, root)
+        stored = read_array(name, key, version, root)
+    return stored
+
+
+def collect_garbage(
+    versions: Optional[Dict[str, int]] = None,
+    max_age: Optional[float] = None,
+    root: Path = STORE_DIR,
+) -> List[Path]:
+    """Remove stale entries from the store.
+
+    Processes that have already mapped a removed entry can keep reading it.
+
+    Args:
+        versions (Optional[Dict[str, int]]): Current version of each
+            intermediate. Entries of other versions of these intermediates are
+            removed.
+        max_age (Optional[float]): Remove entries that haven't been read or
+            written for this many seconds.
+        root (Path): Store directory.
+
+    Returns:
+        List[Path]: Paths of the removed entries.
+    """
+    versions = versions or {}
+    now = time.time()
+    removed = []
+    for path in sorted(Path(root).glob(f"*/*{_SUFFIX}*")):
+        age = now - path.stat().st_mtime
+        if path.name.endswith(_TEMPORARY):
+            # Left by a writer that failed, unless it's still being written.
+            stale = age > 60 * 60
+        else:
+            version = int(path.name[: -len(_SUFFIX)].rsplit(".v", 1)[1])
+            name = path.parent.name
+            stale = (name in versions and version != versions[name]) or (
+                max_age is not None and age > max_age
+            )
+        if stale:
+            path.unlink(missing_ok=True)
+            removed.append(path)
+    if removed:
+        logger.info(f"Removed {len(removed)} stale entries from {root}.")
+    return removed
+
+
+def _encode(name: str, series: pandas.Series, layout: List[Dict]) -> List:
+    # Append a column's layout and return its stored fields. Each field is a
+    # fixed-width array without a validity bitmap where possible, so it can
+    # be read back as a NumPy view.
+    series = pandas.Series(series, copy=False)
+    dtype = series.dtype
+    entry = {"name": name, "dtype": str(dtype)}
+    if isinstance(dtype, pandas.CategoricalDtype):
+        categories = dtype.categories
+        entry.update(
+            kind="categorical",
+            categories=categories.tolist(),
+            categories_dtype=str(categories.dtype),
+            ordered=bool(dtype.ordered),
+        )
+        fields = [(name, pyarrow.array(series.cat.codes.to_numpy()))]
+    elif isinstance(series.array, _MASKED):
+        values = series.to_numpy(dtype=dtype.numpy_dtype, na_value=0)
+        entry.update(kind="masked", mask=f"{name}__mask__")
+        fields = [
+            (name, pyarrow.array(_fixed_width(values))),
+            (entry["mask"], pyarrow.array(series.isna().to_numpy().view(numpy.uint8))),
+        ]
+    elif isinstance(dtype, numpy.dtype) and dtype.kind in "biufmM":
+        entry.update(kind="numpy")
+        values = _fixed_width(series.to_numpy())
+        fields = [(name, pyarrow.array(values, from_pandas=False))]
+    else:
+        entry.update(kind="arrow")
+        values = pyarrow.array(series, from_pandas=True)
+        if pyarrow.types.is_string(values.type):
+            values = values.cast(pyarrow.large_string())
+        fields = [(name, values)]
+    layout.append(entry)
+    return fields
+
+
+def _decode(table: pyarrow.Table, entry: Dict) -> Any:
+    # Rebuild a column stored by `_encode` over the table's buffers.
+    values = table.column(entry["name"])
+    kind = entry["kind"]
+    if kind == "categorical":
+        dtype = pandas.CategoricalDtype(
+            pandas.Index(entry["categories"], dtype=entry["categories_dtype"]),
+            ordered=entry["ordered"],
+        )
+        return pandas.Categorical.from_codes(
+            _numpy(values), dtype=dtype, validate=False
+        )
+    if kind == "masked":
+        dtype = pandas.api.types.pandas_dtype(entry["dtype"])
+        mask = _numpy(table.column(entry["mask"])).view(bool)
+        data = _numpy(values).view(dtype.numpy_dtype)
+        return dtype.construct_array_type()(data, mask, copy=False)
+    if kind == "numpy":
+        return _numpy(values).view(entry["dtype"])
+    if pyarrow.types.is_large_string(values.type):
+        # Arrow-backed string columns keep their dtype, others become one.
+        dtype = pandas.api.types.pandas_dtype(entry["dtype"])
+        if getattr(dtype, "storage", None) == "pyarrow":
+            return pandas.array(values, dtype=dtype)
+        return pandas.arrays.ArrowExtensionArray(values)
+    if pyarrow.types.is_list(values.type):
+        return pandas.arrays.ArrowExtensionArray(values)
+    return values.to_pandas()
+
+
+def _fixed_width(values: numpy.ndarray) -> numpy.ndarray:
+    # Booleans and datetimes as integers of the same width, so that Arrow
+    # stores their bytes as they are (missing datetimes included).
+    if values.dtype.kind in "bmM":
+        return values.view(f"u{values.dtype.itemsize}")
+    return values
+
+
+def _numpy(values: pyarrow.ChunkedArray, flatten: bool = False) -> numpy.ndarray:
+    # A read-only view of a stored column, which entries write as one chunk.
+    if values.num_chunks == 1:
+        chunk = values.chunk(0)
+        return (chunk.flatten() if flatten else chunk).to_numpy(zero_copy_only=True)
+    values = values.combine_chunks()
+    return (values.flatten() if flatten else values).to_numpy()
+
+
+def _write(table: pyarrow.Table, path: Path) -> Path:
+    # Uncompressed and in a single record batch, so that readers can map
+    # each column as one contiguous buffer rather than decode it.
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(f"{path.name}.{uuid.uuid4().hex}{_TEMPORARY}")
+    try:
+        feather.write_feather(
+            table.combine_chunks(),
+            temporary,
+            compression="uncompressed",
+            chunksize=max(table.num_rows, 1),
+        )
+        os.replace(temporary, path)
+    finally:
+        temporary.unlink(missing_ok=True)
+    return path
+
+
+def _open(path: Path) -> pyarrow.Table:
+    # Reuse this process's mapping of an entry until its file is replaced, so
+    # repeated reads return views of the same memory. Reads update the
+    # modification time (see `_touch`), so the file is identified by inode.
+    stat = path.stat()
+    return _mapped(str(path), stat.st_dev, stat.st_ino)
+
+
+@functools.lru_cache(maxsize=128)
+def _mapped(path: str, device: int, inode: int) -> pyarrow.Table:
+    return feather.read_table(path, memory_map=True)
+
+
+def _touch(path: Path) -> None:
+    # Record the read for `collect_garbage(max_age=...)`. Access times are
+    # often not updated by the file system, so the modification time is used.
+    try:
+        os.utime(path)
+    except OSError:
+        pass
@@ -0,0 +1,76 @@
+import numpy
+import pandas
+import pytest
+from scipy import stats
+
+from asf_installer_survey.analysis.associations import (
+    association_matrix,
+    cramers_v,
+    CRAMERS_V,
+    SPEARMAN,
+    spearman,
+)
+
+SCALE = ["Low", "Medium", "High"]
+
+
+@pytest.fixture
+def data():
+    rng = numpy.random.default_rng(0)
+    level = rng.integers(0, 3, 300)
+    noisy = numpy.clip(level + rng.integers(-1, 2, 300), 0, 2)
+    return pandas.DataFrame(
+        {
+            "x": pandas.Categorical(numpy.array(SCALE)[level]),
+            "y": pandas.Categorical(numpy.array(SCALE)[noisy]),
+            "z": pandas.Categorical(rng.choice(["a", "b"], 300)),
+        }
+    )
+
+
+def test_spearman_matches_scipy():
+    rng = numpy.random.default_rng(1)
+    x = rng.integers(0, 4, 500)
+    y = numpy.clip(x + rng.integers(-2, 3, 500), 0, 5)
+    table = pandas.crosstab(x, y).to_numpy()
+
+    assert spearman(table) == pytest.approx(stats.spearmanr(x, y).statistic)
+
+
+def test_cramers_v_matches_scipy():
+    table = numpy.array([[20, 5, 7], [3, 30, 9]])
+
+    assert cramers_v(table) == pytest.approx(
+        stats.contingency.association(table, method="cramer")
+    )
+
+
+def test_ordinal_pairs_ranked_in_scale_order(data):
+    associations = association_matrix(
+        data, ["x", "y", "z"], scales={"x": SCALE, "y": SCALE}, n_jobs=1, cache=False
+    )
+
+    ranked = associations.ranked.set_index(["row", "column"])
+    assert ranked.loc[("x", "y"), "measure"] == SPEARMAN
+    assert ranked.loc[("x", "z"), "measure"] == CRAMERS_V
+    codes = {level: i for i, level in enumerate(SCALE)}
+    assert ranked.loc[("x", "y"), "association"] == pytest.approx(
+        stats.spearmanr(data["x"].map(codes), data["y"].map(codes)).statistic
+    )
+
+
+def test_ordered_categorical_drops_off_scale_answers(data):
+    answers = data["x"].astype(str).to_numpy()
+    answers[:50] = "Don't know"
+    data["x"] = pandas.Categorical(answers, SCALE + ["Don't know"], ordered=True)
+    data["y"] = data["y"].cat.reorder_categories(SCALE, ordered=True)
+
+    associations = association_matrix(data, ["x", "y"], n_jobs=1, cache=False)
+
+    assert associations.ranked.loc[0, "measure"] == SPEARMAN
+    assert associations.ranked.loc[0, "respondents"] == 250
+
+
+def test_ordinal_without_scale_order(data):
+    with pytest.raises(ValueError):
+        association_matrix(data, ["x", "y"], ordinal=["x", "y"], cache=False)
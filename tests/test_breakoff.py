@@ -0,0 +1,38 @@
+import numpy
+import pandas
+
+from asf_installer_survey.analysis.breakoff import (
+    identify_break_off,
+    page_dropout_funnel,
+    survival_curves,
+)
+from asf_installer_survey.utils.lookups import QuestionNumbers as col
+
+
+def test_no_identified_subpopulation():
+    data = pandas.DataFrame(
+        {
+            col.q0d: ["Partial", "Complete"],
+            col.q5: [numpy.nan, numpy.nan],
+            col.q6a: [numpy.nan, numpy.nan],
+            "wave": [1, 2],
+        }
+    )
+
+    break_off = identify_break_off(data, by="wave")
+    assert break_off.empty
+    assert {"subpopulation", "complete", "position", "page", "wave"} <= set(
+        break_off.columns
+    )
+
+    funnel = page_dropout_funnel(break_off, by="wave")
+    assert funnel.empty
+    assert {"subpopulation", "wave", "page", "reached", "dropout_rate"} <= set(
+        funnel.columns
+    )
+
+    survival = survival_curves(break_off)
+    assert survival.empty
+    assert {"subpopulation", "position", "survival", "standard_error"} <= set(
+        survival.columns
+    )
@@ -0,0 +1,124 @@
+import numpy
+import pandas
+import pytest
+
+from asf_installer_survey.analysis.cooccurrence import all_cooccurrences, cooccurrence
+
+PRODUCTS = ["ASHP", "GSHP", "Biomass", "Solar"]
+CHANNELS = ["Direct", "Merchant", "Online"]
+
+
+@pytest.fixture
+def data():
+    rng = numpy.random.default_rng(0)
+    n = 300
+
+    def answers(options):
+        return [
+            None if rng.random() < 0.1 else list(rng.choice(options, size, False))
+            for size in rng.integers(1, 3, n)
+        ]
+
+    return pandas.DataFrame(
+        {
+            "products": answers(PRODUCTS),
+            "channels": answers(CHANNELS),
+            "region": pandas.Categorical(rng.choice(["North", "South"], n)),
+            "weight": rng.uniform(0.5, 2, n),
+        }
+    )
+
+
+def _pairs(data, row, column):
+    # One row per respondent and pair of options they selected, among the
+    # respondents who answered both questions.
+    both = data[data[row].notna() & data[column].notna()]
+    return both.explode(row).explode(column).reset_index(drop=True), both
+
+
+def _table(result, values):
+    return result.pivot_table(
+        index=["group", "row_option"],
+        columns="column_option",
+        values=values,
+        aggfunc="sum",
+    )
+
+
+def test_counts_match_crosstab(data):
+    result = cooccurrence(data, "products", "channels", by="region")
+    pairs, both = _pairs(data, "products", "channels")
+
+    expected = pandas.crosstab(
+        [pairs["region"].astype(str), pairs["products"]], pairs["channels"]
+    ).rename_axis(index=["group", "row_option"], columns="column_option")
+    counts = _table(result, "count")
+    pandas.testing.assert_frame_equal(
+        counts.loc[expected.index, expected.columns],
+        expected,
+        check_dtype=False,
+        check_names=False,
+    )
+    assert counts.to_numpy().sum() == expected.to_numpy().sum()
+
+    bases = result.groupby("group", observed=True)["base"].first()
+    assert bases.to_dict() == both["region"].value_counts().to_dict()
+
+
+def test_weighted_counts_match_crosstab(data):
+    result = cooccurrence(data, "products", "channels", weights="weight")
+    pairs, both = _pairs(data, "products", "channels")
+
+    expected = pandas.crosstab(
+        pairs["products"], pairs["channels"], values=pairs["weight"], aggfunc="sum"
+    ).fillna(0)
+    counts = _table(result, "count").droplevel("group")
+    numpy.testing.assert_allclose(
+        counts.loc[expected.index, expected.columns].to_numpy(), expected.to_numpy()
+    )
+    assert result["base"].iloc[0] == pytest.approx(both["weight"].sum())
+
+
+def test_totals_lift_and_jaccard(data):
+    result = cooccurrence(data, "products", "channels").set_index(
+        ["row_option", "column_option"]
+    )
+    _, both = _pairs(data, "products", "channels")
+    selects = {
+        option: both[question].map(lambda selected: option in selected)
+        for question, options in [("products", PRODUCTS), ("channels", CHANNELS)]
+        for option in options
+    }
+
+    row = result.loc[("ASHP", "Online")]
+    ashp, online = selects["ASHP"], selects["Online"]
+    assert row["row_total"] == ashp.sum()
+    assert row["column_total"] == online.sum()
+    assert row["count"] == (ashp & online).sum()
+    assert row["lift"] == pytest.approx(
+        (ashp & online).mean() / (ashp.mean() * online.mean())
+    )
+    assert row["jaccard"] == pytest.approx(
+        (ashp & online).sum() / (ashp | online).sum()
+    )
+
+
+def test_all_pairs_share_one_product(data):
+    data = data.assign(services=data["channels"])
+    result = all_cooccurrences(data, ["products", "channels", "services"])
+
+    assert list(
+        result[["row_question", "column_question"]]
+        .drop_duplicates()
+        .itertuples(index=False, name=None)
+    ) == [("products", "channels"), ("products", "services"), ("channels", "services")]
+    single = cooccurrence(data, "products", "channels")
+    pandas.testing.assert_frame_equal(
+        result[result["column_question"] == "channels"].reset_index(drop=True),
+        single,
+    )
+    # A question paired with its copy selects each option alongside itself.
+    same = result[result["row_question"] == "channels"]
+    diagonal = same[same["row_option"] == same["column_option"]]
+    assert (diagonal["count"] == diagonal["row_total"]).all()
+    assert (diagonal["jaccard"] == 1).all()
@@ -0,0 +1,27 @@
+import numpy
+import pandas
+
+from asf_installer_survey.analysis.cube import _encode_combinations
+
+
+def test_encode_combinations_beyond_63_options():
+    options = [f"Option {i:02d}" for i in range(80)]
+    answers = pandas.Series(
+        [
+            numpy.array([options[0], options[70]], dtype=object),
+            numpy.array([options[70]], dtype=object),
+            numpy.array([options[0], options[70]], dtype=object),
+            numpy.array([options[79]], dtype=object),
+        ]
+    )
+
+    codes, labels, patterns = _encode_combinations(answers)
+
+    assert [labels[code] for code in codes] == [
+        f"{options[0]} & {options[70]}",
+        options[70],
+        f"{options[0]} & {options[70]}",
+        options[79],
+    ]
+    assert patterns.loc[options[79], options[79]]
+    assert patterns.to_numpy().sum() == 4
@@ -0,0 +1,126 @@
+import numpy
+import pandas
+import pytest
+from scipy import linalg
+
+from asf_installer_survey.analysis.summaries import multi_select_frequencies
+from asf_installer_survey.pipeline.disclosure import (
+    LinkedTable,
+    protect_summaries,
+    protect_tables,
+    PUBLISHED,
+)
+
+# Two splits of the same answers: their column totals are the same margin.
+BY_STATUS = numpy.array([[2, 30, 14], [21, 3, 40]])
+BY_NATION = numpy.array([[20, 25, 50], [1, 4, 3], [2, 4, 1]])
+
+
+def _recoverable(tables, protected):
+    # Withheld cells (and totals) determined by the published values through
+    # the tables' sums. Unknowns are every cell and total of the tables, with
+    # the shared column margin's totals counted once.
+    names, equations = {}, []
+
+    def unknown(name):
+        return names.setdefault(name, len(names))
+
+    for t, counts in enumerate(tables):
+        n_rows, n_columns = counts.shape
+        for i in range(n_rows):
+            equations.append(
+                [(unknown((t, i, j)), 1) for j in range(n_columns)]
+                + [(unknown((t, i, "total")), -1)]
+            )
+        for j in range(n_columns):
+            equations.append(
+                [(unknown((t, i, j)), 1) for i in range(n_rows)]
+                + [(unknown(("margin", j)), -1)]
+            )
+        equations.append(
+            [(unknown((t, i, "total")), 1) for i in range(n_rows)]
+            + [(unknown(("margin", "total")), -1)]
+        )
+    equations.append(
+        [(unknown(("margin", j)), 1) for j in range(tables[0].shape[1])]
+        + [(unknown(("margin", "total")), -1)]
+    )
+    matrix = numpy.zeros((len(equations), len(names)))
+    for row, terms in enumerate(equations):
+        for column, coefficient in terms:
+            matrix[row, column] = coefficient
+
+    withheld = set()
+    for t, table in enumerate(protected):
+        for (i, j), status in numpy.ndenumerate(table.status):
+            if status != PUBLISHED:
+                withheld.add((t, i, j))
+        for i, status in enumerate(table.row_status):
+            if status != PUBLISHED:
+                withheld.add((t, i, "total"))
+        for j, status in enumerate(table.column_status):
+            if status != PUBLISHED:
+                withheld.add(("margin", j))
+    unknowns = sorted(withheld, key=names.get)
+    # A withheld value is recoverable if no solution of the sums can vary it.
+    null = linalg.null_space(matrix[:, [names[name] for name in unknowns]])
+    return [
+        name for name, row in zip(unknowns, null) if numpy.allclose(row, 0, atol=1e-9)
+    ]
+
+
+def test_linked_tables_hide_withheld_cells():
+    tables = [BY_STATUS, BY_NATION]
+    protected = protect_tables(
+        [
+            LinkedTable(counts, f"{i} rows", "answers")
+            for i, counts in enumerate(tables)
+        ],
+        threshold=5,
+        round_to=None,
+    )
+
+    assert (protected[0].status[BY_STATUS < 5] != PUBLISHED).all()
+    assert (protected[1].status[(BY_NATION < 5) & (BY_NATION > 0)] != PUBLISHED).all()
+    assert _recoverable(tables, protected) == []
+    # The shared margin is withheld (or published) in both tables alike.
+    numpy.testing.assert_array_equal(
+        protected[0].column_status, protected[1].column_status
+    )
+
+
+def test_published_counts_are_unchanged():
+    protected = protect_tables(
+        [LinkedTable(BY_STATUS, "rows", "answers")], threshold=5, round_to=None
+    )[0]
+
+    published = protected.status == PUBLISHED
+    numpy.testing.assert_array_equal(protected.counts[published], BY_STATUS[published])
+    assert numpy.isnan(protected.counts[~published]).all()
+
+
+def test_summaries_carry_respondent_bases():
+    options = numpy.array(["Air source", "Ground source", "Hybrid"], dtype=object)
+    rng = numpy.random.default_rng(0)
+    data = pandas.DataFrame(
+        {
+            "q": [options[rng.random(3) < 0.5] if i % 10 else None for i in range(200)],
+            "group": numpy.where(numpy.arange(200) < 197, "Large", "Small"),
+        }
+    )
+    summaries = [
+        multi_select_frequencies(data, "q"),
+        multi_select_frequencies(data, "q", "group"),
+    ]
+
+    protected = protect_summaries(summaries, threshold=5, round_to=None)
+
+    answered = data["q"].map(lambda a: a is not None and len(a) > 0)
+    split = protected[1].set_index(["group", "option"])
+    assert (split.loc["Large", "respondents"] == answered[:197].sum()).all()
+    assert split.loc["Small", "respondents"].isna().all()
+    assert split.loc["Small", "proportion"].isna().all()
+    assert protected[0]["respondents"].eq(answered.sum()).all()
+    assert protected[0]["proportion"].to_numpy() == pytest.approx(
+        summaries[0]["proportion"].to_numpy()
+    )
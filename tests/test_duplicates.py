@@ -0,0 +1,98 @@
+import numpy
+import pandas
+import pytest
+from scipy import sparse
+
+from asf_installer_survey.pipeline import duplicates
+
+
+def _token_matrix(sets, n_tokens):
+    rows = numpy.repeat(numpy.arange(len(sets)), [len(s) for s in sets])
+    columns = numpy.concatenate([sorted(s) for s in sets]).astype(numpy.int64)
+    return sparse.csr_matrix(
+        (numpy.ones(len(rows), dtype=numpy.int32), (rows, columns)),
+        shape=(len(sets), n_tokens),
+    )
+
+
+@pytest.fixture
+def planted():
+    # Random answer token sets, each followed by a near-duplicate of itself
+    # with a few tokens changed.
+    rng = numpy.random.default_rng(0)
+    n_tokens, sets, pairs, similarities = 2000, [], [], []
+    for _ in range(200):
+        original = set(rng.choice(n_tokens, 40, replace=False).tolist())
+        changed = set(rng.choice(sorted(original), 3, replace=False).tolist())
+        copy = (original - changed) | set(
+            rng.choice(n_tokens, 3, replace=False).tolist()
+        )
+        pairs.append((len(sets), len(sets) + 1))
+        similarities.append(len(original & copy) / len(original | copy))
+        sets += [original, copy]
+    return _token_matrix(sets, n_tokens), pairs, numpy.array(similarities)
+
+
+def test_signatures_estimate_jaccard(planted):
+    tokens, pairs, similarities = planted
+    signatures = duplicates.minhash_signatures(tokens, num_permutations=256)
+
+    first, second = numpy.array(pairs).T
+    estimates = (signatures[first] == signatures[second]).mean(axis=1)
+    assert numpy.abs(estimates - similarities).mean() < 0.03
+    assert (signatures[0] == signatures[2]).mean() < 0.1
+
+
+def test_signatures_are_chunk_invariant(planted):
+    tokens, _, _ = planted
+    tokens = sparse.vstack([tokens, sparse.csr_matrix((2, tokens.shape[1]))]).tocsr()
+
+    whole = duplicates.minhash_signatures(tokens)
+    chunked = duplicates.minhash_signatures(tokens, max_chunk_hashes=1000)
+
+    numpy.testing.assert_array_equal(whole, chunked)
+    assert (whole[-2:] == duplicates._PRIME).all()
+
+
+def test_lsh_recalls_near_duplicates(planted):
+    tokens, pairs, similarities = planted
+    assert similarities.min() >= 0.8
+
+    candidates = duplicates.lsh_candidates(duplicates.minhash_signatures(tokens))
+    found = set(map(tuple, candidates.tolist()))
+
+    recall = numpy.mean([pair in found for pair in pairs])
+    assert recall >= 0.99
+    # Unrelated sets share almost no tokens, so are rarely candidates.
+    assert len(found - set(pairs)) < 0.01 * len(pairs)
+    assert (candidates[:, 0] < candidates[:, 1]).all()
+
+
+def test_oversize_buckets_are_skipped():
+    # Every row identical, so every band's bucket holds them all.
+    tokens = _token_matrix([set(range(20))] * 60, 20)
+    signatures = duplicates.minhash_signatures(tokens)
+
+    assert len(duplicates.lsh_candidates(signatures, max_bucket_size=50)) == 0
+    assert len(duplicates.lsh_candidates(signatures, max_bucket_size=60)) == 60 * 59 / 2
+
+
+def test_encodes_answered_tokens():
+    data = pandas.DataFrame(
+        {
+            "heating": pandas.Categorical(["gas", None, "oil", "gas"]),
+            "products": [["ASHP", "GSHP"], ["ASHP"], None, []],
+        }
+    )
+    vectors = duplicates.encode_answer_vectors(data, ["heating", "products"])
+
+    assert vectors.tokens.toarray().tolist() == [
+        [1, 0, 1, 1],
+        [0, 0, 1, 0],
+        [0, 1, 0, 0],
+        [1, 0, 0, 0],
+    ]
+    hashes = duplicates.answer_hashes(vectors)
+    assert len(set(hashes)) == 4
+    repeated = duplicates.encode_answer_vectors(data.iloc[[0, 0]], ["heating"])
+    assert len(set(duplicates.answer_hashes(repeated))) == 1
@@ -0,0 +1,117 @@
+import numpy
+import pandas
+import pytest
+
+from asf_installer_survey.analysis import imputation
+from asf_installer_survey.analysis.missingness import MissingnessIndex
+
+PRODUCTS = "Which products do you install? You can select up to 2 options."
+COLUMNS = ["region", "fuel", PRODUCTS]
+
+
+@pytest.fixture
+def data():
+    rng = numpy.random.default_rng(0)
+    n = 400
+    region = rng.choice(["North", "South"], n)
+    # Fuel follows region, so imputations should too.
+    fuel = numpy.where(region == "North", "Gas", "Oil").astype(object)
+    products = [["ASHP", "GSHP"] if r == "North" else ["Biomass"] for r in region]
+    fuel[:40] = None
+    for i in range(40, 80):
+        products[i] = None
+    return pandas.DataFrame(
+        {
+            "region": pandas.Categorical(region),
+            "fuel": pandas.Categorical(fuel, categories=["Gas", "Oil"]),
+            PRODUCTS: products,
+        }
+    )
+
+
+@pytest.fixture
+def missingness(data):
+    # Only the first 20 respondents missing fuel, and respondents 40 to 60
+    # missing products, were shown those questions.
+    shown = numpy.ones((len(data), len(COLUMNS)), dtype=bool)
+    shown[20:40, 1] = False
+    shown[60:80, 2] = False
+    return MissingnessIndex(
+        COLUMNS,
+        data.index,
+        numpy.packbits(shown, axis=1),
+        numpy.packbits(numpy.zeros_like(shown), axis=1),
+    )
+
+
+def _impute(data, missingness, **kwargs):
+    return imputation.multiply_impute(
+        data,
+        ["fuel", PRODUCTS],
+        n_imputations=3,
+        n_cycles=3,
+        auxiliary=["region"],
+        n_jobs=1,
+        missingness=missingness,
+        **kwargs,
+    )
+
+
+def test_imputes_only_missing_answers_respondents_were_shown(data, missingness):
+    for completed in _impute(data, missingness):
+        fuel, products = completed["fuel"], completed[PRODUCTS]
+        assert fuel.dtype == data["fuel"].dtype
+        assert fuel.iloc[:20].notna().all()
+        assert fuel.iloc[20:40].isna().all()
+        pandas.testing.assert_series_equal(fuel.iloc[40:], data["fuel"].iloc[40:])
+
+        assert products.iloc[60:80].isna().all()
+        for selected in products.iloc[40:60]:
+            assert 1 <= len(selected) <= 2
+        assert products.iloc[80:].tolist() == data[PRODUCTS].iloc[80:].tolist()
+
+
+def test_imputations_follow_predictors(data, missingness):
+    completed = _impute(data, missingness)
+    expected = numpy.where(data["region"].iloc[:20] == "North", "Gas", "Oil")
+    agreement = numpy.mean(
+        [(c["fuel"].iloc[:20].to_numpy() == expected).mean() for c in completed]
+    )
+    assert agreement > 0.9
+
+
+def test_imputations_are_reproducible(data, missingness):
+    first = _impute(data, missingness, seed=3)
+    second = _impute(data, missingness, seed=3)
+    for a, b in zip(first, second):
+        pandas.testing.assert_frame_equal(a, b)
+
+
+def test_pool_estimates_apply_rubins_rules():
+    estimates = numpy.array([[0.2, 1.0], [0.4, 1.0], [0.3, 1.0]])
+    variances = numpy.array([[0.01, 0.04], [0.02, 0.04], [0.03, 0.04]])
+    pooled = imputation.pool_estimates(estimates, variances)
+
+    within, between = 0.02, 0.01
+    total = within + (1 + 1 / 3) * between
+    r = (1 + 1 / 3) * between / within
+    df = 2 * (1 + 1 / r) ** 2
+    assert pooled["estimate"].tolist() == pytest.approx([0.3, 1.0])
+    assert pooled["std_error"].tolist() == pytest.approx([total**0.5, 0.2])
+    assert pooled.loc[0, "df"] == pytest.approx(df)
+    assert pooled.loc[0, "fmi"] == pytest.approx((r + 2 / (df + 3)) / (r + 1))
+    # With no variation between imputations, it's the usual interval.
+    assert pooled.loc[1, "fmi"] == 0
+    assert pooled.loc[1, "ci_upper"] == pytest.approx(1 + 1.959964 * 0.2)
+
+
+def test_pooled_frequencies_of_identical_imputations(data):
+    completed = data.dropna()
+    pooled = imputation.pooled_frequencies([completed] * 3, "fuel")
+
+    assert (
+        pooled["count"].tolist() == completed["fuel"].value_counts(sort=False).tolist()
+    )
+    assert pooled["proportion"].sum() == pytest.approx(1)
+    assert (pooled["fmi"] == 0).all()
+    assert (pooled["respondents"] == len(completed)).all()
@@ -0,0 +1,117 @@
+import numpy
+import pandas
+import pytest
+from scipy import stats
+
+from asf_installer_survey.analysis.independence import (
+    ASYMPTOTIC,
+    crosstab_test,
+    independence_test,
+    independence_tests,
+    MONTE_CARLO,
+    monte_carlo_p_value,
+)
+from asf_installer_survey.analysis.summaries import (
+    grid_frequencies,
+    single_select_frequencies,
+    split_independence,
+)
+
+SPARSE = numpy.array([[3, 1], [1, 4]])
+
+
+def _hypergeometric_p_value(table):
+    # Exact p value of a 2x2 table's chi-squared statistic: with fixed
+    # margins, it orders tables by the distance of the top left count from
+    # its expectation.
+    (a, b), (c, d) = table
+    distribution = stats.hypergeom(a + b + c + d, a + b, a + c)
+    support = numpy.arange(
+        max(0, a + b + a + c - (a + b + c + d)), min(a + b, a + c) + 1
+    )
+    mean = distribution.mean()
+    extreme = numpy.abs(support - mean) >= abs(a - mean) - 1e-9
+    return distribution.pmf(support[extreme]).sum()
+
+
+def test_monte_carlo_p_value_matches_exact():
+    p_value = monte_carlo_p_value(SPARSE, n_permutations=20_000, seed=0)
+
+    assert p_value == pytest.approx(_hypergeometric_p_value(SPARSE), abs=0.01)
+
+
+def test_monte_carlo_p_value_independent_of_batch_size():
+    small = monte_carlo_p_value(SPARSE, n_permutations=20_000, seed=1, batch_size=7)
+    large = monte_carlo_p_value(SPARSE, n_permutations=20_000, seed=2)
+
+    assert small == pytest.approx(large, abs=0.015)
+
+
+def test_small_tables_use_monte_carlo():
+    result = independence_test(pandas.DataFrame(SPARSE), seed=0)
+
+    assert result.method == MONTE_CARLO
+    assert result.min_expected < 5
+
+
+def test_large_tables_use_chi_squared():
+    table = numpy.array([[30, 20, 25], [15, 35, 20]])
+
+    result = independence_test(pandas.DataFrame(table))
+
+    statistic, p_value, dof, _ = stats.chi2_contingency(table, correction=False)
+    assert result.method == ASYMPTOTIC
+    assert (result.statistic, result.p_value, result.dof) == pytest.approx(
+        (statistic, p_value, dof)
+    )
+
+
+@pytest.fixture
+def data():
+    rng = numpy.random.default_rng(0)
+    n = 80
+    status = rng.choice(["Complete", "Partial"], n)
+    return pandas.DataFrame(
+        {
+            "status": pandas.Categorical(status),
+            "age": pandas.Categorical(
+                numpy.where(
+                    (status == "Complete") & (rng.random(n) < 0.5),
+                    "Under 25",
+                    rng.choice(["Under 25", "25-44", "45+"], n),
+                )
+            ),
+            "nation": pandas.Categorical(
+                rng.choice(["England", "Wales"], n, p=[0.9, 0.1])
+            ),
+        }
+    )
+
+
+def test_independence_tests_are_reproducible(data):
+    first = independence_tests(data, ["age", "nation"], by="status", n_jobs=1)
+    second = independence_tests(data, ["age", "nation"], by="status", n_jobs=1)
+
+    pandas.testing.assert_frame_equal(first, second)
+    assert first.set_index("question").loc["nation", "method"] == MONTE_CARLO
+
+
+def test_split_summary_matches_crosstab(data):
+    summary = single_select_frequencies(data, "age", "status")
+
+    result = split_independence(summary)
+
+    expected = crosstab_test(data, "status", "age")
+    assert result.method == expected.method == ASYMPTOTIC
+    assert result.p_value == pytest.approx(expected.p_value)
+
+
+def test_split_grid_item(data):
+    summary = grid_frequencies(data, ["age", "nation"], "status")
+
+    result = split_independence(summary, item="nation", seed=0)
+
+    assert result.method == MONTE_CARLO
+    assert result.table.to_numpy().sum() == len(data)
+    with pytest.raises(ValueError):
+        split_independence(summary)
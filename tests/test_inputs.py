@@ -0,0 +1,110 @@
+import json
+
+import boto3
+import pytest
+from moto import mock_aws
+
+from asf_installer_survey.getters.inputs import MANIFEST, sync_inputs
+
+BUCKET = "inputs-bucket"
+S3_PATH = f"s3://{BUCKET}/project/inputs"
+PART_SIZE = 1024
+CONTENTS = bytes(range(256)) * 16  # Four parts.
+
+
+class _FlakyClient:
+    # Delegates to an S3 client, counting ranged downloads and failing any
+    # of the parts in `fail`.
+
+    def __init__(self, client, fail=()):
+        self.client, self.fail, self.ranges = client, set(fail), []
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def get_object(self, **kwargs):
+        self.ranges.append(kwargs["Range"])
+        start = int(kwargs["Range"].split("=")[1].split("-")[0])
+        if start // PART_SIZE in self.fail:
+            raise ConnectionError("Interrupted.")
+        return self.client.get_object(**kwargs)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=BUCKET)
+        client.put_object(Bucket=BUCKET, Key="project/inputs/data.bin", Body=CONTENTS)
+        client.put_object(Bucket=BUCKET, Key="project/inputs/dir/small.txt", Body=b"x")
+        yield client
+
+
+def _sync(client, destination):
+    return sync_inputs(
+        S3_PATH, destination, max_workers=1, part_size=PART_SIZE, client=client
+    )
+
+
+def test_sync_downloads_and_skips_unchanged(client, tmp_path):
+    first = _sync(client, tmp_path)
+    assert sorted(first.downloaded) == ["data.bin", "dir/small.txt"]
+    assert (tmp_path / "data.bin").read_bytes() == CONTENTS
+    assert "data.bin" in json.loads((tmp_path / MANIFEST).read_text())
+
+    flaky = _FlakyClient(client)
+    second = _sync(flaky, tmp_path)
+    assert second.downloaded == []
+    assert sorted(second.skipped) == ["data.bin", "dir/small.txt"]
+    assert flaky.ranges == []
+
+
+def test_sync_redownloads_changed_files(client, tmp_path):
+    _sync(client, tmp_path)
+    client.put_object(Bucket=BUCKET, Key="project/inputs/dir/small.txt", Body=b"y")
+
+    result = _sync(client, tmp_path)
+    assert result.downloaded == ["dir/small.txt"]
+    assert (tmp_path / "dir/small.txt").read_bytes() == b"y"
+
+
+def test_sync_resumes_interrupted_transfer(client, tmp_path):
+    interrupted = _sync(_FlakyClient(client, fail={2}), tmp_path)
+    assert list(interrupted.failed) == ["data.bin"]
+    assert not (tmp_path / "data.bin").exists()
+    assert (tmp_path / "data.bin.part.json").exists()
+
+    flaky = _FlakyClient(client)
+    resumed = _sync(flaky, tmp_path)
+    assert resumed.downloaded == ["data.bin"]
+    assert flaky.ranges == ["bytes=2048-3071"]
+    assert (tmp_path / "data.bin").read_bytes() == CONTENTS
+    assert not (tmp_path / "data.bin.part.json").exists()
+
+
+def test_sync_restarts_from_unreadable_state(client, tmp_path):
+    _sync(_FlakyClient(client, fail={2}), tmp_path)
+    (tmp_path / "data.bin.part.json").write_text('{"etag": "')
+
+    result = _sync(client, tmp_path)
+    assert result.failed == {}
+    assert (tmp_path / "data.bin").read_bytes() == CONTENTS
+
+
+def test_sync_rejects_etag_mismatch(client, tmp_path):
+    _sync(_FlakyClient(client, fail={2}), tmp_path)
+    # Corrupt a part the resumed sync won't download again.
+    with open(tmp_path / "data.bin.part", "r+b") as f:
+        f.write(b"corrupt")
+
+    result = _sync(client, tmp_path)
+    assert "Checksum doesn't match" in result.failed["data.bin"]
+    assert not (tmp_path / "data.bin").exists()
+    assert not (tmp_path / "data.bin.part").exists()
+
+    retried = _sync(client, tmp_path)
+    assert retried.downloaded == ["data.bin"]
+    assert (tmp_path / "data.bin").read_bytes() == CONTENTS
@@ -0,0 +1,37 @@
+import pytest
+
+from asf_installer_survey.utils import instrumentation
+
+
+@pytest.fixture
+def metrics_file(monkeypatch, tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    monkeypatch.setattr(instrumentation, "METRICS_FILE", path)
+    monkeypatch.setattr(instrumentation, "ENABLED", True)
+    monkeypatch.delenv(instrumentation.RUN_ID_VARIABLE, raising=False)
+    return path
+
+
+def test_top_level_stages_start_new_runs(metrics_file):
+    with instrumentation.stage("first"):
+        with instrumentation.stage("nested"):
+            pass
+    with instrumentation.stage("second"):
+        pass
+
+    metrics = instrumentation.read_metrics(metrics_file).set_index("name")
+    assert metrics.loc["nested", "run_id"] == metrics.loc["first", "run_id"]
+    assert metrics.loc["second", "run_id"] != metrics.loc["first", "run_id"]
+    assert metrics.loc["nested", "parent"] == "first"
+
+
+def test_summary_covers_latest_run_only(metrics_file):
+    with instrumentation.stage("first"):
+        pass
+    with instrumentation.stage("second"):
+        pass
+
+    summary = instrumentation.summarise_metrics(
+        instrumentation.read_metrics(metrics_file)
+    )
+    assert list(summary.index) == ["second"]
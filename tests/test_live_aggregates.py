@@ -0,0 +1,115 @@
+import numpy
+import pandas
+import pytest
+
+from asf_installer_survey.pipeline.live_aggregates import AggregateState
+from asf_installer_survey.utils.lookups import QuestionNumbers as col
+
+COLUMNS = [col.q1, col.q8]
+NATIONS = numpy.array(["England", "Scotland", "Wales"], dtype=object)
+
+
+def _responses(ids, seed):
+    rng = numpy.random.default_rng(seed)
+    n = len(ids)
+    return pandas.DataFrame(
+        {
+            col.q0a: ids,
+            col.q0d: pandas.Categorical(rng.choice(["Complete", "Partial"], n)),
+            col.q1: pandas.Categorical(rng.choice(["Under 25", "25-44", "45+"], n)),
+            col.q8: [NATIONS[rng.random(3) < 0.4] for _ in range(n)],
+        }
+    )
+
+
+def _assert_same_counts(state, expected):
+    assert sorted(state.ids) == sorted(expected.ids)
+    assert dict(zip(state.statuses, state.respondents)) == dict(
+        zip(expected.statuses, expected.respondents)
+    )
+    pandas.testing.assert_frame_equal(
+        state.completeness().sort_index(axis=1),
+        expected.completeness().sort_index(axis=1),
+    )
+    pandas.testing.assert_frame_equal(
+        state.crosstab(col.q1).sort_index().sort_index(axis=1),
+        expected.crosstab(col.q1).sort_index().sort_index(axis=1),
+    )
+    pandas.testing.assert_frame_equal(
+        state.option_cooccurrence(col.q8).sort_index().sort_index(axis=1),
+        expected.option_cooccurrence(col.q8).sort_index().sort_index(axis=1),
+    )
+
+
+@pytest.fixture
+def first():
+    return _responses(numpy.arange(100), seed=0)
+
+
+def test_update_with_status_flips_matches_rebuild(first):
+    state = AggregateState.from_data(first, COLUMNS)
+
+    # Partial responses completed (with answers edited), plus new responses.
+    flipped = _responses(first.loc[first[col.q0d] == "Partial", col.q0a], seed=1)
+    flipped[col.q0d] = pandas.Categorical(["Complete"] * len(flipped))
+    new = _responses(numpy.arange(100, 150), seed=2)
+    batch = pandas.concat([flipped, new], ignore_index=True)
+    state.update(batch)
+
+    current = pandas.concat(
+        [first[~first[col.q0a].isin(flipped[col.q0a])], batch], ignore_index=True
+    )
+    _assert_same_counts(state, AggregateState.from_data(current, COLUMNS))
+    assert (
+        state.crosstab(col.q1).loc["Partial"].sum()
+        == (current[col.q0d] == "Partial").sum()
+    )
+
+
+def test_small_updates_reuse_storage(first):
+    state = AggregateState.from_data(first, COLUMNS)
+    codes = state._codes
+
+    for i in range(100, 110):
+        state.update(_responses([i], seed=i))
+
+    assert state._codes is codes
+    assert len(state.ids) == 110
+
+
+def test_remove_matches_rebuild(first):
+    state = AggregateState.from_data(first, COLUMNS)
+
+    state.remove([3, 50, 99, 1000])
+
+    remaining = first[~first[col.q0a].isin([3, 50, 99])]
+    _assert_same_counts(state, AggregateState.from_data(remaining, COLUMNS))
+    # Moved rows are still found by ID.
+    state.update(remaining.iloc[-3:].assign(**{col.q0d: "Complete"}))
+    _assert_same_counts(
+        state,
+        AggregateState.from_data(
+            pandas.concat(
+                [
+                    remaining.iloc[:-3],
+                    remaining.iloc[-3:].assign(**{col.q0d: "Complete"}),
+                ]
+            ),
+            COLUMNS,
+        ),
+    )
+
+
+def test_merge_and_reload(first, tmp_path):
+    second = _responses(numpy.arange(100, 200), seed=3)
+    state = AggregateState.from_data(first, COLUMNS)
+    other = AggregateState.from_data(second, COLUMNS)
+
+    state.merge(other)
+    state.save(tmp_path / "state")
+    loaded = AggregateState.load(tmp_path / "state")
+
+    expected = AggregateState.from_data(pandas.concat([first, second]), COLUMNS)
+    _assert_same_counts(loaded, expected)
+    with pytest.raises(ValueError):
+        loaded.merge(other)
@@ -0,0 +1,87 @@
+import numpy
+import pandas
+import pytest
+
+from asf_installer_survey.analysis.missingness import MissingnessIndex
+
+COLUMNS = [f"c{i}" for i in range(11)]
+
+
+@pytest.fixture
+def matrices():
+    rng = numpy.random.default_rng(0)
+    shown = rng.random((500, len(COLUMNS))) < 0.7
+    # Answers off route are noise that mustn't split patterns.
+    answered = rng.random((500, len(COLUMNS))) < 0.9
+    shown[:, :3] = True
+    return shown, answered
+
+
+@pytest.fixture
+def index(matrices):
+    shown, answered = matrices
+    return MissingnessIndex(
+        COLUMNS,
+        pandas.RangeIndex(100, 600),
+        numpy.packbits(shown, axis=1),
+        numpy.packbits(answered, axis=1),
+    )
+
+
+def test_pattern_counts_match_value_counts(index, matrices):
+    shown, answered = matrices
+    keys = pandas.Series(
+        [
+            (tuple(s), tuple(a & s))
+            for s, a in zip(shown.astype(int), answered.astype(int))
+        ]
+    )
+    expected = keys.value_counts()
+
+    patterns = index.patterns()
+    assert patterns["respondents"].sum() == len(shown)
+    assert sorted(patterns["respondents"]) == sorted(expected)
+    # Respondents share a pattern exactly when their keys are equal.
+    codes = pandas.Series(pandas.factorize(keys)[0])
+    assert codes.groupby(index.pattern).nunique().eq(1).all()
+    assert pandas.Series(index.pattern).groupby(codes).nunique().eq(1).all()
+    assert (index.counts[index.pattern] == keys.map(expected).to_numpy()).all()
+
+
+def test_pattern_summary(index, matrices):
+    shown, answered = matrices
+    patterns = index.patterns()
+    respondent = patterns.loc[index.pattern]
+
+    assert (respondent["shown"].to_numpy() == shown.sum(axis=1)).all()
+    assert (respondent["answered"].to_numpy() == (shown & answered).sum(axis=1)).all()
+    assert patterns["share"].sum() == pytest.approx(1)
+    assert patterns["respondents"].is_monotonic_decreasing
+
+
+def test_matches_against_brute_force(index, matrices):
+    shown, answered = matrices
+    answered = answered & shown
+    first, rest = [0, 1, 2, 3, 4], [8, 9, 10]
+
+    found = index.matches(answered=index.span("c0", "c4"), unanswered=index.after("c7"))
+    expected = (answered[:, first] == shown[:, first]).all(axis=1) & ~answered[
+        :, rest
+    ].any(axis=1)
+
+    assert found.index.equals(pandas.RangeIndex(100, 600))
+    assert (found.to_numpy() == expected).all()
+    assert 0 < expected.sum() < len(expected)
+    assert (
+        index.matches(any_answered=["c5", "c6"]).to_numpy()
+        == answered[:, [5, 6]].any(axis=1)
+    ).all()
+
+
+def test_unpacks_columns(index, matrices):
+    shown, answered = matrices
+    assert (index.answered_matrix(["c9", "c2"]) == answered[:, [9, 2]]).all()
+    assert (index.shown_matrix(COLUMNS) == shown).all()
+    assert index.covers(["c0", "c10"]) and not index.covers(["c11"])
+    with pytest.raises(ValueError):
+        index.matches(answered=["c11"])
@@ -0,0 +1,37 @@
+import numpy
+import pandas
+
+from asf_installer_survey.pipeline.report import render_section, WITHHELD
+from asf_installer_survey.utils.lookups import QuestionNumbers as col
+
+
+def _rows(markdown):
+    return [line for line in markdown.splitlines() if line.startswith("| ")]
+
+
+def test_only_disclosure_flagged_rows_are_withheld():
+    data = pandas.DataFrame(
+        {
+            col.q1: pandas.Categorical(["Under 25"] * 40 + ["45+"] * 2),
+            "group": pandas.Categorical(["A"] * 42, categories=["A", "Empty"]),
+        }
+    )
+
+    rows = _rows(render_section(data, "q1", by="group", fmt="md"))
+
+    withheld = [row for row in rows if WITHHELD in row]
+    assert withheld and all("primary" in row or "secondary" in row for row in withheld)
+    empty = [row for row in rows if row.startswith("| Empty")]
+    assert empty and not any(WITHHELD in row for row in empty)
+
+
+def test_html_withholds_counts_and_proportions():
+    data = pandas.DataFrame(
+        {col.q1: pandas.Categorical(numpy.repeat(["Under 25", "45+"], [40, 2]))}
+    )
+
+    html = render_section(data, "q1", fmt="html")
+
+    # Both answers' counts and proportions (the second secondarily).
+    assert html.count(WITHHELD) == 4
+    assert html.count("<td>42</td>") == 2
@@ -0,0 +1,66 @@
+import logging
+
+import numpy
+import pandas
+import pytest
+
+from asf_installer_survey.analysis import segmentation
+
+
+@pytest.fixture
+def data():
+    # Two clear groups of installers, with three distinct profiles in all.
+    rng = numpy.random.default_rng(0)
+    group = rng.integers(0, 2, 300)
+    group[:10] = 0
+    size = numpy.where(group == 0, "Sole trader", "Large")
+    size[:10] = "Medium"
+    return pandas.DataFrame(
+        {
+            "business": pandas.Categorical(size),
+            "region": pandas.Categorical(numpy.where(group == 0, "North", "South")),
+            "products": [["ASHP"] if g == 0 else ["ASHP", "GSHP"] for g in group],
+        }
+    )
+
+
+COLUMNS = ["business", "region", "products"]
+
+
+def test_cost_is_scored_on_given_profiles(data):
+    profiles = segmentation.encode_profiles(data, COLUMNS)
+    scored = segmentation._subset(profiles, numpy.arange(50))
+
+    model = segmentation.fit_kmodes(profiles, 2, batch_size=64, scored=scored)
+    distances = segmentation.hamming_distances(
+        scored.codes, scored.bitsets, model.codes, model.bitsets
+    )
+
+    assert model.cost == distances.min(axis=1).sum()
+
+
+def test_segments_skip_ks_above_distinct_profiles(data, caplog):
+    with caplog.at_level(logging.WARNING):
+        result = segmentation.segment_installers(
+            data, ks=[2, 3, 4, 5], columns=COLUMNS, n_restarts=2, n_jobs=1
+        )
+
+    assert result.selection["k"].tolist() == [2, 3]
+    assert "Skipping k = [4, 5]: only 3 distinct profiles." in caplog.text
+    assert set(result.segments.cat.categories) == set(range(len(result.model.codes)))
+    assert result.profiles["size"].sum() == len(data)
+    assert segmentation._shared == {"profiles": None, "scored": None}
+
+
+def test_workers_match_a_single_process(data):
+    kwargs = dict(ks=[2, 3], columns=COLUMNS, n_restarts=2, seed=1)
+    serial = segmentation.segment_installers(data, n_jobs=1, **kwargs)
+    pooled = segmentation.segment_installers(data, n_jobs=2, **kwargs)
+
+    pandas.testing.assert_frame_equal(serial.selection, pooled.selection)
+    pandas.testing.assert_series_equal(serial.segments, pooled.segments)
+
+
+def test_too_few_profiles_for_every_k_raise(data):
+    with pytest.raises(ValueError):
+        segmentation.segment_installers(data, ks=[4], columns=COLUMNS, n_jobs=1)
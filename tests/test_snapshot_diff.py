@@ -0,0 +1,52 @@
+import numpy
+import pandas
+
+from asf_installer_survey.pipeline.snapshot_diff import diff_snapshots, ID_COLUMN
+
+
+def _write(tmp_path, name, frame):
+    path = tmp_path / f"{name}.parquet"
+    frame.to_parquet(path)
+    return path
+
+
+def test_integral_floats_match_integers(tmp_path):
+    old = _write(
+        tmp_path, "old", pandas.DataFrame({ID_COLUMN: [1, 2, 3], "x": [1, 2, 3]})
+    )
+    new = _write(
+        tmp_path,
+        "new",
+        pandas.DataFrame(
+            {ID_COLUMN: [1.0, 2.0, 3.0, numpy.nan], "x": [1.0, 2.0, 4.5, 5.0]}
+        ),
+    )
+
+    diff = diff_snapshots(old, new)
+
+    assert diff.added == []
+    assert diff.removed == []
+    assert diff.changed_cells[["response_id", "column", "old", "new"]].to_dict(
+        "records"
+    ) == [{"response_id": "3", "column": "x", "old": "3", "new": "4.5"}]
+
+
+def test_categories_compared_by_value(tmp_path):
+    old = _write(
+        tmp_path,
+        "old",
+        pandas.DataFrame({ID_COLUMN: [1, 2], "y": pandas.Categorical(["a", "b"])}),
+    )
+    new = _write(
+        tmp_path,
+        "new",
+        pandas.DataFrame(
+            {ID_COLUMN: [2, 3], "y": pandas.Categorical(["c", "b"], ["c", "b"])}
+        ),
+    )
+
+    diff = diff_snapshots(old, new)
+
+    assert diff.added == [3]
+    assert diff.removed == [1]
+    assert diff.changed_cells["new"].tolist() == ["c"]
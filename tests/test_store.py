@@ -0,0 +1,109 @@
+import os
+
+import numpy
+import pandas
+import pytest
+
+from asf_installer_survey.utils import store
+
+
+@pytest.fixture
+def data():
+    return pandas.DataFrame(
+        {
+            "status": pandas.Categorical(
+                ["Complete", None, "Partial", "Complete"],
+                categories=["Partial", "Complete"],
+                ordered=True,
+            ),
+            "age": pandas.array([30, None, 45, 52], dtype="Int64"),
+            "agrees": pandas.array([True, None, False, True], dtype="boolean"),
+            "score": [0.5, numpy.nan, 1.5, 2.0],
+            "count": [1, 2, 3, 4],
+            "eligible": [True, False, True, True],
+            "name": ["a", None, "ccc", "dd"],
+            "options": [["x", "y"], None, [], ["z"]],
+            "started": pandas.to_datetime(["2024-01-02", None, "2024-03-04", None]),
+        },
+        index=pandas.Index([10, 12, 15, 17], name="respondent"),
+    )
+
+
+def _buffers(series):
+    # The memory backing a column, as NumPy arrays or Arrow buffer addresses.
+    array = series.array
+    if isinstance(array, pandas.Categorical):
+        return [array.codes]
+    if hasattr(array, "_mask"):
+        return [array._data, array._mask]
+    if hasattr(array, "_pa_array"):
+        return [
+            buffer.address
+            for chunk in array._pa_array.chunks
+            for buffer in chunk.buffers()
+            if buffer is not None
+        ]
+    return [array._ndarray]
+
+
+def test_frame_round_trip(tmp_path, data):
+    store.write_frame("sample", "key", data, root=tmp_path)
+    read = store.read_frame("sample", "key", root=tmp_path)
+
+    options = read.pop("options")
+    expected = data.drop(columns="options")
+    pandas.testing.assert_frame_equal(read, expected, check_dtype=False)
+    for column in ["status", "age", "agrees", "score", "count", "eligible"]:
+        assert read[column].dtype == data[column].dtype
+    assert [None if o is pandas.NA else list(o) for o in options] == data[
+        "options"
+    ].tolist()
+
+
+def test_frame_columns_are_shared_between_reads(tmp_path, data):
+    store.write_frame("sample", "key", data, root=tmp_path)
+    first = store.read_frame("sample", "key", root=tmp_path)
+    second = store.read_frame("sample", "key", columns=["age", "name"], root=tmp_path)
+
+    assert numpy.shares_memory(first.index.to_numpy(), second.index.to_numpy())
+    for column in data:
+        if column not in second:
+            continue
+        for a, b in zip(_buffers(first[column]), _buffers(second[column])):
+            if isinstance(a, numpy.ndarray):
+                assert numpy.shares_memory(a, b)
+                assert not a.flags.writeable
+            else:
+                assert a == b
+
+    # Categoricals are their stored codes, which workers can read directly.
+    table = store.read_table("sample", "key", root=tmp_path)
+    codes = table.column("status").chunks[0].to_numpy(zero_copy_only=True)
+    assert numpy.shares_memory(codes, first["status"].array.codes)
+
+
+def test_rewritten_entries_are_remapped(tmp_path, data):
+    store.write_frame("sample", "key", data, root=tmp_path)
+    first = store.read_frame("sample", "key", root=tmp_path)
+    store.write_frame("sample", "key", data.assign(count=0), root=tmp_path)
+    second = store.read_frame("sample", "key", root=tmp_path)
+
+    assert first["count"].tolist() == [1, 2, 3, 4]
+    assert second["count"].tolist() == [0, 0, 0, 0]
+
+
+def test_array_round_trip_is_shared(tmp_path):
+    array = numpy.arange(200_000, dtype=numpy.uint8).reshape(-1, 2)
+    store.write_array("bits", "key", array, {"options": ["a", "b"]}, root=tmp_path)
+    first, metadata = store.read_array("bits", "key", root=tmp_path)
+    second, _ = store.read_array("bits", "key", root=tmp_path)
+
+    numpy.testing.assert_array_equal(first, array)
+    assert metadata == {"options": ["a", "b"]}
+    assert numpy.shares_memory(first, second)
+
+
+def test_missing_entries_read_as_none(tmp_path):
+    assert store.read_frame("sample", "key", root=tmp_path) is None
+    assert store.read_array("bits", "key", root=tmp_path) is None
+    assert not os.path.exists(tmp_path / "sample")
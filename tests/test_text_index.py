@@ -0,0 +1,100 @@
+import numpy
+import pandas
+import pytest
+
+from asf_installer_survey.analysis.text_index import TextIndex, tokenise
+
+TEXTS = [
+    "Air source heat pump",  # 0
+    "Hybrid heat pump",  # 1
+    "Ground source heat pump",  # 2
+    "Hybrid air-source system",  # 3
+    "Gas boiler",  # 4
+    "Airflow problems",  # 5
+]
+
+
+@pytest.fixture
+def index():
+    documents = pandas.DataFrame(
+        {
+            "response_id": numpy.arange(len(TEXTS)) + 100,
+            "question": ["q1", "q1", "q2", "q2", "q1", "q2"],
+            "column": "Other",
+            "subpopulation": ["a", "b", "a", "a", "b", "a"],
+            "status": "Complete",
+            "text": TEXTS,
+        }
+    )
+    pairs = pandas.DataFrame(
+        [(term, i) for i, text in enumerate(TEXTS) for term in set(tokenise(text))],
+        columns=["term", "document"],
+    )
+    codes, terms = pandas.factorize(pairs["term"], sort=True)
+    order = numpy.lexsort((pairs["document"].to_numpy(), codes))
+    offsets = numpy.searchsorted(codes[order], numpy.arange(len(terms) + 1))
+    return TextIndex(
+        list(terms), offsets, pairs["document"].to_numpy()[order], documents
+    )
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("pump", [0, 1, 2]),
+        ("HEAT Pump", [0, 1, 2]),
+        ("air-source", [0, 3]),
+        ("air*", [0, 3, 5]),
+        ("hyb* AND air*", [3]),
+        ("unknown", []),
+        ("", []),
+    ],
+)
+def test_terms_and_prefixes(index, query, expected):
+    assert index.match(query).tolist() == expected
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        # OR binds looser than AND, explicit or implied.
+        ("gas OR hybrid pump", [1, 4]),
+        ("gas OR hybrid AND pump", [1, 4]),
+        ("(gas OR hybrid) pump", [1]),
+        # NOT binds tighter than AND.
+        ("NOT ground pump", [0, 1]),
+        ("NOT (ground pump)", [0, 1, 3, 4, 5]),
+        ("pump AND NOT NOT ground", [2]),
+        ("NOT unknown", [0, 1, 2, 3, 4, 5]),
+        ("(hybrid OR air*) AND NOT ground", [0, 1, 3, 5]),
+    ],
+)
+def test_operator_precedence(index, query, expected):
+    assert index.match(query).tolist() == expected
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["(heat OR pump", "heat OR pump)", "((heat)", "heat AND", "NOT", "OR heat", "()"],
+)
+def test_malformed_queries_raise(index, query):
+    with pytest.raises(ValueError):
+        index.match(query)
+
+
+def test_search_returns_matching_rows(index):
+    results = index.search("heat pump", questions=["q1"])
+
+    assert results.index.tolist() == [0, 1]
+    assert results["response_id"].tolist() == [100, 101]
+    assert results["text"].tolist() == TEXTS[:2]
+
+
+def test_counts_match_value_counts(index):
+    for by in ["question", "subpopulation"]:
+        pandas.testing.assert_series_equal(
+            index.counts("pump OR air*", by=by),
+            index.search("pump OR air*")[by].value_counts(),
+            check_index_type=False,
+        )
+    assert index.counts("unknown").empty
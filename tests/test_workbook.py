@@ -0,0 +1,127 @@
+import zipfile
+from xml.etree import ElementTree
+
+import numpy
+import openpyxl
+import pandas
+import pytest
+
+from asf_installer_survey.pipeline.workbook import build_workbook
+from asf_installer_survey.utils.lookups import QuestionNumbers as col
+from asf_installer_survey.utils.routing import EMPLOYEE, OWNER
+
+ODS = {
+    "office": "urn:oasis:names:tc:opendocument:xmlns:office:1.0",
+    "table": "urn:oasis:names:tc:opendocument:xmlns:table:1.0",
+    "text": "urn:oasis:names:tc:opendocument:xmlns:text:1.0",
+}
+
+
+def _ods_rows(path, name):
+    with zipfile.ZipFile(path) as archive:
+        content = ElementTree.fromstring(archive.read("content.xml"))
+    table = content.find(f".//table:table[@table:name='{name}']", ODS)
+    return [
+        [
+            (
+                "".join(cell.itertext()),
+                cell.get(f"{{{ODS['office']}}}value-type"),
+                cell.get(f"{{{ODS['office']}}}value"),
+            )
+            for cell in row.findall("table:table-cell", ODS)
+        ]
+        for row in table.findall("table:table-row", ODS)
+    ]
+
+
+@pytest.fixture
+def data():
+    rng = numpy.random.default_rng(0)
+    n = 60
+    return pandas.DataFrame(
+        {
+            # "45+" is withheld for disclosure control.
+            col.q1: pandas.Categorical(
+                numpy.repeat(["Under 25", "25-44", "45+"], [40, 18, 2])
+            ),
+            col.q4: pandas.Categorical(rng.choice(["Under 1 year", "1-5 years"], n)),
+            col.q5: pandas.Categorical(rng.choice([EMPLOYEE, OWNER], n)),
+            col.q6a: pandas.Categorical(
+                rng.choice(["I’m a sole trader", "I own a company"], n)
+            ),
+        }
+    )
+
+
+def test_build_workbook_xlsx(data, tmp_path):
+    path = build_workbook(data, tmp_path / "tables.xlsx", n_jobs=1)
+
+    workbook = openpyxl.load_workbook(path)
+    assert workbook.sheetnames == ["Contents", "q1", "q4", "q5", "q6a"]
+    assert workbook["Contents"]["A5"].hyperlink.location == "'q1'!A1"
+
+
+def test_build_workbook_xlsx_cells(data, tmp_path):
+    path = build_workbook(data, tmp_path / "tables.xlsx", splits=[], n_jobs=1)
+
+    rows = list(openpyxl.load_workbook(path)["q1"].iter_rows())
+    header = next(row for row in rows if row and row[0].value == "Group")
+    columns = {cell.value: i for i, cell in enumerate(header)}
+    table = {
+        row[columns["Answer"]].value: row
+        for row in rows[rows.index(header) + 1 :]
+        if row[0].value == "All"
+    }
+
+    published = table["Under 25"]
+    assert published[columns["Count"]].value == 40
+    assert published[columns["Count"]].number_format == "#,##0"
+    assert published[columns["Proportion"]].value == pytest.approx(40 / 60)
+    assert published[columns["Proportion"]].number_format == "0.0%"
+    assert published[columns["Respondents"]].value == 60
+    assert published[columns["Disclosure"]].value is None
+
+    withheld = table["45+"]
+    assert withheld[columns["Count"]].value == "[c]"
+    assert withheld[columns["Proportion"]].value == "[c]"
+    assert withheld[columns["Disclosure"]].value == "primary"
+    assert table["25-44"][columns["Disclosure"]].value == "secondary"
+
+
+def test_build_workbook_split_by_question(data, tmp_path):
+    path = build_workbook(data, tmp_path / "tables.xlsx", splits=[col.q5], n_jobs=1)
+
+    values = [
+        cell.value
+        for row in openpyxl.load_workbook(path)["q5"].iter_rows()
+        for cell in row
+    ]
+    assert f"Answers, by {col.q5}" in values
+
+
+def test_build_workbook_ods(data, tmp_path):
+    path = build_workbook(data, tmp_path / "tables.ods", n_jobs=1)
+
+    with zipfile.ZipFile(path) as archive:
+        assert archive.namelist()[0] == "mimetype"
+    rows = _ods_rows(path, "q1")
+    header = next(row for row in rows if row and row[0][0] == "Group")
+    columns = {text: i for i, (text, _, _) in enumerate(header)}
+    table = {
+        row[columns["Answer"]][0]: row
+        for row in rows[rows.index(header) + 1 :]
+        if row and row[0][0] == "All"
+    }
+
+    assert table["Under 25"][columns["Count"]] == ("40", "float", "40.0")
+    text, value_type, value = table["Under 25"][columns["Proportion"]]
+    assert (text, value_type) == ("66.7%", "percentage")
+    assert float(value) == pytest.approx(40 / 60)
+    assert table["45+"][columns["Count"]] == ("[c]", "string", None)
+    assert table["45+"][columns["Disclosure"]][0] == "primary"
+    assert _ods_rows(path, "Contents")[4][0][0] == "q1"
+
+
+def test_build_workbook_rejects_unknown_format(data, tmp_path):
+    with pytest.raises(ValueError):
+        build_workbook(data, tmp_path / "tables.csv")